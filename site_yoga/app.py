@@ -1,16 +1,127 @@
-import openai
-from flask import Flask, render_template, request, redirect, url_for, session, flash, jsonify
-import psycopg2
+import io
+import os
+import time
+
+from flask import Flask, render_template, request, redirect, url_for, session, flash, jsonify, abort, \
+    stream_template, Response
+from werkzeug.middleware.proxy_fix import ProxyFix
+
 from db import add_client_account, get_client_by_phone, check_phone_exists, update_password, get_employees, \
-    add_employee, del_employee, get_clients, get_client_attendance, \
+    add_employee, del_employee, get_clients, \
     add_client, change_client, del_client, get_price_list, add_price_list, update_ticket_price, get_all_ticket_types, \
-    get_schedule, add_schedule, update_free_spots, book_schedule_spot, get_filtered_schedule, client_exists
+    get_schedule, add_schedule, update_free_spots, book_schedule_spots, client_exists, \
+    BOOKED, ALREADY_BOOKED, NO_SPOTS
+import assets
+import auth
+import bulk
+import cache
+import chat
+import conflicts
+import db
+import fragments
+import httpcache
+import listener
+import live
+import metrics
+import migrate
+import replicas
+import schedule_index
+import sessions
+import startup
+import waitlist
 from forms import ClientRegisterForm, EmployeeForm, EmployeeFormChanges, ClientForm, ClientFormChanges, ScheduleForm, \
     LoginForm, PriceForm
-from werkzeug.security import generate_password_hash, check_password_hash
 
-app = Flask(__name__)
-app.config['SECRET_KEY'] = '7f1b9a9e43b0df63d3a77e96b0297d3d4f55a2ea36e9f2bfae4e4db0e0b81e2c'
+# Маршруты собираются при импорте модуля, а к приложению подключаются в create_app
+_routes = []
+_context_processors = []
+
+
+def route(rule, **options):
+    """Как app.route, но маршрут регистрируется в приложении из create_app."""
+    def decorator(view):
+        _routes.append((rule, view, options))
+        return view
+    return decorator
+
+
+def context_processor(func):
+    _context_processors.append(func)
+    return func
+
+
+def create_app(config=None):
+    """Создаёт приложение; config дополняет и переопределяет настройки по умолчанию.
+
+    При DEFER_BACKGROUND = True фоновые потоки не запускаются: так делает
+    gunicorn --preload, где их запускает хук post_fork (см. gunicorn.conf.py).
+    """
+    app = Flask(__name__)
+    app.config['SECRET_KEY'] = '7f1b9a9e43b0df63d3a77e96b0297d3d4f55a2ea36e9f2bfae4e4db0e0b81e2c'
+    # Размер пула соединений с БД, остальные параметры см. DB_POOL_CONFIG в db.py
+    app.config['DB_POOL'] = {'min_size': 2, 'max_size': 20}
+    app.config['DEFER_BACKGROUND'] = os.environ.get('YOGA_DEFER_BACKGROUND') == '1'
+    # Сколько прокси (nginx) стоит перед приложением; 0 — X-Forwarded-For не читать.
+    # Без этого request.remote_addr — адрес nginx, и лимиты по IP общие на всех
+    app.config['PROXY_HOPS'] = int(os.environ.get('YOGA_PROXY_HOPS', 1))
+    app.config.update(config or {})
+    if app.config['PROXY_HOPS']:
+        app.wsgi_app = ProxyFix(app.wsgi_app, x_for=app.config['PROXY_HOPS'])
+
+    metrics.init_app(app)
+    assets.init_app(app)
+    db.init_app(app)
+    replicas.init_app(app)
+    sessions.init_app(app)
+    auth.init_app(app)
+    bulk.init_app(app)
+    chat.init_app(app)
+    waitlist.init_app(app)
+    httpcache.init_app(app)
+    fragments.init_app(app)
+    schedule_index.init_app(app)
+    live.init_app(app)
+    startup.init_app(app)
+    migrate.init_app(app)
+
+    for rule, view, options in _routes:
+        app.add_url_rule(rule, view_func=view, **options)
+    for func in _context_processors:
+        app.context_processor(func)
+
+    if not app.config['DEFER_BACKGROUND']:
+        start_background(app)
+    return app
+
+
+def start_background(app):
+    """Фоновые потоки воркера: слушатель NOTIFY, лист ожидания, чистка сессий, проверка реплик, метрики.
+
+    Потоки не переживают fork, поэтому при --preload функция вызывается
+    уже в воркере; пул соединений мастера там не используется.
+    """
+    db.reset_after_fork()
+    if app.config['CACHE_LISTEN']:
+        listener.start(db.DB_CONFIG)
+    if waitlist.WAITLIST_CONFIG['enabled']:
+        waitlist.start()
+    sessions.start()
+    replicas.start()
+    metrics.start()
+
+
+_app = None
+
+
+def __getattr__(name):
+    # gunicorn app:app, flask run и bench.load берут готовое приложение по имени
+    global _app
+    if name != 'app':
+        raise AttributeError("module %r has no attribute %r" % (__name__, name))
+    if _app is None:
+        _app = create_app()
+    return _app
+
 
 ADMIN_CREDENTIALS = {
     'admin': "admin_password"
@@ -18,7 +129,7 @@ ADMIN_CREDENTIALS = {
 
 
 # 🌟 Регистрация для клиента
-@app.route('/register_client', methods=['GET', 'POST'])
+@route('/register_client', methods=['GET', 'POST'])
 def register_client_route():
     form = ClientRegisterForm()
 
@@ -27,8 +138,17 @@ def register_client_route():
         phone = form.phone.data
         password = form.password.data
 
-        # Вызываем функцию из модуля работы с БД
-        add_client_account(full_name, phone, password)
+        try:
+            auth.check_rate(ip=request.remote_addr, phone=phone)
+            # Вызываем функцию из модуля работы с БД
+            add_client_account(full_name, phone, password)
+        except auth.RateLimited:
+            flash("Слишком много попыток, попробуйте позже.", "danger")
+            return render_template('register_client.html', form=form), 429
+        except auth.HashQueueFull:  # и HashTimeout
+            flash("Сервер перегружен, попробуйте через минуту.", "danger")
+            return render_template('register_client.html', form=form), 503, \
+                {'Retry-After': str(auth.HASH_CONFIG['retry_after'])}
 
         flash("Регистрация прошла успешно!", "success")
         return redirect(url_for('login'))  # или куда хочешь отправить после
@@ -41,26 +161,30 @@ def is_authenticated():
     return session.get('logged_in') == True
 
 
+# От чего, кроме данных, зависит страница: ETag разный для гостя, клиента и админа
+def auth_state():
+    return is_authenticated(), session.get('user_type'), session.get('is_admin')
+
+
 # Контекстный процессор для передачи is_authenticated в шаблоны
-@app.context_processor
+@context_processor
 def inject_is_authenticated():
     return dict(is_authenticated=is_authenticated)
 
 
 # 🌟 Маршрут для главной страницы
-@app.route('/')
+@route('/')
+@httpcache.conditional('employees', 'price_list', 'schedule', vary=auth_state)
 def index():
     if not is_authenticated():
         return redirect(url_for('login'))
 
-    emploees = get_employees()
-    price_list = get_price_list()
-    schedule = get_schedule()
-    return render_template('index.html', emploees=emploees, price_list=price_list, schedule=schedule)
+    # Шаблон вызывает функции сам, внутри {% cache %}: при попадании запросов нет
+    return render_template('index.html', emploees=get_employees, price_list=get_price_list, schedule=get_schedule)
 
 
 # 🌟 Восстановление пароля
-@app.route('/forgot_password', methods=['GET', 'POST'])
+@route('/forgot_password', methods=['GET', 'POST'])
 def forgot_password():
     if request.method == 'POST':
         phone = request.form.get('phone')
@@ -71,16 +195,24 @@ def forgot_password():
 
 
 # 🌟 Вход в учетную запись
-@app.route('/login', methods=['GET', 'POST'])
+@route('/login', methods=['GET', 'POST'])
 def login():
     form = LoginForm()
     if form.validate_on_submit():
         username = form.username.data
         password = form.password.data
 
+        try:
+            auth.check_rate(ip=request.remote_addr, phone=username)
+        except auth.RateLimited:
+            flash("Слишком много попыток входа, попробуйте позже.", "danger")
+            return render_template('login.html', form=form), 429
+
         # Админ
         if username in ADMIN_CREDENTIALS:
             if password == ADMIN_CREDENTIALS[username]:
+                # Новый id сессии при входе: старый мог быть известен кому-то ещё
+                session.clear()
                 session['logged_in'] = True
                 session['is_admin'] = True
                 flash("Вход выполнен как администратор!", "success")
@@ -90,11 +222,18 @@ def login():
 
         # Клиент
         user = get_client_by_phone(username)
-        if user and check_password_hash(user[2], password):
+        try:
+            password_ok = user is not None and auth.verify_password(user.password, password)
+        except auth.HashQueueFull:  # и HashTimeout
+            flash("Сервер перегружен, попробуйте через минуту.", "danger")
+            return render_template('login.html', form=form), 503, {'Retry-After': str(auth.HASH_CONFIG['retry_after'])}
+        if password_ok:
+            auth.limiters['phone'].reset(username)
+            session.clear()
             session['logged_in'] = True
             session['user_type'] = 'client'
-            session['client_id'] = user[0]
-            session['client_name'] = user[1]
+            session['client_id'] = user.id
+            session['client_name'] = user.full_name
             flash("Вы вошли как клиент!", "success")
             return redirect(url_for('client_dashboard'))
 
@@ -104,7 +243,7 @@ def login():
 
 
 # 🌟 Главная для админа
-@app.route('/admin')
+@route('/admin')
 def admin_dashboard():
     if session.get('user_type') != 'admin':
         return redirect(url_for('login'))
@@ -112,75 +251,212 @@ def admin_dashboard():
 
 
 # 🌟 Главная для клиентов
-@app.route('/studia')
+@route('/studia')
 def client_dashboard():
     if session.get('user_type') != 'client':
         return redirect(url_for('login'))
 
     client_id = session.get('client_id')
 
-    attended_classes = get_client_attendance(client_id)
+    # Сводка — из агрегатов, история — постранично
+    after, limit = _page_args(db.HISTORY_PAGE_KEY)
+    attended_classes, next_key = db.get_client_history_page(client_id, after, limit)
 
     return render_template(
         'client_dashboard.html',
         name=session.get('client_name'),
-        attended_classes=attended_classes
+        stats=db.get_client_dashboard(client_id),
+        attended_classes=attended_classes,
+        next_cursor=db.encode_cursor(next_key)
     )
 
 
+# 🌟 API: история посещений клиента
+@route('/api/attendance')
+def api_attendance():
+    if session.get('user_type') != 'client':
+        abort(401)
+
+    after, limit = _page_args(db.HISTORY_PAGE_KEY)
+    rows, next_key = db.get_client_history_page(session.get('client_id'), after, limit)
+    return jsonify({
+        "items": [
+            dict(row._asdict(), date_class=str(row.date_class), start_time=str(row.start_time))
+            for row in rows
+        ],
+        "next": db.encode_cursor(next_key),
+    })
+
+
 # 🌟 О студии
-@app.route('/studio')
+@route('/studio')
+@httpcache.conditional(cache_control='public, max-age=300')
 def studio_about():
     return render_template('studio_about.html')
 
 
 # 🌟 Тренеры для клиентов
-@app.route('/client_trainers')
+@route('/client_trainers')
+@httpcache.conditional('employees', vary=auth_state)
 def client_trainers():
     if session.get('user_type') != 'client':
         return redirect(url_for('login'))
 
-    employees = get_employees()
-    return render_template('client_trainers.html', employees=employees)
+    return render_template('client_trainers.html', employees=get_employees)
 
 
 # 🌟 Расписание для клиентов
-@app.route('/client_schedule', methods=['GET', 'POST'])
+@route('/client_schedule', methods=['GET', 'POST'])
 def client_schedule():
     if session.get('user_type') != 'client':
         return redirect(url_for('login'))
 
     if request.method == 'POST':
-        schedule_id = request.form.get('schedule_id')
-
-        if schedule_id:
-            success = book_schedule_spot(schedule_id)
-            if success:
+        # Можно отправить несколько schedule_id и записаться на все занятия сразу
+        schedule_ids = [sid for sid in request.form.getlist('schedule_id') if sid.isdigit()]
+
+        if schedule_ids:
+            results = book_schedule_spots(session.get('client_id'), schedule_ids)
+            booked = sum(1 for status in results.values() if status == BOOKED)
+            already = sum(1 for status in results.values() if status == ALREADY_BOOKED)
+            full = [sid for sid, status in results.items() if status == NO_SPOTS]
+            if booked:
                 flash("Вы успешно записались на занятие!", "success")
-            else:
-                flash("К сожалению, свободных мест больше нет.", "danger")
+            if already:
+                flash("Вы уже записаны на это занятие.", "info")
+            if full:
+                # Вместо повторных попыток клиент встаёт в очередь и получит место, когда оно освободится
+                positions = db.enqueue_waitlist(session.get('client_id'), full)
+                queued = [positions[sid] for sid in full if sid in positions]
+                if queued:
+                    flash("Свободных мест нет, вы в листе ожидания: место в очереди %s." %
+                          ', '.join(map(str, queued)), "warning")
+                else:
+                    flash("К сожалению, свободных мест больше нет.", "danger")
+        return redirect(url_for('client_schedule', **request.args.to_dict(flat=False)))
+
+    try:
+        filters = schedule_index.parse_filters(request.args)
+    except ValueError:
+        flash("Время укажите в формате ЧЧ:ММ.", "danger")
         return redirect(url_for('client_schedule'))
+    # На фильтры отвечает индекс в памяти; снимок один на весь рендер
+    snapshot = schedule_index.index.snapshot()
+    positions = db.get_waitlist_positions(session.get('client_id'))
+    return render_template(
+        'client_schedule.html',
+        schedule=lambda: snapshot.query(**filters),
+        fragment_key='client_schedule:' + schedule_index.filters_key(filters),
+        snapshot_key=snapshot.content_key(),
+        filters=filters,
+        options=snapshot.options(),
+        waitlist=positions,
+        live_sse=live.LIVE_CONFIG['sse'],
+        poll_seconds=live.LIVE_CONFIG['poll_seconds'],
+    )
 
-    schedule = get_schedule()
-    return render_template('client_schedule.html', schedule=schedule)
 
+# 🌟 Отмена записи на занятие
+@route('/client_schedule/cancel', methods=['POST'])
+def cancel_registration():
+    if session.get('user_type') != 'client':
+        return redirect(url_for('login'))
 
-def client_schedule():
-    day_filter = request.args.get('day')  # получаем день недели из формы
-    schedule = get_filtered_schedule(day_filter)
-    return render_template('client_schedule.html', schedule=schedule, selected_day=day_filter)
+    schedule_id = request.form.get('schedule_id', type=int)
+    date_class = request.form.get('date_class')
+    if schedule_id and date_class and db.cancel_registration(session.get('client_id'), schedule_id, date_class):
+        flash("Запись отменена.", "info")
+    else:
+        flash("Запись не найдена.", "danger")
+    return redirect(url_for('client_dashboard'))
+
+
+# 🌟 Выход из листа ожидания
+@route('/client_schedule/leave_waitlist', methods=['POST'])
+def leave_waitlist():
+    if session.get('user_type') != 'client':
+        return redirect(url_for('login'))
+
+    schedule_id = request.form.get('schedule_id', type=int)
+    if schedule_id and db.leave_waitlist(session.get('client_id'), schedule_id):
+        flash("Вы вышли из листа ожидания.", "info")
+    return redirect(url_for('client_schedule'))
+
+
+# 🌟 Места клиента в очередях (для опроса со страницы)
+@route('/api/waitlist')
+def api_waitlist():
+    if session.get('user_type') != 'client':
+        abort(401)
+
+    positions = db.get_waitlist_positions(session.get('client_id'))
+    return jsonify({str(schedule_id): position for schedule_id, position in positions.items()})
+
+
+# 🌟 Свободные места для опроса со страницы (без SSE)
+@route('/client_schedule/spots')
+def client_schedule_spots():
+    if session.get('user_type') != 'client':
+        abort(401)
+
+    # Отпечаток снимка одинаков во всех воркерах, так что неизменившиеся места — 304
+    snapshot = schedule_index.index.snapshot()
+    etag = snapshot.content_key()
+    if etag in request.if_none_match:
+        response = Response(status=304)
+    else:
+        response = jsonify({str(row.id): row.free_spots for row in snapshot.rows})
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response
+
+
+# 🌟 Живые обновления свободных мест (Server-Sent Events)
+@route('/client_schedule/stream')
+def client_schedule_stream():
+    if session.get('user_type') != 'client':
+        abort(401)
+    if not live.LIVE_CONFIG['sse']:
+        # Поток в WSGI занял бы поток воркера; 204 — EventSource не переподключается
+        return Response(status=204)
+
+    return Response(live.hub.stream(), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no',  # nginx не должен буферизовать поток
+    })
 
 
 # 🌟 Выход из учетной записи
-@app.route('/logout')
+@route('/logout')
 def logout():
-    session.pop('logged_in', None)
+    session.clear()
     flash("Вы вышли из аккаунта.", "info")
     return redirect(url_for('login'))
 
 
+# 🌟 Выход на всех устройствах
+@route('/logout_all', methods=['POST'])
+def logout_all():
+    if session.get('user_type') != 'client':
+        return redirect(url_for('login'))
+
+    sessions.revoke_client(session.get('client_id'))
+    session.clear()
+    flash("Вы вышли из аккаунта на всех устройствах.", "info")
+    return redirect(url_for('login'))
+
+
+# 🌟 Завершение всех сессий клиента (администратор)
+@route('/clients/<int:client_id>/revoke_sessions', methods=['POST'])
+def revoke_client_sessions(client_id):
+    if not session.get('is_admin'):
+        abort(403)
+
+    return jsonify({'client_id': client_id, 'revoked': sessions.revoke_client(client_id)})
+
+
 # 🌟 Раздел тренеров
-@app.route('/emploees')
+@route('/emploees')
 def emploees():
     if not is_authenticated():
         return redirect(url_for('login'))
@@ -189,18 +465,52 @@ def emploees():
     return render_template('emploees.html', employees=employees)
 
 
+def _page_args(key):
+    """Читает ?after=&limit= для постраничного вывода, 400 на испорченный курсор."""
+    try:
+        after = db.decode_cursor(request.args.get('after'), key)
+    except ValueError:
+        abort(400)
+    return after, request.args.get('limit', type=int)
+
+
 # 🌟 Раздел клиентов
-@app.route('/clients')
+@route('/clients')
 def clients():
     if not is_authenticated():
         return redirect(url_for('login'))
 
-    clients = get_clients()
-    return render_template('clients.html', clients=clients)
+    after, limit = _page_args(db.CLIENTS_PAGE_KEY)
+    clients, next_key = db.get_clients_page(after, limit)
+    return render_template('clients.html', clients=clients, next_cursor=db.encode_cursor(next_key))
+
+
+# 🌟 Все клиенты одним списком (строки идут потоком из серверного курсора)
+@route('/clients/all')
+def clients_all():
+    if not is_authenticated():
+        return redirect(url_for('login'))
+
+    return stream_template('clients.html', clients=db.iter_clients(), next_cursor=None)
+
+
+# 🌟 API: страница клиентов
+@route('/api/clients')
+def api_clients():
+    if not is_authenticated():
+        abort(401)
+
+    after, limit = _page_args(db.CLIENTS_PAGE_KEY)
+    clients, next_key = db.get_clients_page(after, limit)
+    return jsonify({
+        "items": [client._asdict() for client in clients],
+        "next": db.encode_cursor(next_key),
+    })
 
 
 # 🌟 Раздел цен
-@app.route('/prices')
+@route('/prices')
+@httpcache.conditional('price_list', vary=auth_state)
 def prices():
     if not is_authenticated():
         return redirect(url_for('login'))
@@ -210,17 +520,69 @@ def prices():
 
 
 # 🌟 Раздел расписания
-@app.route('/schedule')
+@route('/schedule')
+@httpcache.conditional('schedule', vary=auth_state)
 def schedule():
     if not is_authenticated():
         return redirect(url_for('login'))
 
-    schedule = get_schedule()
-    return render_template('schedule.html', schedule=schedule)
+    after, limit = _page_args(db.SCHEDULE_PAGE_KEY)
+    schedule, next_key = db.get_schedule_page(after, limit)
+    return render_template('schedule.html', schedule=schedule, next_cursor=db.encode_cursor(next_key))
+
+
+# 🌟 Всё расписание одним списком (потоком)
+@route('/schedule/all')
+def schedule_all():
+    if not is_authenticated():
+        return redirect(url_for('login'))
+
+    return stream_template('schedule.html', schedule=db.iter_schedule(), next_cursor=None)
+
+
+# 🌟 API: страница расписания
+@route('/api/schedule')
+def api_schedule():
+    if not is_authenticated():
+        abort(401)
+
+    after, limit = _page_args(db.SCHEDULE_PAGE_KEY)
+    schedule, next_key = db.get_schedule_page(after, limit)
+    return jsonify({
+        "items": [
+            dict(sch._asdict(), start_time=str(sch.start_time))
+            for sch in schedule
+        ],
+        "next": db.encode_cursor(next_key),
+    })
+
+
+# 🌟 API: расписание по фильтрам (индекс в памяти, без запросов к БД)
+@route('/api/schedule/search')
+def api_schedule_search():
+    if not is_authenticated():
+        abort(401)
+
+    try:
+        filters = schedule_index.parse_filters(request.args)
+    except ValueError:
+        abort(400)
+    started = time.perf_counter()
+    snapshot = schedule_index.index.snapshot()
+    schedule = snapshot.query(limit=request.args.get('limit', type=int), **filters)
+    took = time.perf_counter() - started
+    return jsonify({
+        "items": [
+            dict(sch._asdict(), start_time=str(sch.start_time))
+            for sch in schedule
+        ],
+        "count": snapshot.count(**filters),
+        "took_us": round(took * 1e6, 1),
+    })
 
 
 # 🌟 Добавление тренера
-@app.route('/add_employee', methods=['GET', 'POST'])
+@route('/add_employee', methods=['GET', 'POST'])
 def add_employee_route():
     if not is_authenticated():
         return redirect(url_for('login'))
@@ -239,7 +601,7 @@ def add_employee_route():
 
 
 # 🌟 Удаление тренера
-@app.route('/del_employee', methods=['GET', 'POST'])
+@route('/del_employee', methods=['GET', 'POST'])
 def del_employee_route():
     if not is_authenticated():
         return redirect(url_for('login'))
@@ -258,29 +620,29 @@ def del_employee_route():
 
 
 # 🌟 Поиск тренера
-@app.route('/search_employees')
+@route('/search_employees')
 def search_employees():
     query = request.args.get('q', '').strip().lower()
     if not query:
         return jsonify([])
 
-    employees = get_employees()
+    employees = db.search_employees(query, request.args.get('limit', type=int))
     filtered_employees = [
         {
-            "full_name": employee[1],
-            "phone": employee[2],
-            "specialization": employee[3],
-            "passport": employee[4],
-            "birthday": employee[5]
+            "full_name": employee[0],
+            "phone": employee[1],
+            "specialization": employee[2],
+            "passport": employee[3],
+            "birthday": employee[4]
         }
-        for employee in employees if query in employee[1].lower()
+        for employee in employees
     ]
 
     return jsonify(filtered_employees)
 
 
 # 🌟 Добавление данных в прайс-лист
-@app.route('/add_price_list', methods=['GET', 'POST'])
+@route('/add_price_list', methods=['GET', 'POST'])
 def add_price_list_route():
     if not is_authenticated():
         return redirect(url_for('login'))
@@ -294,7 +656,7 @@ def add_price_list_route():
     return render_template('add_prices.html', form=form)
 
 
-@app.route('/update_price_list', methods=['GET', 'POST'])
+@route('/update_price_list', methods=['GET', 'POST'])
 def update_price_list_route():
     if not is_authenticated():
         return redirect(url_for('login'))
@@ -314,7 +676,7 @@ def update_price_list_route():
 
 
 # 🌟 Добавление клиента
-@app.route('/add_client', methods=['GET', 'POST'])
+@route('/add_client', methods=['GET', 'POST'])
 def add_client_route():
     if not is_authenticated():
         return redirect(url_for('login'))
@@ -334,7 +696,7 @@ def add_client_route():
 
 
 # 🌟 Удаление клиента
-@app.route('/del_client', methods=['GET', 'POST'])
+@route('/del_client', methods=['GET', 'POST'])
 def del_client_route():
     if not is_authenticated():
         return redirect(url_for('login'))
@@ -350,7 +712,7 @@ def del_client_route():
 
 
 # 🌟 Изменение данных клиента
-@app.route('/del_client', methods=['GET', 'POST'])
+@route('/del_client', methods=['GET', 'POST'])
 def chande_client_route():
     if not is_authenticated():
         return redirect(url_for('login'))
@@ -366,40 +728,69 @@ def chande_client_route():
 
 
 # 🌟 Поиск клиента
-@app.route('/search_clients')
+@route('/search_clients')
 def search_clients():
     query = request.args.get('q', '').strip().lower()
     if not query:
         return jsonify([])
 
-    clients = get_clients()  # [(id, full_name, phone), (id, full_name, phone), ...]
+    clients = db.search_clients(query, request.args.get('limit', type=int))  # [(full_name, phone), ...]
     filtered_clients = [
-        {"full_name": client[1], "phone": client[2]}
-        for client in clients if query in client[1].lower()
+        {"full_name": client[0], "phone": client[1]}
+        for client in clients
     ]
 
     return jsonify(filtered_clients)
 
 
 # 🌟 Добавление занятия
-@app.route('/add_schedule', methods=['GET', 'POST'])
+@route('/add_schedule', methods=['GET', 'POST'])
 def add_schedule_route():
     if not is_authenticated():
         return redirect(url_for('login'))
 
     form = ScheduleForm()
     if form.validate_on_submit():
-        add_schedule(
-            form.day_of_week.data, form.start_time.data, form.duration.data,
-            form.specialization.data, form.instructor_name.data, form.free_spots.data
-        )
+        try:
+            add_schedule(
+                form.day_of_week.data, form.start_time.data, form.duration.data,
+                form.specialization.data, form.instructor_name.data, form.free_spots.data
+            )
+        except conflicts.ScheduleConflict as conflict:
+            form.start_time.errors.append("У тренера в это время уже есть занятие: "
+                                          + "; ".join(conflict.errors[1]))
+            return render_template('add_schedule.html', form=form)
         flash("Занятие добавлено!", "success")
         return redirect(url_for('schedule'))
     return render_template('add_schedule.html', form=form)
 
 
+# 🌟 Все пересечения занятий в текущем расписании
+@route('/schedule/conflicts')
+def schedule_conflicts():
+    if not session.get('is_admin'):
+        abort(403)
+
+    started = time.perf_counter()
+    found = conflicts.find_all()
+    took = time.perf_counter() - started
+    return jsonify({
+        "conflicts": [
+            {
+                "by": key,
+                "value": value,
+                "classes": [dict(sch._asdict(), start_time=str(sch.start_time)) for sch in (first, second)],
+                "overlap_minutes": minutes,
+            }
+            for key, value, first, second, minutes in found
+        ],
+        "count": len(found),
+        "took_ms": round(took * 1000, 2),
+    })
+
+
 # 🌟 Обновление свободных мест
-@app.route('/update_free_spots/<int:schedule_id>', methods=['POST'])
+@route('/update_free_spots/<int:schedule_id>', methods=['POST'])
 def update_free_spots_route(schedule_id):
     if not is_authenticated():
         return redirect(url_for('login'))
@@ -410,5 +801,70 @@ def update_free_spots_route(schedule_id):
     return redirect(url_for('schedule'))
 
 
+# 🌟 Массовый импорт: CSV/JSON-файл в поле file или JSON в теле запроса
+@route('/import/<kind>', methods=['POST'])
+def bulk_import(kind):
+    if not session.get('is_admin'):
+        abort(403)
+    if kind not in bulk.SPECS:
+        abort(404)
+
+    upload = request.files.get('file')
+    try:
+        if upload is not None:
+            fmt = 'json' if upload.filename.endswith(('.json', '.jsonl')) else 'csv'
+            rows = bulk.read_rows(io.TextIOWrapper(upload.stream, encoding='utf-8', newline=''), fmt)
+        else:
+            rows = request.get_json(silent=False)
+    except (ValueError, UnicodeError):
+        return jsonify({"error": "Не удалось прочитать файл"}), 400
+    if not isinstance(rows, list):
+        return jsonify({"error": "Ожидался список строк"}), 400
+
+    report = bulk.import_rows(kind, rows)
+    return jsonify(report), (422 if report['errors'] else 200)
+
+
+# 🌟 Массовая выгрузка потоком через COPY TO
+@route('/export/<kind>.<fmt>')
+def bulk_export(kind, fmt):
+    if not session.get('is_admin'):
+        abort(403)
+    if kind not in bulk.SPECS or fmt not in bulk.FORMATS:
+        abort(404)
+
+    mimetype = 'text/csv' if fmt == 'csv' else 'application/x-ndjson'
+    return Response(bulk.stream_export(kind, fmt), mimetype=mimetype, headers={
+        'Content-Disposition': 'attachment; filename=%s.%s' % (kind, 'csv' if fmt == 'csv' else 'jsonl'),
+    })
+
+
+# 🌟 Метрики в формате Prometheus
+@route('/metrics')
+def metrics_route():
+    if not metrics.allowed(request.remote_addr, request.headers.get('Authorization')):
+        abort(403)
+
+    return Response(metrics.render_metrics(), mimetype='text/plain; version=0.0.4')
+
+
+# 🌟 Статистика кэша справочных данных
+@route('/cache_stats')
+def cache_stats():
+    if not session.get('is_admin'):
+        abort(403)
+
+    return jsonify(dict(cache.stats(), fragments=fragments.stats()))
+
+
+# 🌟 Очередь хеширования паролей
+@route('/hash_stats')
+def hash_stats():
+    if not session.get('is_admin'):
+        abort(403)
+
+    return jsonify(auth.hash_stats())
+
+
 if __name__ == '__main__':
-    app.run(debug=True)
+    create_app().run(debug=True)
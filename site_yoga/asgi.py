@@ -0,0 +1,222 @@
+"""Режим ASGI: долгие соединения и чтения API на asyncio, остальное — то же приложение Flask.
+
+    uvicorn asgi:app --workers 4 --port 5000
+
+Потоки событий (/client_schedule/stream, POST /chat) и JSON-чтения
+(/api/schedule, /api/waitlist) обслуживаются корутинами: открытое
+соединение стоит корутины и буферов, а не потока воркера. Запросы к БД
+идут через асинхронный пул psycopg 3 (db.get_async_connection) и
+асинхронные двойники функций db.py с теми же запросами Query.
+
+Все остальные маршруты передаются приложению Flask через
+asgiref.wsgi.WsgiToAsgi и выполняются в пуле потоков, как в WSGI. Сессии,
+кэши, слушатель NOTIFY и фоновые потоки — общие для обеих частей.
+WSGI-режим (gunicorn.conf.py) от этого модуля не зависит и не меняется.
+
+Нужны пакеты psycopg[binary], psycopg_pool, asgiref и ASGI-сервер (uvicorn).
+С несколькими воркерами задайте YOGA_METRICS_DIR, чтобы /metrics отдавал
+сумму по всем (metrics.py).
+"""
+import asyncio
+import json
+import logging
+from http.cookies import CookieError, SimpleCookie
+from urllib.parse import parse_qs
+
+from asgiref.wsgi import WsgiToAsgi
+
+import app as yoga
+import chat
+import db
+import live
+import sessions
+
+logger = logging.getLogger(__name__)
+
+SSE_HEADERS = [
+    (b'content-type', b'text/event-stream; charset=utf-8'),
+    (b'cache-control', b'no-cache'),
+    (b'x-accel-buffering', b'no'),
+]
+
+_async_routes = {}
+
+
+def async_route(method, path):
+    """Регистрирует корутину handler(request, send) для (метод, путь)."""
+    def decorator(handler):
+        _async_routes[(method, path)] = handler
+        return handler
+    return decorator
+
+
+class Request:
+    """То немногое из запроса, что нужно асинхронным маршрутам."""
+
+    def __init__(self, scope, receive):
+        self.scope = scope
+        self.receive = receive
+        self.headers = {name.decode('latin-1').lower(): value.decode('latin-1')
+                        for name, value in scope['headers']}
+        self.args = {name: values[-1] for name, values in parse_qs(scope.get('query_string', b'').decode()).items()}
+        self.remote_addr = self._remote_addr(scope)
+        cookie = SimpleCookie()
+        try:
+            cookie.load(self.headers.get('cookie', ''))
+        except CookieError:
+            pass
+        self.cookies = {name: morsel.value for name, morsel in cookie.items()}
+        self._session = None
+
+    def _remote_addr(self, scope):
+        # Как ProxyFix у Flask-части: PROXY_HOPS-й адрес с конца X-Forwarded-For
+        hops = flask_app.config['PROXY_HOPS']
+        forwarded = [value.strip() for value in self.headers.get('x-forwarded-for', '').split(',') if value.strip()]
+        if hops and len(forwarded) >= hops:
+            return forwarded[-hops]
+        return (scope.get('client') or ('', 0))[0]
+
+    async def body(self):
+        chunks = []
+        while True:
+            message = await self.receive()
+            chunks.append(message.get('body', b''))
+            if not message.get('more_body'):
+                return b''.join(chunks)
+
+    async def form_or_json(self):
+        body = await self.body()
+        if self.headers.get('content-type', '').startswith('application/json'):
+            try:
+                data = json.loads(body or b'null')
+            except ValueError:
+                data = None
+            return data if isinstance(data, dict) else {}
+        return {name: values[-1] for name, values in parse_qs(body.decode('utf-8', 'replace')).items()}
+
+    async def session(self):
+        if self._session is None:
+            self._session = await sessions.load_async(self.cookies.get(flask_app.config['SESSION_COOKIE_NAME']))
+        return self._session
+
+
+async def send_json(send, data, status=200):
+    body = json.dumps(data, ensure_ascii=False).encode('utf-8')
+    await send({'type': 'http.response.start', 'status': status,
+                'headers': [(b'content-type', b'application/json'), (b'content-length', str(len(body)).encode())]})
+    await send({'type': 'http.response.body', 'body': body})
+
+
+async def send_stream(request, send, chunks):
+    """Отдаёт асинхронный генератор строк как поток событий, пока клиент не отключится."""
+    await send({'type': 'http.response.start', 'status': 200, 'headers': SSE_HEADERS})
+
+    async def pump():
+        async for chunk in chunks:
+            await send({'type': 'http.response.body', 'body': chunk.encode('utf-8'), 'more_body': True})
+        await send({'type': 'http.response.body', 'body': b''})
+
+    async def wait_disconnect():
+        while (await request.receive())['type'] != 'http.disconnect':
+            pass
+
+    tasks = [asyncio.ensure_future(pump()), asyncio.ensure_future(wait_disconnect())]
+    try:
+        await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+    finally:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        await chunks.aclose()
+
+
+# 🌟 Живые обновления свободных мест (Server-Sent Events)
+@async_route('GET', '/client_schedule/stream')
+async def client_schedule_stream(request, send):
+    if (await request.session()).get('user_type') != 'client':
+        return await send_json(send, {'error': 'unauthorized'}, 401)
+    await send_stream(request, send, live.hub.astream())
+
+
+# 🌟 API: страница расписания
+@async_route('GET', '/api/schedule')
+async def api_schedule(request, send):
+    if (await request.session()).get('logged_in') != True:
+        return await send_json(send, {'error': 'unauthorized'}, 401)
+    try:
+        after = db.decode_cursor(request.args.get('after'), db.SCHEDULE_PAGE_KEY)
+        limit = int(request.args['limit']) if request.args.get('limit') else None
+    except ValueError:
+        return await send_json(send, {'error': 'bad request'}, 400)
+    schedule, next_key = await db.get_schedule_page_async(after, limit)
+    await send_json(send, {
+        "items": [dict(sch._asdict(), start_time=str(sch.start_time)) for sch in schedule],
+        "next": db.encode_cursor(next_key),
+    })
+
+
+# 🌟 API: места клиента в листах ожидания
+@async_route('GET', '/api/waitlist')
+async def api_waitlist(request, send):
+    session = await request.session()
+    if session.get('user_type') != 'client':
+        return await send_json(send, {'error': 'unauthorized'}, 401)
+    positions = await db.get_waitlist_positions_async(session.get('client_id'))
+    await send_json(send, {str(schedule_id): position for schedule_id, position in positions.items()})
+
+
+# 🌟 Чат-помощник: ответ на вопрос (страница чата — GET /chat — отдаётся Flask)
+@async_route('POST', '/chat')
+async def chat_answer(request, send):
+    data = await request.form_or_json()
+    message, error = chat.check_request(data, request.remote_addr)
+    if error:
+        return await send_json(send, {'error': error[0]}, error[1])
+
+    streaming = bool(data.get('stream')) or 'text/event-stream' in request.headers.get('accept', '')
+    answer = chat.cached_answer(message)
+    if answer is None:
+        try:
+            # Ожидание слота блокирует — пусть блокирует поток из пула, а не цикл событий
+            await asyncio.to_thread(chat.acquire_slot)
+        except chat.ChatBusy:
+            return await send_json(send, {'error': "Помощник занят, попробуйте через минуту."}, 503)
+
+    if streaming:
+        return await send_stream(request, send, chat.aevent_stream(message, answer))
+    if answer is None:
+        try:
+            answer = ''.join([part async for part in chat.agenerate(message)])
+        except Exception:
+            logger.exception("Ошибка бэкенда чата %s", chat.CHAT_CONFIG['backend'])
+            return await send_json(send, {'error': "Помощник сейчас недоступен, попробуйте позже."}, 502)
+    await send_json(send, {'response': answer})
+
+
+async def lifespan(receive, send):
+    while True:
+        message = await receive()
+        if message['type'] == 'lifespan.startup':
+            yoga.start_background(flask_app)
+            await db.get_async_pool()
+            await send({'type': 'lifespan.startup.complete'})
+        elif message['type'] == 'lifespan.shutdown':
+            await db.close_async_pool()
+            await send({'type': 'lifespan.shutdown.complete'})
+            return
+
+
+async def app(scope, receive, send):
+    if scope['type'] == 'lifespan':
+        return await lifespan(receive, send)
+    if scope['type'] == 'http':
+        handler = _async_routes.get((scope['method'], scope['path']))
+        if handler is not None:
+            return await handler(Request(scope, receive), send)
+    await wsgi_app(scope, receive, send)
+
+
+# Фоновые потоки запускаются в lifespan, то есть в каждом процессе-воркере сервера.
+# Поток SSE здесь — корутина, поэтому страница расписания подписывается на него (live.py)
+flask_app = yoga.create_app({'DEFER_BACKGROUND': True, 'LIVE': {'sse': True}})
+wsgi_app = WsgiToAsgi(flask_app)
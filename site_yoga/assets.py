@@ -0,0 +1,238 @@
+"""Сборка статики: уменьшенные копии фото, отпечатки в именах, предсжатые CSS/JS.
+
+    flask assets build
+
+складывает результат в static/dist и пишет static/dist/manifest.json:
+
+* каждая картинка static/*.jpg — в нескольких ширинах (IMAGE_WIDTHS, не
+  больше оригинала) в форматах AVIF (если Pillow его умеет), WebP и JPEG;
+* CSS и JS — копия с отпечатком содержимого в имени плюс .gz и .br рядом
+  (.br — если установлен пакет brotli).
+
+Шаблоны берут адреса через asset_url() и picture(): пока сборки нет,
+они отдают обычные файлы из static. Файлы из static/dist неизменяемы, их
+адреса меняются вместе с содержимым, поэтому /assets/... отдаётся с
+Cache-Control на год. Сжатие и перекодирование выполняются только при
+сборке; на проде /assets/ лучше отдавать nginx, без участия воркера:
+
+    location /assets/ {
+        alias /path/to/site_yoga/static/dist/;
+        gzip_static on;
+        brotli_static on;   # модуль ngx_brotli
+        expires max;
+        add_header Cache-Control "public, immutable";
+    }
+"""
+import gzip
+import hashlib
+import io
+import json
+import mimetypes
+import os
+import shutil
+
+import click
+from flask import abort, request, send_from_directory, url_for
+from markupsafe import Markup
+
+DIST_DIR = 'dist'
+MANIFEST = 'manifest.json'
+
+IMAGE_WIDTHS = (320, 640, 960, 1280)
+IMAGE_QUALITY = {'avif': 55, 'webp': 75, 'jpeg': 80}
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png')
+TEXT_EXTENSIONS = ('.css', '.js')
+# Предсжатые варианты в порядке предпочтения: (Content-Encoding, расширение файла)
+ENCODINGS = (('br', '.br'), ('gzip', '.gz'))
+
+IMMUTABLE = 'public, max-age=31536000, immutable'
+
+mimetypes.add_type('image/avif', '.avif')
+mimetypes.add_type('image/webp', '.webp')
+
+_manifest = {'files': {}, 'images': {}}
+
+
+def _fingerprint(data):
+    return hashlib.blake2b(data, digest_size=5).hexdigest()
+
+
+def _write_fingerprinted(dist, stem, ext, data):
+    """Пишет data в dist под именем stem.<отпечаток>.ext и возвращает это имя."""
+    name = '%s.%s%s' % (stem, _fingerprint(data), ext)
+    with open(os.path.join(dist, name), 'wb') as file:
+        file.write(data)
+    return name
+
+
+def _image_formats():
+    from PIL import features
+
+    formats = ['webp', 'jpeg']
+    if features.check('avif'):
+        formats.insert(0, 'avif')
+    return formats
+
+
+def _encode_image(image, fmt):
+    buffer = io.BytesIO()
+    if fmt == 'jpeg':
+        image.convert('RGB').save(buffer, 'JPEG', quality=IMAGE_QUALITY['jpeg'], optimize=True, progressive=True)
+    elif fmt == 'webp':
+        image.save(buffer, 'WEBP', quality=IMAGE_QUALITY['webp'], method=6)
+    else:
+        image.save(buffer, 'AVIF', quality=IMAGE_QUALITY['avif'])
+    return buffer.getvalue()
+
+
+def build_image(source, dist, formats):
+    """Варианты одной картинки: {'width', 'height', 'fallback', 'variants': {формат: [[ширина, имя]]}}."""
+    from PIL import Image, ImageOps
+
+    with Image.open(source) as original:
+        # Фото с телефона бывают повёрнуты только флагом EXIF
+        original = ImageOps.exif_transpose(original)
+        if original.mode not in ('RGB', 'RGBA'):
+            original = original.convert('RGB')
+        width, height = original.size
+        largest = min(width, IMAGE_WIDTHS[-1])
+        widths = [w for w in IMAGE_WIDTHS if w < largest] + [largest]
+        stem = os.path.splitext(os.path.basename(source))[0]
+        variants = {fmt: [] for fmt in formats}
+        for target in widths:
+            resized = original.resize((target, round(height * target / width)), Image.LANCZOS)
+            for fmt in formats:
+                name = _write_fingerprinted(dist, '%s.%d' % (stem, target), '.' + fmt.replace('jpeg', 'jpg'),
+                                            _encode_image(resized, fmt))
+                variants[fmt].append([target, name])
+
+    # Для браузеров без srcset — JPEG шириной около 640
+    fallback = min(variants['jpeg'], key=lambda item: abs(item[0] - 640))[1]
+    return {'width': widths[-1], 'height': round(height * widths[-1] / width),
+            'fallback': fallback, 'variants': variants}
+
+
+def build_text(source, dist):
+    """Копия CSS/JS с отпечатком и предсжатые .gz/.br рядом; возвращает имя копии."""
+    try:
+        import brotli
+    except ImportError:
+        brotli = None
+
+    with open(source, 'rb') as file:
+        data = file.read()
+    stem, ext = os.path.splitext(os.path.basename(source))
+    name = _write_fingerprinted(dist, stem, ext, data)
+    path = os.path.join(dist, name)
+    with open(path + '.gz', 'wb') as file:
+        file.write(gzip.compress(data, compresslevel=9, mtime=0))
+    if brotli is not None:
+        with open(path + '.br', 'wb') as file:
+            file.write(brotli.compress(data, quality=11))
+    return name
+
+
+def build(static_dir):
+    """Пересобирает static/dist целиком; возвращает манифест."""
+    dist = os.path.join(static_dir, DIST_DIR)
+    shutil.rmtree(dist, ignore_errors=True)
+    os.makedirs(dist)
+
+    manifest = {'files': {}, 'images': {}}
+    formats = None
+    for filename in sorted(os.listdir(static_dir)):
+        source = os.path.join(static_dir, filename)
+        ext = os.path.splitext(filename)[1].lower()
+        if not os.path.isfile(source):
+            continue
+        if ext in TEXT_EXTENSIONS:
+            manifest['files'][filename] = build_text(source, dist)
+        elif ext in IMAGE_EXTENSIONS:
+            formats = formats or _image_formats()
+            manifest['images'][filename] = build_image(source, dist, formats)
+
+    with open(os.path.join(dist, MANIFEST), 'w', encoding='utf-8') as file:
+        json.dump(manifest, file, ensure_ascii=False, indent=1)
+    return manifest
+
+
+def load_manifest(static_dir):
+    """Читает манифест сборки; без сборки шаблоны ссылаются на исходные файлы."""
+    global _manifest
+    try:
+        with open(os.path.join(static_dir, DIST_DIR, MANIFEST), encoding='utf-8') as file:
+            _manifest = json.load(file)
+    except FileNotFoundError:
+        _manifest = {'files': {}, 'images': {}}
+    return _manifest
+
+
+def asset_url(filename):
+    """Адрес файла из static: собранная копия с отпечатком, если она есть."""
+    built = _manifest['files'].get(filename)
+    if built is None:
+        image = _manifest['images'].get(filename)
+        built = image['fallback'] if image else None
+    if built is None:
+        return url_for('static', filename=filename)
+    return url_for('serve_asset', filename=built)
+
+
+def _srcset(variants):
+    return ', '.join('%s %dw' % (url_for('serve_asset', filename=name), width) for width, name in variants)
+
+
+def picture(filename, alt='', sizes='100vw', class_='', lazy=True):
+    """<picture> с вариантами картинки по форматам и ширинам (или простой <img> без сборки)."""
+    image = _manifest['images'].get(filename)
+    attrs = Markup(' alt="%s" class="%s"') % (alt, class_)
+    if lazy:
+        attrs += Markup(' loading="lazy" decoding="async"')
+    if image is None:
+        return Markup('<img src="%s"%s>') % (url_for('static', filename=filename), attrs)
+
+    sources = [Markup('<source type="image/%s" srcset="%s" sizes="%s">') % (fmt, _srcset(image['variants'][fmt]), sizes)
+               for fmt in ('avif', 'webp') if fmt in image['variants']]
+    img = Markup('<img src="%s" srcset="%s" sizes="%s" width="%d" height="%d"%s>') % (
+        url_for('serve_asset', filename=image['fallback']), _srcset(image['variants']['jpeg']), sizes,
+        image['width'], image['height'], attrs)
+    return Markup('<picture>%s%s</picture>') % (Markup('').join(sources), img)
+
+
+def serve_asset(filename):
+    """Файл из static/dist с годовым кэшем; CSS/JS — в предсжатом виде, если клиент его принимает."""
+    from flask import current_app
+
+    dist = os.path.join(current_app.static_folder, DIST_DIR)
+    if filename == MANIFEST:
+        abort(404)
+    accepted = request.accept_encodings
+    for encoding, suffix in ENCODINGS:
+        if accepted[encoding] and os.path.isfile(os.path.join(dist, filename + suffix)):
+            response = send_from_directory(dist, filename + suffix, max_age=31536000,
+                                           mimetype=mimetypes.guess_type(filename)[0])
+            response.headers['Content-Encoding'] = encoding
+            break
+    else:
+        response = send_from_directory(dist, filename, max_age=31536000)
+    response.headers['Cache-Control'] = IMMUTABLE
+    response.vary.add('Accept-Encoding')
+    return response
+
+
+def init_app(app):
+    """Маршрут /assets/, функции для шаблонов и команда flask assets build."""
+    load_manifest(app.static_folder)
+    app.add_url_rule('/assets/<path:filename>', 'serve_asset', serve_asset)
+    app.jinja_env.globals.update(asset_url=asset_url, picture=picture)
+
+    @app.cli.group('assets')
+    def assets_group():
+        """Сборка статики."""
+
+    @assets_group.command('build')
+    def build_command():
+        """Собирает static/dist: варианты картинок, отпечатки, .gz/.br."""
+        manifest = build(app.static_folder)
+        click.echo("Картинок: %d, CSS/JS: %d → %s" % (
+            len(manifest['images']), len(manifest['files']), os.path.join(app.static_folder, DIST_DIR)))
@@ -0,0 +1,187 @@
+"""Хеширование паролей вне потока запроса и ограничение частоты входа.
+
+generate_password_hash / check_password_hash — намеренно медленные функции.
+Они выполняются в отдельном пуле процессов, чтобы не занимать GIL воркера:
+пока считается хеш, остальные потоки спокойно обслуживают другие маршруты.
+Очередь к пулу ограничена, при переполнении сразу возвращается отказ.
+Место в очереди освобождается, когда хеш действительно посчитан: запрос,
+не дождавшийся результата за timeout, получает отказ, но его задача
+продолжает занимать место, пока пул её не выполнит или не отменит.
+
+Корзины лимитов живут в памяти процесса: у каждого воркера свои, так что
+фактический лимит — RATE_LIMITS, умноженный на число воркеров (4 по
+умолчанию в gunicorn.conf.py). Ключ ip — настоящий адрес клиента, только
+если приложение знает, сколько прокси перед ним (PROXY_HOPS в app.py).
+"""
+import multiprocessing
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeout
+
+from werkzeug.security import generate_password_hash, check_password_hash
+
+# Параметры хеширования и пула; переопределяются через app.config в init_app
+HASH_CONFIG = {
+    'method': 'scrypt:32768:8:1',   # формат werkzeug: 'scrypt:n:r:p' или 'pbkdf2:sha256:итерации'
+    'salt_length': 16,
+    'workers': max(1, (os.cpu_count() or 2) // 2),  # 0 — считать в потоке запроса
+    'max_pending': 32,              # сколько хешей может ждать своей очереди
+    'timeout': 10,                  # секунд ожидания результата
+    'retry_after': 5,               # секунд в заголовке Retry-After ответа 503
+}
+
+# Лимиты: (размер корзины, пополнение токенов в секунду) на каждый воркер
+RATE_LIMITS = {
+    'ip': (20, 0.5),      # 20 попыток подряд, потом одна в 2 секунды
+    'phone': (5, 1 / 60), # 5 попыток подряд, потом одна в минуту
+    'chat': (10, 0.2),    # вопросы чат-помощнику с одного IP: 10 подряд, потом один в 5 секунд
+}
+
+
+class HashQueueFull(Exception):
+    """Очередь на хеширование переполнена, запрос нужно отклонить."""
+
+
+class HashTimeout(HashQueueFull):
+    """Хеш не посчитан за timeout секунд; для вызывающего это та же перегрузка."""
+
+
+class RateLimited(Exception):
+    """Слишком много попыток для данного ключа."""
+
+
+_executor = None
+_executor_pid = None
+_executor_lock = threading.Lock()
+_pending = None
+_stats = {'submitted': 0, 'completed': 0, 'rejected': 0, 'timed_out': 0, 'in_flight': 0, 'total_ms': 0.0}
+_stats_lock = threading.Lock()
+
+
+def _get_executor():
+    """Пул процессов создаётся лениво и заново после fork воркера."""
+    global _executor, _executor_pid, _pending
+    if _executor is not None and _executor_pid == os.getpid():
+        return _executor
+    with _executor_lock:
+        if _executor is None or _executor_pid != os.getpid():
+            # Не fork: воркер многопоточный, и копия его блокировок (пул БД,
+            # слушатель) могла бы достаться процессу пула захваченной
+            _executor = ProcessPoolExecutor(max_workers=HASH_CONFIG['workers'],
+                                            mp_context=multiprocessing.get_context('spawn'))
+            _executor_pid = os.getpid()
+            _pending = threading.BoundedSemaphore(HASH_CONFIG['workers'] + HASH_CONFIG['max_pending'])
+    return _executor
+
+
+def _run(func, *args):
+    """Выполняет func в пуле процессов и ждёт результат."""
+    if not HASH_CONFIG['workers']:
+        return func(*args)
+
+    executor = _get_executor()
+    if not _pending.acquire(blocking=False):
+        with _stats_lock:
+            _stats['rejected'] += 1
+        raise HashQueueFull("Слишком много одновременных операций с паролями")
+
+    started = time.perf_counter()
+    pending = _pending
+    with _stats_lock:
+        _stats['submitted'] += 1
+        _stats['in_flight'] += 1
+
+    def done(future):
+        pending.release()
+        with _stats_lock:
+            _stats['in_flight'] -= 1
+            _stats['completed'] += 1
+            _stats['total_ms'] += (time.perf_counter() - started) * 1000
+
+    try:
+        future = executor.submit(func, *args)
+    except BaseException:
+        done(None)
+        raise
+    future.add_done_callback(done)
+    try:
+        return future.result(timeout=HASH_CONFIG['timeout'])
+    except FutureTimeout:
+        future.cancel()  # ещё в очереди — место освободится сразу
+        with _stats_lock:
+            _stats['timed_out'] += 1
+        raise HashTimeout("Хеширование пароля не уложилось в %s с" % HASH_CONFIG['timeout'])
+
+
+def hash_password(password):
+    """Хеш пароля с параметрами из HASH_CONFIG."""
+    return _run(generate_password_hash, password, HASH_CONFIG['method'], HASH_CONFIG['salt_length'])
+
+
+def verify_password(password_hash, password):
+    return _run(check_password_hash, password_hash, password)
+
+
+def hash_stats():
+    """Глубина очереди и время хеширования для мониторинга."""
+    with _stats_lock:
+        stats = dict(_stats)
+    stats['workers'] = HASH_CONFIG['workers']
+    stats['max_pending'] = HASH_CONFIG['max_pending']
+    stats['avg_ms'] = round(stats.pop('total_ms') / stats['completed'], 2) if stats['completed'] else 0.0
+    return stats
+
+
+class TokenBucketLimiter:
+    """Token bucket по ключу (IP, телефон). Помнит не больше max_keys ключей."""
+
+    def __init__(self, capacity, refill_rate, max_keys=100000):
+        self.capacity = capacity
+        self.refill_rate = refill_rate
+        self.max_keys = max_keys
+        self._buckets = OrderedDict()  # ключ -> (токены, время последнего обновления)
+        self._lock = threading.Lock()
+
+    def allow(self, key, cost=1):
+        now = time.monotonic()
+        with self._lock:
+            tokens, updated = self._buckets.pop(key, (self.capacity, now))
+            tokens = min(self.capacity, tokens + (now - updated) * self.refill_rate)
+            allowed = tokens >= cost
+            if allowed:
+                tokens -= cost
+            self._buckets[key] = (tokens, now)
+            while len(self._buckets) > self.max_keys:
+                self._buckets.popitem(last=False)
+            return allowed
+
+    def reset(self, key):
+        with self._lock:
+            self._buckets.pop(key, None)
+
+
+limiters = {}
+
+
+def check_rate(**keys):
+    """Списывает попытку для каждого ключа (ip=..., phone=...), RateLimited при превышении."""
+    for kind, value in keys.items():
+        if value and not limiters[kind].allow(value):
+            raise RateLimited(kind)
+
+
+def _configure_limiters():
+    for kind, (capacity, refill_rate) in RATE_LIMITS.items():
+        limiters[kind] = TokenBucketLimiter(capacity, refill_rate)
+
+
+def init_app(app):
+    """Берёт параметры хеширования и лимиты из app.config."""
+    HASH_CONFIG.update(app.config.get('PASSWORD_HASH', {}))
+    RATE_LIMITS.update(app.config.get('RATE_LIMITS', {}))
+    _configure_limiters()
+
+
+_configure_limiters()
@@ -0,0 +1 @@
+"""Нагрузочные проверки и бенчмарки. Запуск из каталога site_yoga: python -m bench.<модуль>"""
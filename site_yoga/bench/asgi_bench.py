@@ -0,0 +1,163 @@
+"""Ёмкость по соединениям: WSGI (поток на соединение) против ASGI (asgi.py).
+
+Поднимает сервер отдельным процессом в выбранном режиме, входит клиентом и
+открывает всё больше одновременных подписок /client_schedule/stream. Для
+каждого уровня печатает, сколько соединений сервер принял за --timeout
+секунд, RSS и число потоков серверного процесса (из /proc/<pid>/status) и
+прирост памяти на одно соединение.
+
+    python -m bench.asgi_bench --ephemeral --modes wsgi asgi --levels 100 1000 5000
+
+Режим wsgi — werkzeug с потоком на запрос, как gunicorn с gthread; режим
+asgi — uvicorn с одним процессом. Нужны psycopg, psycopg_pool, asgiref и uvicorn.
+"""
+import argparse
+import asyncio
+import json
+import os
+import resource
+import subprocess
+import sys
+import time
+import urllib.error
+import urllib.request
+from contextlib import ExitStack
+
+import db
+from bench.load import Session
+from bench.seed import BENCH_PASSWORD, DEFAULT_SIZES, client_phone
+
+STREAM_PATH = '/client_schedule/stream'
+
+
+def serve(mode, port, db_config):
+    """Точка входа серверного процесса (--serve)."""
+    import logging
+
+    db.DB_CONFIG.update(db_config)
+    logging.getLogger('werkzeug').setLevel(logging.WARNING)
+    if mode == 'wsgi':
+        from werkzeug.serving import make_server
+
+        from app import app
+
+        make_server('127.0.0.1', port, app, threaded=True).serve_forever()
+    else:
+        import uvicorn
+
+        import asgi
+
+        uvicorn.run(asgi.app, host='127.0.0.1', port=port, log_level='warning', backlog=4096)
+
+
+def process_status(pid):
+    """{'rss_kb': ..., 'threads': ...} из /proc/<pid>/status."""
+    status = {}
+    with open('/proc/%d/status' % pid) as f:
+        for line in f:
+            name, _, value = line.partition(':')
+            if name == 'VmRSS':
+                status['rss_kb'] = int(value.split()[0])
+            elif name == 'Threads':
+                status['threads'] = int(value)
+    return status
+
+
+def start_server(stack, mode, port):
+    command = [sys.executable, '-m', 'bench.asgi_bench', '--serve', mode, '--port', str(port),
+               '--db', json.dumps(db.DB_CONFIG)]
+    server = subprocess.Popen(command, cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    stack.callback(server.wait)
+    stack.callback(server.terminate)
+    url = 'http://127.0.0.1:%d' % port
+    deadline = time.perf_counter() + 30
+    while time.perf_counter() < deadline:
+        try:
+            urllib.request.urlopen(url + '/login', timeout=1).read()
+            return server, url
+        except (OSError, urllib.error.URLError):
+            time.sleep(0.2)
+    raise RuntimeError("Сервер в режиме %s не запустился" % mode)
+
+
+async def _subscribe(port, cookie, opened):
+    reader, writer = await asyncio.open_connection('127.0.0.1', port)
+    try:
+        writer.write(('GET %s HTTP/1.1\r\nHost: 127.0.0.1\r\nAccept: text/event-stream\r\nCookie: %s\r\n\r\n'
+                      % (STREAM_PATH, cookie)).encode())
+        await writer.drain()
+        head = await reader.readuntil(b'\r\n\r\n')
+        if head.startswith(b'HTTP/1.1 200') or head.startswith(b'HTTP/1.0 200'):
+            opened.append(writer)
+            await reader.read()  # держим соединение, пока его не закроют
+    finally:
+        writer.close()
+
+
+async def measure_level(pid, port, cookie, count, timeout):
+    opened = []
+    tasks = [asyncio.ensure_future(_subscribe(port, cookie, opened)) for _ in range(count)]
+    started = time.perf_counter()
+    while len(opened) < count and time.perf_counter() - started < timeout:
+        await asyncio.sleep(0.05)
+    await asyncio.sleep(0.5)  # сервер успевает выделить буферы под последние соединения
+    result = {'requested': count, 'established': len(opened),
+              'connect_seconds': round(time.perf_counter() - started, 2)}
+    result.update(process_status(pid))
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+    await asyncio.sleep(1)
+    return result
+
+
+def run_mode(mode, port, levels, timeout):
+    with ExitStack() as stack:
+        server, url = start_server(stack, mode, port)
+        cookie = Session(url).login(client_phone(1), BENCH_PASSWORD).cookie_header()
+        baseline = process_status(server.pid)
+        report = {'baseline': baseline, 'levels': []}
+        for count in levels:
+            result = asyncio.run(measure_level(server.pid, port, cookie, count, timeout))
+            if result['established']:
+                result['kb_per_connection'] = round(
+                    (result['rss_kb'] - baseline['rss_kb']) / result['established'], 1)
+            report['levels'].append(result)
+        return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--ephemeral', action='store_true', help='поднять временный PostgreSQL и заполнить его')
+    parser.add_argument('--modes', nargs='+', choices=['wsgi', 'asgi'], default=['wsgi', 'asgi'])
+    parser.add_argument('--levels', nargs='+', type=int, default=[100, 1000, 5000])
+    parser.add_argument('--timeout', type=float, default=20, help='секунд на установку соединений уровня')
+    parser.add_argument('--port', type=int, default=5057)
+    parser.add_argument('--serve', choices=['wsgi', 'asgi'], help=argparse.SUPPRESS)
+    parser.add_argument('--db', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.serve:
+        return serve(args.serve, args.port, json.loads(args.db))
+
+    # Каждое соединение — дескриптор и у клиента, и у сервера (он унаследует предел)
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+
+    with ExitStack() as stack:
+        if args.ephemeral:
+            from bench.pg import apply_schema, ephemeral_postgres
+            from bench.seed import seed
+
+            db.DB_CONFIG.update(stack.enter_context(ephemeral_postgres()))
+            stack.callback(db.close_pool)
+            with db.get_connection() as conn:
+                apply_schema(conn)
+            seed(dict(DEFAULT_SIZES))
+        report = {mode: run_mode(mode, args.port, args.levels, args.timeout) for mode in args.modes}
+
+    print(json.dumps(report, ensure_ascii=False, indent=2))
+
+
+if __name__ == '__main__':
+    main()
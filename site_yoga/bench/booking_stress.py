@@ -0,0 +1,103 @@
+"""Стресс-тест записи на занятия против локального PostgreSQL.
+
+Создаёт временное занятие на SPOTS мест и временных клиентов, после чего
+WORKERS потоков одновременно записывают клиентов на это занятие (каждый
+клиент пытается записаться дважды). Проверяет, что места не ушли в минус,
+записей ровно столько, сколько было мест, и печатает пропускную способность.
+
+    python -m bench.booking_stress --spots 500 --clients 2000 --workers 32
+"""
+import argparse
+import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import db
+
+PHONE_PREFIX = '+7000'
+
+
+def _setup(spots, clients):
+    with db.get_connection() as conn:
+        with conn.cursor() as cursor:
+            cursor.execute("""
+                INSERT INTO kurs_2.schedule (day_of_week, start_time, duration, specialization, instructor_name, free_spots)
+                VALUES ('Пн', '07:00', 60, 'Хатха-йога', 'Стресс-тест', %s)
+                RETURNING id;
+            """, (spots,))
+            schedule_id = cursor.fetchone()[0]
+            cursor.execute("""
+                INSERT INTO kurs_2.clients (full_name, phone)
+                SELECT 'Стресс-тест ' || n, %s || lpad(n::text, 7, '0')
+                FROM generate_series(1, %s) AS n
+                RETURNING id;
+            """, (PHONE_PREFIX, clients))
+            client_ids = [row[0] for row in cursor.fetchall()]
+    return schedule_id, client_ids
+
+
+def _teardown(schedule_id, client_ids):
+    with db.get_connection() as conn:
+        with conn.cursor() as cursor:
+            cursor.execute("DELETE FROM kurs_2.registrations WHERE schedule_id = %s", (schedule_id,))
+            cursor.execute("DELETE FROM kurs_2.schedule WHERE id = %s", (schedule_id,))
+            cursor.execute("DELETE FROM kurs_2.clients WHERE id = ANY(%s)", (client_ids,))
+
+
+def run(spots, clients, workers):
+    db.DB_POOL_CONFIG['max_size'] = workers
+    schedule_id, client_ids = _setup(spots, clients)
+    counts = {db.BOOKED: 0, db.ALREADY_BOOKED: 0, db.NO_SPOTS: 0}
+    lock = threading.Lock()
+
+    def book(client_id):
+        status = db.book_schedule_spot(schedule_id, client_id)
+        with lock:
+            counts[status] += 1
+
+    try:
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            list(executor.map(book, client_ids * 2))
+        elapsed = time.perf_counter() - started
+
+        with db.get_connection() as conn:
+            with conn.cursor() as cursor:
+                cursor.execute("SELECT free_spots FROM kurs_2.schedule WHERE id = %s", (schedule_id,))
+                free_spots = cursor.fetchone()[0]
+                cursor.execute("SELECT count(*) FROM kurs_2.registrations WHERE schedule_id = %s", (schedule_id,))
+                registrations = cursor.fetchone()[0]
+    finally:
+        _teardown(schedule_id, client_ids)
+        db.close_pool()
+
+    expected = min(spots, clients)
+    report = {
+        'workers': workers,
+        'attempts': len(client_ids) * 2,
+        'seconds': round(elapsed, 3),
+        'bookings_per_second': round(len(client_ids) * 2 / elapsed, 1),
+        'statuses': counts,
+        'free_spots_left': free_spots,
+        'registrations': registrations,
+        'oversold': registrations > spots or free_spots < 0,
+        'ok': registrations == expected == counts[db.BOOKED] and free_spots == spots - expected,
+    }
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--spots', type=int, default=500)
+    parser.add_argument('--clients', type=int, default=2000)
+    parser.add_argument('--workers', type=int, default=32)
+    args = parser.parse_args()
+
+    report = run(args.spots, args.clients, args.workers)
+    print(json.dumps(report, ensure_ascii=False, indent=2))
+    raise SystemExit(0 if report['ok'] else 1)
+
+
+if __name__ == '__main__':
+    main()
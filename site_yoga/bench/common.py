@@ -0,0 +1,15 @@
+"""Общие помощники бенчмарков."""
+import statistics
+
+
+def percentiles(timings):
+    """p50/p95/p99 (мс) для списка длительностей в миллисекундах."""
+    timings = sorted(timings)
+    if not timings:
+        return {'count': 0}
+    return {
+        'count': len(timings),
+        'p50_ms': round(statistics.median(timings), 2),
+        'p95_ms': round(timings[max(0, int(len(timings) * 0.95) - 1)], 2),
+        'p99_ms': round(timings[max(0, int(len(timings) * 0.99) - 1)], 2),
+    }
@@ -0,0 +1,60 @@
+"""Сравнение двух отчётов bench.load: ищет регрессии между коммитами.
+
+    python -m bench.compare before.json after.json --threshold 10
+
+Код выхода 1, если хоть один сценарий стал медленнее (p95 выросло) или
+потерял в пропускной способности больше чем на threshold процентов, либо
+стал делать больше SQL-запросов на запрос.
+"""
+import argparse
+import json
+
+
+def _change(before, after):
+    if not before:
+        return None
+    return round((after - before) / before * 100, 1)
+
+
+def compare(before, after, threshold):
+    rows, regressions = [], []
+    for name, old in before['scenarios'].items():
+        new = after['scenarios'].get(name)
+        if new is None:
+            continue
+        row = {
+            'scenario': name,
+            'req_per_s': [old['req_per_s'], new['req_per_s'], _change(old['req_per_s'], new['req_per_s'])],
+            'p95_ms': [old.get('p95_ms'), new.get('p95_ms'), _change(old.get('p95_ms'), new.get('p95_ms') or 0)],
+            'db_queries_per_request': [old['db_queries_per_request'], new['db_queries_per_request']],
+        }
+        rows.append(row)
+        rps_change, p95_change = row['req_per_s'][2], row['p95_ms'][2]
+        if rps_change is not None and rps_change < -threshold:
+            regressions.append('%s: req/s %+.1f%%' % (name, rps_change))
+        if p95_change is not None and p95_change > threshold:
+            regressions.append('%s: p95 %+.1f%%' % (name, p95_change))
+        old_queries, new_queries = row['db_queries_per_request']
+        if old_queries is not None and new_queries is not None and new_queries > old_queries:
+            regressions.append('%s: SQL-запросов на запрос %s -> %s' % (name, old_queries, new_queries))
+    return rows, regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('before')
+    parser.add_argument('after')
+    parser.add_argument('--threshold', type=float, default=10, help='допустимое ухудшение, %%')
+    args = parser.parse_args()
+
+    with open(args.before, encoding='utf-8') as file:
+        before = json.load(file)
+    with open(args.after, encoding='utf-8') as file:
+        after = json.load(file)
+    rows, regressions = compare(before, after, args.threshold)
+    print(json.dumps({'scenarios': rows, 'regressions': regressions}, ensure_ascii=False, indent=2))
+    raise SystemExit(1 if regressions else 0)
+
+
+if __name__ == '__main__':
+    main()
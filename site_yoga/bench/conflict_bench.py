@@ -0,0 +1,92 @@
+"""Пересечения занятий (conflicts.py): деревья интервалов против попарной проверки.
+
+Расписание генерируется в памяти (БД не нужна): --instructors тренеров,
+занятия по 60/90 минут в случайное время недели. Для каждого размера меряет
+построение деревьев, проверку одного нового занятия (как при отправке
+ScheduleForm) и поиск всех пересечений; попарная проверка O(n²) меряется
+только до --naive-limit строк.
+
+    python -m bench.conflict_bench --sizes 1000,10000,50000
+"""
+import argparse
+import json
+import random
+import time
+from datetime import time as dtime
+
+import conflicts
+import db
+import schedule_index
+
+
+def timetable(size, instructors, rng):
+    return [db.ScheduleItem(schedule_id, rng.choice(schedule_index.DAYS),
+                            dtime(rng.randint(6, 22), rng.choice((0, 15, 30, 45))), rng.choice((60, 90)),
+                            'Хатха-йога', 'Тренер %d' % rng.randrange(instructors), 15)
+            for schedule_id in range(1, size + 1)]
+
+
+def naive(rows):
+    """Все пары одного тренера с пересекающимися интервалами — попарно."""
+    intervals = [(row, conflicts.week_intervals(row.day_of_week, row.start_time, row.duration)) for row in rows]
+    found = 0
+    for pos, (row, mine) in enumerate(intervals):
+        for other, theirs in intervals[pos + 1:]:
+            if row.instructor_name == other.instructor_name and any(
+                    start < other_end and other_start < end
+                    for start, end in mine for other_start, other_end in theirs):
+                found += 1
+    return found
+
+
+def micro(timings):
+    """p50/p99 в микросекундах: проверка одного занятия быстрее, чем видно в миллисекундах."""
+    timings = sorted(timings)
+    return {'count': len(timings), 'p50': round(timings[len(timings) // 2], 1),
+            'p99': round(timings[max(0, int(len(timings) * 0.99) - 1)], 1)}
+
+
+def seconds(func):
+    started = time.perf_counter()
+    result = func()
+    return result, round(time.perf_counter() - started, 4)
+
+
+def run(sizes, instructors, checks, naive_limit, seed):
+    rng = random.Random(seed)
+    report = {}
+    for size in sizes:
+        rows = timetable(size, instructors, rng)
+        conflict_index, build = seconds(lambda: conflicts.ConflictIndex(rows))
+        timings = []
+        for _ in range(checks):
+            values = {'instructor_name': 'Тренер %d' % rng.randrange(instructors)}
+            day, start = rng.choice(schedule_index.DAYS), dtime(rng.randint(6, 22), rng.choice((0, 30)))
+            started = time.perf_counter()
+            conflict_index.check(day, start, 90, values)
+            timings.append((time.perf_counter() - started) * 1e6)
+        found, find_all = seconds(conflict_index.all_conflicts)
+        item = {'build_s': build, 'check_us': micro(timings), 'all_conflicts_s': find_all, 'pairs': len(found)}
+        if size <= naive_limit:
+            pairs, item['naive_s'] = seconds(lambda: naive(rows))
+            item['naive_pairs'] = pairs
+        report[size] = item
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sizes', default='1000,10000,50000', help='размеры расписания через запятую')
+    parser.add_argument('--instructors', type=int, default=200)
+    parser.add_argument('--checks', type=int, default=2000, help='проверок одного занятия на размер')
+    parser.add_argument('--naive-limit', type=int, default=10000, help='наибольший размер для попарной проверки')
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    sizes = [int(size) for size in args.sizes.split(',')]
+    report = run(sizes, args.instructors, args.checks, args.naive_limit, args.seed)
+    print(json.dumps(report, ensure_ascii=False, indent=2))
+
+
+if __name__ == '__main__':
+    main()
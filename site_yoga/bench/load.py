@@ -0,0 +1,223 @@
+"""Нагрузочный бенчмарк основных маршрутов.
+
+Гоняет настоящие маршруты (/, /clients, /client_schedule GET и POST,
+/search_clients, /login, /chat) из нескольких потоков и печатает JSON с req/s,
+p50/p95/p99 и числом SQL-запросов на запрос (из заголовка Server-Timing).
+Результаты двух прогонов сравнивает bench.compare.
+
+    # временный PostgreSQL, посев и приложение в этом же процессе
+    python -m bench.load --ephemeral --clients 100000 --output before.json
+
+    # уже запущенный сервер, БД заранее заполнена через bench.seed
+    python -m bench.load --url http://127.0.0.1:5000
+"""
+import argparse
+import http.cookiejar
+import json
+import random
+import re
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from contextlib import ExitStack
+
+from bench.common import percentiles
+from bench.seed import BENCH_PASSWORD, DEFAULT_SIZES, client_phone
+
+CSRF_RE = re.compile(r'name="csrf_token" type="hidden" value="([^"]+)"')
+QUERIES_RE = re.compile(r'db;[^,]*desc="(\d+) queries"')
+SEARCH_PREFIXES = ['ив', 'иванов', 'петр', 'анна', 'смирнова мария', '0000001']
+# Частые вопросы повторяются (кэш ответов), редкие каждый раз уникальны
+CHAT_QUESTIONS = ['Сколько стоит абонемент?', 'сколько стоит абонемент', 'Какое расписание занятий?',
+                  'Кто у вас тренер?', 'Когда занятия по хатха-йоге?']
+
+
+class _NoRedirect(urllib.request.HTTPRedirectHandler):
+    """Меряем сам маршрут, а не страницу, на которую он перенаправляет."""
+
+    def redirect_request(self, *args, **kwargs):
+        return None
+
+
+class Session:
+    """Пользователь с собственными cookie."""
+
+    def __init__(self, base_url):
+        self.base_url = base_url
+        self.cookies = http.cookiejar.CookieJar()
+        self.opener = urllib.request.build_opener(urllib.request.HTTPCookieProcessor(self.cookies), _NoRedirect())
+
+    def cookie_header(self):
+        return '; '.join('%s=%s' % (cookie.name, cookie.value) for cookie in self.cookies)
+
+    def request(self, path, data=None):
+        """Возвращает (статус, тело, мс, SQL-запросов или None)."""
+        body = urllib.parse.urlencode(data).encode() if data is not None else None
+        started = time.perf_counter()
+        try:
+            response = self.opener.open(self.base_url + path, data=body, timeout=60)
+        except urllib.error.HTTPError as e:
+            response = e
+        content = response.read()
+        elapsed = (time.perf_counter() - started) * 1000
+        match = QUERIES_RE.search(response.headers.get('Server-Timing', ''))
+        return response.status, content, elapsed, int(match.group(1)) if match else None
+
+    def login(self, username, password):
+        _, page, _, _ = self.request('/login')
+        match = CSRF_RE.search(page.decode('utf-8'))
+        data = {'username': username, 'password': password}
+        if match:
+            data['csrf_token'] = match.group(1)
+        status = self.request('/login', data)[0]
+        if status != 302:
+            raise RuntimeError("Не удалось войти как %s (статус %s)" % (username, status))
+        return self
+
+
+def _admin(base_url, sizes):
+    return Session(base_url).login('admin', 'admin_password')
+
+
+def _client(base_url, sizes):
+    return Session(base_url).login(client_phone(random.randint(1, sizes['accounts'])), BENCH_PASSWORD)
+
+
+def _anonymous(base_url, sizes):
+    return Session(base_url)
+
+
+def _login_request(session, sizes):
+    # Каждый вход — новая сессия, как у настоящего пользователя
+    fresh = Session(session.base_url)
+    _, page, _, _ = fresh.request('/login')
+    match = CSRF_RE.search(page.decode('utf-8'))
+    data = {'username': client_phone(random.randint(1, sizes['accounts'])), 'password': BENCH_PASSWORD}
+    if match:
+        data['csrf_token'] = match.group(1)
+    return fresh.request('/login', data)
+
+
+# Сценарий: (как получить сессию, функция одного запроса)
+SCENARIOS = {
+    'index': (_admin, lambda s, sizes: s.request('/')),
+    'clients': (_admin, lambda s, sizes: s.request('/clients')),
+    'client_schedule_get': (_client, lambda s, sizes: s.request('/client_schedule')),
+    'dashboard': (_client, lambda s, sizes: s.request('/studia')),
+    'client_schedule_post': (_client, lambda s, sizes: s.request(
+        '/client_schedule', {'schedule_id': random.randint(1, sizes['schedule'])})),
+    'search_clients': (_admin, lambda s, sizes: s.request(
+        '/search_clients?' + urllib.parse.urlencode({'q': random.choice(SEARCH_PREFIXES)}))),
+    'login': (_anonymous, _login_request),
+    'chat': (_anonymous, lambda s, sizes: s.request('/chat', {
+        'message': random.choice(CHAT_QUESTIONS) if random.random() < 0.8 else 'вопрос %d' % random.getrandbits(32),
+        'stream': '1'})),
+}
+
+
+def run_scenario(base_url, name, sizes, workers, duration):
+    make_session, do_request = SCENARIOS[name]
+    sessions = [make_session(base_url, sizes) for _ in range(workers)]
+    timings, queries, statuses = [], [], {}
+    lock = threading.Lock()
+    deadline = time.perf_counter() + duration
+
+    def worker(session):
+        while time.perf_counter() < deadline:
+            status, _, elapsed, query_count = do_request(session, sizes)
+            with lock:
+                timings.append(elapsed)
+                statuses[status] = statuses.get(status, 0) + 1
+                if query_count is not None:
+                    queries.append(query_count)
+
+    threads = [threading.Thread(target=worker, args=(session,)) for session in sessions]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    result = {
+        'requests': len(timings),
+        'req_per_s': round(len(timings) / elapsed, 1),
+        'statuses': {str(status): count for status, count in sorted(statuses.items())},
+        'db_queries_per_request': round(sum(queries) / len(queries), 2) if queries else None,
+    }
+    result.update(percentiles(timings))
+    return result
+
+
+def _start_local_app(stack, port):
+    """Поднимает приложение в этом процессе, без лимитов частоты и с заглушкой вместо модели чата."""
+    import logging
+
+    from werkzeug.serving import make_server
+
+    import auth
+    import chat
+    from app import app
+
+    logging.getLogger('werkzeug').setLevel(logging.WARNING)
+
+    for limiter in auth.limiters.values():
+        limiter.capacity = limiter.refill_rate = 10 ** 9
+    chat.CHAT_CONFIG['backend'] = 'stub'
+    server = make_server('127.0.0.1', port, app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    stack.callback(server.shutdown)
+    return 'http://127.0.0.1:%d' % port
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--url', help='адрес уже запущенного сервера; по умолчанию приложение поднимается здесь же')
+    parser.add_argument('--ephemeral', action='store_true', help='поднять временный PostgreSQL и заполнить его')
+    parser.add_argument('--seed', action='store_true', help='очистить и заполнить БД из db.DB_CONFIG')
+    parser.add_argument('--scenarios', nargs='+', choices=sorted(SCENARIOS), default=list(SCENARIOS))
+    parser.add_argument('--workers', type=int, default=8)
+    parser.add_argument('--duration', type=float, default=10, help='секунд на сценарий')
+    parser.add_argument('--port', type=int, default=5056)
+    parser.add_argument('--output', help='куда записать JSON-отчёт')
+    for name, default in DEFAULT_SIZES.items():
+        parser.add_argument('--' + name.replace('_', '-'), type=int, default=default)
+    args = parser.parse_args()
+    sizes = {name: getattr(args, name) for name in DEFAULT_SIZES}
+
+    with ExitStack() as stack:
+        if args.ephemeral or args.seed:
+            import db
+            from bench.pg import apply_schema, ephemeral_postgres
+            from bench.seed import seed
+
+            if args.ephemeral:
+                # Меняем настройки на месте: на этот словарь уже ссылается слушатель кэша
+                db.DB_CONFIG.update(stack.enter_context(ephemeral_postgres()))
+                with db.get_connection() as conn:
+                    apply_schema(conn)
+            stack.callback(db.close_pool)
+            sizes = seed(sizes)
+        sizes['accounts'] = min(sizes['accounts'], sizes['clients'])
+
+        base_url = args.url or _start_local_app(stack, args.port)
+        report = {
+            'started_at': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'workers': args.workers,
+            'duration_s': args.duration,
+            'sizes': sizes,
+            'scenarios': {name: run_scenario(base_url, name, sizes, args.workers, args.duration)
+                          for name in args.scenarios},
+        }
+
+    text = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as file:
+            file.write(text)
+    print(text)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,111 @@
+"""Нагрузочный тест: шторм входов против задержки остальных маршрутов.
+
+Поднимает приложение на локальном порту, создаёт тестовую учётную запись
+и из STORM потоков отправляет на /login неверные пароли, пока отдельный
+поток меряет задержку лёгкого маршрута /studio. Прогон повторяется с
+хешированием в потоке запроса (hash workers = 0) и в пуле процессов.
+
+    python -m bench.login_storm --storm 32 --seconds 10
+"""
+import argparse
+import json
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+
+from werkzeug.serving import make_server
+
+import auth
+import db
+from app import app
+from bench.common import percentiles
+
+PHONE = '+70000000001'
+
+
+def _request(url, data=None):
+    started = time.perf_counter()
+    try:
+        with urllib.request.urlopen(url, data=data, timeout=30) as response:
+            response.read()
+            status = response.status
+    except urllib.error.HTTPError as e:
+        status = e.code
+    return status, (time.perf_counter() - started) * 1000
+
+
+def _run_mode(base_url, hash_workers, storm, seconds):
+    auth.HASH_CONFIG['workers'] = hash_workers
+    auth._executor = None
+    stop = threading.Event()
+    login_timings, probe_timings, statuses = [], [], {}
+    lock = threading.Lock()
+    body = urllib.parse.urlencode({'username': PHONE, 'password': 'wrong-password'}).encode()
+
+    def stormer():
+        while not stop.is_set():
+            status, elapsed = _request(base_url + '/login', body)
+            with lock:
+                login_timings.append(elapsed)
+                statuses[status] = statuses.get(status, 0) + 1
+
+    def prober():
+        while not stop.is_set():
+            _, elapsed = _request(base_url + '/studio')
+            probe_timings.append(elapsed)
+            time.sleep(0.02)
+
+    # Задержка /studio без нагрузки — для сравнения
+    baseline = [_request(base_url + '/studio')[1] for _ in range(50)]
+
+    threads = [threading.Thread(target=stormer) for _ in range(storm)] + [threading.Thread(target=prober)]
+    for thread in threads:
+        thread.start()
+    time.sleep(seconds)
+    stop.set()
+    for thread in threads:
+        thread.join()
+
+    return {
+        'hash_workers': hash_workers,
+        'studio_idle': percentiles(baseline),
+        'studio_under_storm': percentiles(probe_timings),
+        'login': percentiles(login_timings),
+        'login_per_second': round(len(login_timings) / seconds, 1),
+        'login_statuses': statuses,
+        'hash_stats': auth.hash_stats(),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--storm', type=int, default=32, help='число потоков, штурмующих /login')
+    parser.add_argument('--seconds', type=float, default=10)
+    parser.add_argument('--hash-workers', type=int, default=auth.HASH_CONFIG['workers'])
+    parser.add_argument('--port', type=int, default=5055)
+    args = parser.parse_args()
+
+    # Для замера изоляции CPU лимиты отключаем, иначе шторм упрётся в них
+    app.config['WTF_CSRF_ENABLED'] = False
+    for limiter in auth.limiters.values():
+        limiter.capacity = limiter.refill_rate = 10 ** 9
+
+    db.add_client_account('Нагрузочный Тест', PHONE, 'correct-password')
+    server = make_server('127.0.0.1', args.port, app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base_url = 'http://127.0.0.1:%d' % args.port
+    try:
+        report = [_run_mode(base_url, workers, args.storm, args.seconds) for workers in (0, args.hash_workers)]
+    finally:
+        server.shutdown()
+        with db.get_connection() as conn:
+            with conn.cursor() as cursor:
+                cursor.execute("DELETE FROM kurs_2.client_auth WHERE phone = %s", (PHONE,))
+        db.close_pool()
+    print(json.dumps(report, ensure_ascii=False, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,72 @@
+"""Временный PostgreSQL для бенчмарков: initdb во временный каталог, pg_ctl start/stop."""
+import os
+import shutil
+import socket
+import subprocess
+import tempfile
+from contextlib import contextmanager
+
+
+
+def _find_bin(name):
+    path = shutil.which(name)
+    if path:
+        return path
+    pg_config = shutil.which('pg_config')
+    if pg_config:
+        bindir = subprocess.run([pg_config, '--bindir'], capture_output=True, text=True, check=True).stdout.strip()
+        candidate = os.path.join(bindir, name)
+        if os.path.exists(candidate):
+            return candidate
+    raise RuntimeError("Не найден %s: установите PostgreSQL или укажите существующую БД" % name)
+
+
+def _free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+@contextmanager
+def ephemeral_postgres():
+    """Поднимает пустой кластер и отдаёт словарь настроек в формате db.DB_CONFIG."""
+    initdb, pg_ctl = _find_bin('initdb'), _find_bin('pg_ctl')
+    workdir = tempfile.mkdtemp(prefix='yoga-bench-pg-')
+    datadir = os.path.join(workdir, 'data')
+    port = _free_port()
+    subprocess.run([initdb, '-D', datadir, '-U', 'postgres', '-A', 'trust', '-E', 'UTF8', '--no-sync'],
+                   check=True, capture_output=True)
+    options = '-p %d -k %s -c listen_addresses=127.0.0.1 -c fsync=off -c max_connections=200' % (port, workdir)
+    subprocess.run([pg_ctl, '-D', datadir, '-o', options, '-w', '-l', os.path.join(workdir, 'log'), 'start'],
+                   check=True, capture_output=True)
+    try:
+        yield {'dbname': 'postgres', 'user': 'postgres', 'password': '', 'host': '127.0.0.1', 'port': str(port)}
+    finally:
+        subprocess.run([pg_ctl, '-D', datadir, '-m', 'immediate', '-w', 'stop'], capture_output=True)
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+def apply_schema(conn):
+    """Создаёт схему kurs_2 миграциями из sql/."""
+    import migrate
+
+    migrate.upgrade(conn)
+
+
+@contextmanager
+def ephemeral_replica(primary):
+    """Потоковая реплика кластера primary (словарь из ephemeral_postgres): pg_basebackup -R и pg_ctl start."""
+    basebackup, pg_ctl = _find_bin('pg_basebackup'), _find_bin('pg_ctl')
+    workdir = tempfile.mkdtemp(prefix='yoga-bench-replica-')
+    datadir = os.path.join(workdir, 'data')
+    port = _free_port()
+    subprocess.run([basebackup, '-h', primary['host'], '-p', primary['port'], '-U', primary['user'],
+                    '-D', datadir, '-R', '-X', 'stream'], check=True, capture_output=True)
+    options = '-p %d -k %s -c listen_addresses=127.0.0.1 -c hot_standby=on' % (port, workdir)
+    subprocess.run([pg_ctl, '-D', datadir, '-o', options, '-w', '-l', os.path.join(workdir, 'log'), 'start'],
+                   check=True, capture_output=True)
+    try:
+        yield dict(primary, port=str(port))
+    finally:
+        subprocess.run([pg_ctl, '-D', datadir, '-m', 'immediate', '-w', 'stop'], capture_output=True)
+        shutil.rmtree(workdir, ignore_errors=True)
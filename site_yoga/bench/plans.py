@@ -0,0 +1,112 @@
+"""Проверка планов: отслеживаемые запросы db.py не должны читать большие таблицы целиком.
+
+Для каждого запроса выполняется EXPLAIN (ANALYZE, FORMAT JSON) и в плане
+ищутся узлы Seq Scan по таблицам, которые запрос обязан читать по индексу.
+Таблицы меньше --min-rows строк не проверяются: на них полный просмотр
+дешевле индекса, и планировщик прав. Запросы на запись выполняются в
+транзакции, которая затем откатывается.
+
+    python -m bench.plans --ephemeral --clients 100000 --registrations 1000000
+    python -m bench.plans                   # БД из db.DB_CONFIG, уже заполненная
+
+Код выхода 1, если хотя бы один запрос перешёл на последовательное чтение.
+"""
+import argparse
+import json
+import sys
+from contextlib import ExitStack
+
+import db
+from bench.seed import DEFAULT_SIZES, client_phone
+
+MIN_ROWS = 10000
+
+# (имя, SQL, параметры, таблицы без Seq Scan); SQL — те же объекты, что выполняет db.py
+TRACKED_QUERIES = [
+    ('login', db.CLIENT_ACCOUNT_BY_PHONE.statement, (client_phone(1),), ('client_auth',)),
+    ('client_by_phone', db.CLIENT_PHONE_EXISTS.statement, (client_phone(1),), ('clients',)),
+    ('clients_page', db.CLIENTS_PAGE_AFTER.statement, ('', 0, db.PAGE_SIZE + 1), ('clients',)),
+    ('schedule_page', db.SCHEDULE_FIRST_PAGE.statement, (db.PAGE_SIZE + 1,), ('schedule',)),
+    ('schedule_day', db.SCHEDULE_DAY.statement, ('Пн',), ('schedule',)),
+    ('update_price', db.UPDATE_TICKET_PRICE_SQL, (1, 'Абонемент 1'), ('price_list',)),
+    ('client_history', db.CLIENT_HISTORY_FIRST_PAGE.statement, (1, db.PAGE_SIZE + 1), ('registrations',)),
+    ('dashboard_months', db.DASHBOARD_MONTHS_STATS.statement, (1, db.DASHBOARD_MONTHS), ('client_monthly_stats',)),
+    ('waitlist_positions', db.WAITLIST_POSITIONS.statement, (1,), ('waitlist',)),
+    # Не из db.py: так PostgreSQL ищет регистрации при каскадном удалении занятия
+    ('schedule_registrations', "SELECT 1 FROM kurs_2.registrations WHERE schedule_id = %s",
+     (1,), ('registrations',)),
+]
+
+
+def seq_scans(plan):
+    """Таблицы, которые план читает последовательным просмотром."""
+    found = []
+    if plan.get('Node Type') == 'Seq Scan':
+        found.append(plan['Relation Name'])
+    for child in plan.get('Plans', []):
+        found.extend(seq_scans(child))
+    return found
+
+
+def table_rows(cursor):
+    cursor.execute("""
+        SELECT c.relname, c.reltuples::bigint FROM pg_class c
+        JOIN pg_namespace n ON n.oid = c.relnamespace
+        WHERE n.nspname = 'kurs_2' AND c.relkind = 'r';
+    """)
+    return dict(cursor.fetchall())
+
+
+def check(min_rows=MIN_ROWS):
+    """Отчёт по всем запросам: {имя: {...}}; ok = False, если найден запрещённый Seq Scan."""
+    report = {}
+    with db.get_connection() as conn:
+        with conn.cursor() as cursor:
+            cursor.execute("ANALYZE;")
+            conn.commit()
+            rows = table_rows(cursor)
+            for name, statement, params, guarded in TRACKED_QUERIES:
+                cursor.execute("EXPLAIN (ANALYZE, FORMAT JSON) " + statement, params)
+                result = cursor.fetchone()[0][0]
+                scanned = seq_scans(result['Plan'])
+                violations = [table for table in scanned if table in guarded and rows.get(table, 0) >= min_rows]
+                report[name] = {
+                    'ok': not violations,
+                    'seq_scans': scanned,
+                    'violations': violations,
+                    'small_tables': [table for table in guarded if rows.get(table, 0) < min_rows],
+                    'execution_ms': round(result['Execution Time'], 3),
+                }
+        conn.rollback()
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--ephemeral', action='store_true', help='поднять временный PostgreSQL и заполнить его')
+    parser.add_argument('--min-rows', type=int, default=MIN_ROWS, help='таблицы меньше этого не проверяются')
+    for name, default in DEFAULT_SIZES.items():
+        parser.add_argument('--' + name.replace('_', '-'), type=int, default=default)
+    args = parser.parse_args()
+
+    with ExitStack() as stack:
+        if args.ephemeral:
+            from bench.pg import apply_schema, ephemeral_postgres
+            from bench.seed import seed
+
+            db.DB_CONFIG.update(stack.enter_context(ephemeral_postgres()))
+            stack.callback(db.close_pool)
+            with db.get_connection() as conn:
+                apply_schema(conn)
+            seed({name: getattr(args, name) for name in DEFAULT_SIZES})
+        report = check(args.min_rows)
+
+    print(json.dumps(report, ensure_ascii=False, indent=2))
+    failed = [name for name, item in report.items() if not item['ok']]
+    if failed:
+        print("Последовательное чтение больших таблиц: %s" % ', '.join(failed), file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
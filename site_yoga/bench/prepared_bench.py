@@ -0,0 +1,72 @@
+"""Задержка горячих запросов: текстом против PREPARE/EXECUTE (prepared.py).
+
+Вызывает функции db.py в одном потоке по --repeat раз в каждом режиме.
+get_schedule вызывается в обход кэша, чтобы мерить именно запрос. Соединение
+из пула одно и то же, так что в режиме prepared PREPARE выполняется один раз.
+
+    python -m bench.prepared_bench --ephemeral --repeat 5000
+"""
+import argparse
+import json
+import time
+from contextlib import ExitStack
+
+import db
+import prepared
+from bench.common import percentiles
+from bench.seed import DEFAULT_SIZES, client_phone
+
+CALLS = {
+    'get_client_by_phone': lambda: db.get_client_by_phone(client_phone(1)),
+    'get_schedule': db.get_schedule.__wrapped__,
+    'get_clients_page': lambda: db.get_clients_page(),
+    'get_client_dashboard': lambda: db.get_client_dashboard(1),
+}
+
+
+def measure(func, repeat):
+    func()  # прогрев: соединение, PREPARE, кэш каталога
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func()
+        timings.append((time.perf_counter() - started) * 1000)
+    return percentiles(timings)
+
+
+def run(repeat):
+    report = {}
+    for name, func in CALLS.items():
+        report[name] = {}
+        for mode in ('text', 'prepared'):
+            prepared.ENABLED = mode == 'prepared'
+            report[name][mode] = measure(func, repeat)
+    prepared.ENABLED = True
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--ephemeral', action='store_true', help='поднять временный PostgreSQL и заполнить его')
+    parser.add_argument('--repeat', type=int, default=2000)
+    args = parser.parse_args()
+    # Одно соединение на весь замер: иначе PREPARE повторялся бы на каждом новом
+    db.DB_POOL_CONFIG.update(min_size=1, max_size=1)
+
+    with ExitStack() as stack:
+        if args.ephemeral:
+            from bench.pg import apply_schema, ephemeral_postgres
+            from bench.seed import seed
+
+            db.DB_CONFIG.update(stack.enter_context(ephemeral_postgres()))
+            with db.get_connection() as conn:
+                apply_schema(conn)
+            seed(dict(DEFAULT_SIZES))
+        stack.callback(db.close_pool)
+        report = run(args.repeat)
+
+    print(json.dumps(report, ensure_ascii=False, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,104 @@
+"""Проверка чтения с реплик (replicas.py) на основном сервере и потоковой реплике.
+
+Поднимает временный кластер и его реплику, приостанавливает на реплике
+воспроизведение WAL и проверяет, что:
+* администратор, добавивший клиента, сразу находит его в /search_clients
+  (сессия закреплена за основным сервером);
+* другая сессия, пока реплика в пределах max_lag, читает с реплики и нового
+  клиента не видит;
+* когда отставание превышает max_lag, чтение уходит на основной сервер.
+
+    python -m bench.replica_check --max-lag 2
+
+Вместо реплики можно указать любой второй DSN: --replica-port 6432.
+"""
+import argparse
+import json
+import time
+import uuid
+from contextlib import ExitStack
+
+import psycopg2
+
+import db
+import replicas
+
+
+def _wait(predicate, timeout):
+    deadline = time.perf_counter() + timeout
+    while time.perf_counter() < deadline:
+        if predicate():
+            return True
+        time.sleep(0.1)
+    return False
+
+
+def _admin(app):
+    client = app.test_client()
+    client.post('/login', data={'username': 'admin', 'password': 'admin_password'})
+    return client
+
+
+def _finds(client, name):
+    return any(item['full_name'] == name for item in client.get('/search_clients?q=' + name).get_json())
+
+
+def run(replica_config, max_lag, pausable):
+    from app import create_app
+
+    app = create_app({
+        'WTF_CSRF_ENABLED': False,
+        'DB_REPLICAS': {'dsns': [replica_config], 'max_lag': max_lag, 'check_interval': 0.2},
+    })
+    replica = replicas.router.replicas[0]
+    report = {'replica_ready': _wait(replica.usable, 10)}
+
+    name = 'Реплика %s' % uuid.uuid4().hex[:8]
+    writer, reader = _admin(app), _admin(app)
+    control = psycopg2.connect(**replica_config) if pausable else None
+    try:
+        if control is not None:
+            control.autocommit = True
+            with control.cursor() as cursor:
+                cursor.execute("SELECT pg_wal_replay_pause();")
+
+        writer.post('/add_client', data={'full_name': name, 'phone': '7' + str(uuid.uuid4().int)[:10]})
+        written = time.perf_counter()
+        report['writer_sees_own_write'] = _finds(writer, name)
+        report['other_session_sees_write_before_lag'] = _finds(reader, name)
+        report['fallback_after_lag'] = _wait(lambda: _finds(reader, name), max_lag + 10)
+        report['fallback_after_seconds'] = round(time.perf_counter() - written, 2)
+        report['replica'] = replica.status()
+        report['fallbacks'] = replicas.router.fallbacks
+    finally:
+        if control is not None:
+            with control.cursor() as cursor:
+                cursor.execute("SELECT pg_wal_replay_resume();")
+            control.close()
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--max-lag', type=float, default=2.0)
+    parser.add_argument('--replica-port', help='второй DSN на том же хосте вместо временной реплики')
+    args = parser.parse_args()
+
+    with ExitStack() as stack:
+        if args.replica_port:
+            replica_config = dict(db.DB_CONFIG, port=args.replica_port)
+        else:
+            from bench.pg import apply_schema, ephemeral_postgres, ephemeral_replica
+
+            db.DB_CONFIG.update(stack.enter_context(ephemeral_postgres()))
+            with db.get_connection() as conn:
+                apply_schema(conn)
+            replica_config = stack.enter_context(ephemeral_replica(db.DB_CONFIG))
+        stack.callback(db.close_pool)
+        report = run(replica_config, args.max_lag, pausable=not args.replica_port)
+
+    print(json.dumps(report, ensure_ascii=False, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,78 @@
+"""Фильтры расписания: индекс в памяти (schedule_index.py) против запроса к БД.
+
+Для каждого набора фильтров меряет Snapshot.query и, где фильтр выражается
+запросом (только день недели), db.get_filtered_schedule. Отдельно меряет
+пересборку снимка и применение изменения free_spots.
+
+    python -m bench.schedule_filter_bench --ephemeral --schedule 2000 --repeat 5000
+"""
+import argparse
+import json
+import time
+from contextlib import ExitStack
+from datetime import time as dtime
+
+import db
+import schedule_index
+from bench.common import percentiles
+from bench.seed import DEFAULT_SIZES
+
+
+def measure(func, repeat):
+    func()
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func()
+        timings.append((time.perf_counter() - started) * 1000)
+    return percentiles(timings)
+
+
+def run(repeat):
+    snapshot = schedule_index.index.reload()
+    options = snapshot.options()
+    instructor, specialization = options['instructors'][:1], options['specializations'][:1]
+    filters = {
+        'day': {'day': ('Пн',)},
+        'day_time': {'day': ('Пн', 'Ср'), 'time_from': dtime(9), 'time_to': dtime(13)},
+        'all_dimensions': {'day': ('Пн',), 'instructor': tuple(instructor), 'specialization': tuple(specialization),
+                           'time_from': dtime(8), 'has_spots': True},
+        'has_spots': {'has_spots': True},
+    }
+    report = {'rows': len(snapshot.rows), 'filters': {}}
+    for name, kwargs in filters.items():
+        report['filters'][name] = {'rows': snapshot.count(**kwargs),
+                                   'index': measure(lambda: snapshot.query(**kwargs), repeat)}
+    report['filters']['day']['sql'] = measure(lambda: db.get_filtered_schedule('Пн'), max(1, repeat // 10))
+
+    first = snapshot.rows[0]
+    report['rebuild'] = measure(lambda: schedule_index.Snapshot(snapshot.rows), max(1, repeat // 100))
+    report['free_spots_update'] = measure(
+        lambda: snapshot.with_free_spots({first.id: first.free_spots + 1}), max(1, repeat // 10))
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--ephemeral', action='store_true', help='поднять временный PostgreSQL и заполнить его')
+    parser.add_argument('--schedule', type=int, default=DEFAULT_SIZES['schedule'], help='строк расписания при посеве')
+    parser.add_argument('--repeat', type=int, default=5000)
+    args = parser.parse_args()
+
+    with ExitStack() as stack:
+        if args.ephemeral:
+            from bench.pg import apply_schema, ephemeral_postgres
+            from bench.seed import seed
+
+            db.DB_CONFIG.update(stack.enter_context(ephemeral_postgres()))
+            with db.get_connection() as conn:
+                apply_schema(conn)
+            seed(dict(DEFAULT_SIZES, schedule=args.schedule))
+        stack.callback(db.close_pool)
+        report = run(args.repeat)
+
+    print(json.dumps(report, ensure_ascii=False, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,94 @@
+"""Бенчмарк поиска клиентов на 1k / 100k / 1M строк.
+
+Наполняет kurs_2.clients синтетическими клиентами (телефоны с префиксом
++7999, удаляются в конце), затем для каждого размера таблицы меряет
+задержку db.search_clients и старого подхода «выбрать всех и отфильтровать
+в Python». Индексы из sql/0003_search.sql должны быть созданы заранее.
+
+    python -m bench.search_bench --sizes 1000 100000 1000000
+"""
+import argparse
+import json
+import statistics
+import time
+
+import db
+
+PHONE_PREFIX = '+7999'
+QUERIES = ['ив', 'иванов', 'петрова анна', '4567', 'несуществующий']
+LAST_NAMES = ['Иванов', 'Петров', 'Сидоров', 'Смирнов', 'Кузнецов', 'Попов', 'Васильев', 'Соколов']
+FIRST_NAMES = ['Анна', 'Мария', 'Ольга', 'Иван', 'Пётр', 'Елена', 'Дмитрий', 'Наталья']
+
+
+def _seed_to(size, current):
+    """Досоздаёт синтетических клиентов до size штук."""
+    if size <= current:
+        return current
+    with db.get_connection() as conn:
+        with conn.cursor() as cursor:
+            cursor.execute("""
+                INSERT INTO kurs_2.clients (full_name, phone)
+                SELECT (%(last)s)[1 + n %% 8] || (CASE WHEN n %% 2 = 0 THEN 'а' ELSE '' END)
+                       || ' ' || (%(first)s)[1 + (n / 8) %% 8] || ' ' || n,
+                       %(prefix)s || lpad(n::text, 7, '0')
+                FROM generate_series(%(start)s, %(stop)s) AS n;
+            """, {'last': LAST_NAMES, 'first': FIRST_NAMES, 'prefix': PHONE_PREFIX,
+                  'start': current + 1, 'stop': size})
+            cursor.execute("ANALYZE kurs_2.clients;")
+    return size
+
+
+def _cleanup():
+    with db.get_connection() as conn:
+        with conn.cursor() as cursor:
+            cursor.execute("DELETE FROM kurs_2.clients WHERE phone LIKE %s", (PHONE_PREFIX + '%',))
+
+
+def _legacy_search(query):
+    clients = db.get_clients()
+    return [client for client in clients if query in client[1].lower()]
+
+
+def _measure(func, query, repeat):
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func(query)
+        timings.append((time.perf_counter() - started) * 1000)
+    timings.sort()
+    return {
+        'p50_ms': round(statistics.median(timings), 3),
+        'p95_ms': round(timings[int(len(timings) * 0.95) - 1], 3),
+    }
+
+
+def run(sizes, repeat, legacy_limit):
+    report = []
+    seeded = 0
+    try:
+        for size in sorted(sizes):
+            seeded = _seed_to(size, seeded)
+            row = {'rows': size, 'indexed': {}, 'legacy': {}}
+            for query in QUERIES:
+                row['indexed'][query] = _measure(db.search_clients, query, repeat)
+                if size <= legacy_limit:
+                    row['legacy'][query] = _measure(_legacy_search, query, max(1, repeat // 10))
+            report.append(row)
+    finally:
+        _cleanup()
+        db.close_pool()
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 100000, 1000000])
+    parser.add_argument('--repeat', type=int, default=50)
+    parser.add_argument('--legacy-limit', type=int, default=100000,
+                        help='не мерить старый поиск на таблицах больше этого размера')
+    args = parser.parse_args()
+    print(json.dumps(run(args.sizes, args.repeat, args.legacy_limit), ensure_ascii=False, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,121 @@
+"""Генератор синтетических данных для kurs_2.
+
+Заполняет clients, client_auth, employees, price_list, schedule и
+registrations заданным числом строк. Перед заполнением таблицы очищаются,
+поэтому запускать только на отдельной (тестовой) БД:
+
+    python -m bench.seed --clients 100000 --schedule 500 --registrations 1000000 --reset
+"""
+import argparse
+import json
+
+import cache
+import db
+from auth import hash_password
+
+DEFAULT_SIZES = {
+    'clients': 10000,
+    'accounts': 1000,       # сколько клиентов могут войти (client_auth)
+    'employees': 50,
+    'price_types': 10,
+    'schedule': 200,
+    'registrations': 100000,
+}
+
+BENCH_PASSWORD = 'bench-password'
+DAYS = ['Пн', 'Вт', 'Ср', 'Чт', 'Пт', 'Сб', 'Вс']
+SPECIALIZATIONS = ['Хатха-йога', 'Кундалини йога', 'йога для детей', 'йога для пожилых людей']
+LAST_NAMES = ['Иванов', 'Петров', 'Сидоров', 'Смирнов', 'Кузнецов', 'Попов', 'Васильев', 'Соколов']
+FIRST_NAMES = ['Анна', 'Мария', 'Ольга', 'Иван', 'Пётр', 'Елена', 'Дмитрий', 'Наталья']
+
+
+def client_phone(n):
+    """Телефон n-го синтетического клиента (n с 1)."""
+    return '+7%010d' % n
+
+
+def seed(sizes):
+    """Очищает таблицы kurs_2 и заполняет их; возвращает фактические размеры."""
+    sizes = dict(DEFAULT_SIZES, **sizes)
+    sizes['accounts'] = min(sizes['accounts'], sizes['clients'])
+    # Один хеш на всех: иначе посев упрётся в намеренно медленное хеширование
+    password_hash = hash_password(BENCH_PASSWORD)
+    names = {'last': LAST_NAMES, 'first': FIRST_NAMES}
+
+    with db.get_connection() as conn:
+        with conn.cursor() as cursor:
+            cursor.execute("""
+                TRUNCATE kurs_2.registrations, kurs_2.schedule, kurs_2.clients, kurs_2.client_auth,
+                         kurs_2.employees, kurs_2.price_list RESTART IDENTITY CASCADE;
+            """)
+            cursor.execute("""
+                INSERT INTO kurs_2.clients (full_name, phone)
+                SELECT (%(last)s)[1 + n %% 8] || ' ' || (%(first)s)[1 + (n / 8) %% 8] || ' ' || n,
+                       '+7' || lpad(n::text, 10, '0')
+                FROM generate_series(1, %(count)s) AS n;
+            """, dict(names, count=sizes['clients']))
+            # id в client_auth совпадают с id в clients: registrations.client_id один на оба
+            cursor.execute("""
+                INSERT INTO kurs_2.client_auth (full_name, phone, password)
+                SELECT full_name, phone, %s FROM kurs_2.clients WHERE id <= %s ORDER BY id;
+            """, (password_hash, sizes['accounts']))
+            cursor.execute("""
+                INSERT INTO kurs_2.employees (full_name, phone, specialization, passport, birthday, photo, description)
+                SELECT 'Тренер ' || (%(first)s)[1 + n %% 8] || ' ' || n,
+                       '+79' || lpad(n::text, 9, '0'),
+                       (%(specs)s)[1 + n %% 4],
+                       lpad(n::text, 10, '0'),
+                       '01.01.1990',
+                       'trainer1.jpg',
+                       'Синтетический тренер для бенчмарка'
+                FROM generate_series(1, %(count)s) AS n;
+            """, dict(names, specs=SPECIALIZATIONS, count=sizes['employees']))
+            cursor.execute("""
+                INSERT INTO kurs_2.price_list (membership_type, price)
+                SELECT 'Абонемент ' || n, 1000 * n FROM generate_series(1, %s) AS n;
+            """, (sizes['price_types'],))
+            cursor.execute("""
+                INSERT INTO kurs_2.schedule (day_of_week, start_time, duration, specialization, instructor_name, free_spots)
+                SELECT (%(days)s)[1 + n %% 7],
+                       time '07:00' + ((n / 7) %% 28) * interval '30 minutes',
+                       CASE WHEN n %% 2 = 0 THEN 60 ELSE 90 END,
+                       (%(specs)s)[1 + n %% 4],
+                       (SELECT full_name FROM kurs_2.employees WHERE id = 1 + n %% %(employees)s),
+                       1000000
+                FROM generate_series(1, %(count)s) AS n;
+            """, {'days': DAYS, 'specs': SPECIALIZATIONS, 'employees': max(1, sizes['employees']),
+                  'count': sizes['schedule']})
+            cursor.execute("""
+                INSERT INTO kurs_2.registrations (client_id, schedule_id, date_class, attended)
+                SELECT 1 + n %% %(clients)s,
+                       1 + (n / %(clients)s) %% %(schedule)s,
+                       current_date - (n / (%(clients)s * %(schedule)s)) * 7 - (n %% 7),
+                       n %% 5 <> 0
+                FROM generate_series(0, %(count)s - 1) AS n
+                ON CONFLICT DO NOTHING;
+            """, {'clients': sizes['clients'], 'schedule': max(1, sizes['schedule']),
+                  'count': sizes['registrations']})
+            # Кэши и ETag остальных воркеров должны увидеть новые данные
+            versions = cache.publish(cursor, 'clients', 'employees', 'price_list', 'schedule')
+            cursor.execute("ANALYZE;")
+    cache.invalidate_all()
+    cache.note_versions(versions)
+    return sizes
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    for name, default in DEFAULT_SIZES.items():
+        parser.add_argument('--' + name.replace('_', '-'), type=int, default=default)
+    parser.add_argument('--reset', action='store_true', help='подтверждение: таблицы kurs_2 будут очищены')
+    args = parser.parse_args()
+    if not args.reset:
+        parser.error("посев очищает таблицы kurs_2, добавьте --reset, если БД тестовая")
+
+    sizes = seed({name: getattr(args, name) for name in DEFAULT_SIZES})
+    db.close_pool()
+    print(json.dumps(sizes, ensure_ascii=False))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,95 @@
+"""Нагрузочный тест SSE: много простаивающих подписчиков /client_schedule/stream.
+
+Открывает N соединений из одного потока (asyncio), затем несколько раз
+меняет free_spots у занятия через db.update_free_spots и меряет, за сколько
+событие доходит до всех подписчиков. Сервер должен быть запущен в режиме
+ASGI, иначе каждое соединение займёт поток:
+
+    uvicorn asgi:app --workers 1
+    python -m bench.sse_idle --url http://127.0.0.1:8000 --subscribers 5000
+
+БД должна быть заполнена через bench.seed (нужен вход клиента).
+"""
+import argparse
+import asyncio
+import json
+import time
+import urllib.parse
+
+import db
+from bench.common import percentiles
+from bench.load import Session
+from bench.seed import BENCH_PASSWORD, client_phone
+
+
+async def _subscribe(host, port, path, cookie, ready, deliveries):
+    reader, writer = await asyncio.open_connection(host, port)
+    writer.write(('GET %s HTTP/1.1\r\nHost: %s\r\nAccept: text/event-stream\r\nCookie: %s\r\n\r\n'
+                  % (path, host, cookie)).encode())
+    await writer.drain()
+    await reader.readuntil(b'\r\n\r\n')
+    ready.release()
+    try:
+        while True:
+            line = await reader.readline()
+            if not line:
+                break
+            if line.startswith(b'data:'):
+                deliveries.append((time.perf_counter(), json.loads(line[5:])))
+    finally:
+        writer.close()
+
+
+async def run(url, subscribers, updates, schedule_id, interval):
+    parsed = urllib.parse.urlsplit(url)
+    cookie = Session(url).login(client_phone(1), BENCH_PASSWORD).cookie_header()
+
+    ready = asyncio.Semaphore(0)
+    deliveries = []
+    started = time.perf_counter()
+    tasks = [asyncio.create_task(_subscribe(parsed.hostname, parsed.port or 80, '/client_schedule/stream',
+                                            cookie, ready, deliveries))
+             for _ in range(subscribers)]
+    for _ in range(subscribers):
+        await ready.acquire()
+    connect_seconds = time.perf_counter() - started
+
+    fanout = []
+    loop = asyncio.get_running_loop()
+    for n in range(updates):
+        value = 1000 + n
+        deliveries.clear()
+        sent = time.perf_counter()
+        await loop.run_in_executor(None, db.update_free_spots, schedule_id, value)
+        deadline = sent + 30
+        while time.perf_counter() < deadline:
+            received = [at for at, data in deliveries if data.get(str(schedule_id)) == value]
+            if len(received) >= subscribers:
+                break
+            await asyncio.sleep(0.01)
+        received = [(at - sent) * 1000 for at, data in deliveries if data.get(str(schedule_id)) == value]
+        fanout.append({'delivered': len(received), 'last_ms': round(max(received), 1) if received else None,
+                       **percentiles(received)})
+        await asyncio.sleep(interval)
+
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+    db.close_pool()
+    return {'subscribers': subscribers, 'connect_seconds': round(connect_seconds, 2), 'updates': fanout}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--url', default='http://127.0.0.1:8000')
+    parser.add_argument('--subscribers', type=int, default=1000)
+    parser.add_argument('--updates', type=int, default=5)
+    parser.add_argument('--schedule-id', type=int, default=1)
+    parser.add_argument('--interval', type=float, default=1.0, help='пауза между изменениями, с')
+    args = parser.parse_args()
+    report = asyncio.run(run(args.url, args.subscribers, args.updates, args.schedule_id, args.interval))
+    print(json.dumps(report, ensure_ascii=False, indent=2))
+
+
+if __name__ == '__main__':
+    main()
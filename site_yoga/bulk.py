@@ -0,0 +1,303 @@
+"""Массовый импорт и выгрузка клиентов, тренеров и расписания.
+
+Строки проверяются теми же формами, что и при ручном добавлении, затем
+одним COPY FROM STDIN заливаются во временную таблицу и переносятся в
+основную одним INSERT ... ON CONFLICT DO UPDATE в рамках одной транзакции.
+Уникальные ключи для ON CONFLICT создаёт sql/0004_bulk.sql.
+"""
+import csv
+import io
+import json
+import queue
+import threading
+
+import click
+from psycopg2 import sql
+from werkzeug.datastructures import MultiDict
+
+import cache
+import conflicts
+import db
+from forms import ClientForm, EmployeeForm, ScheduleForm
+
+# Что и куда импортируется: форма для проверки, колонки, уникальный ключ,
+# необязательная проверка всего пакета до записи (check: [(№, form.data)] -> {№: [ошибки]})
+# и в транзакции записи (guard: (курсор, [(№, строка)]), исключение с .errors — {№: [ошибки]})
+SPECS = {
+    'clients': {
+        'form': ClientForm,
+        'table': 'clients',
+        'columns': ('full_name', 'phone'),
+        'key': ('phone',),
+    },
+    'employees': {
+        'form': EmployeeForm,
+        'table': 'employees',
+        'columns': ('full_name', 'phone', 'specialization', 'passport', 'birthday'),
+        'key': ('passport',),
+    },
+    'schedule': {
+        'form': ScheduleForm,
+        'table': 'schedule',
+        'columns': ('day_of_week', 'start_time', 'duration', 'specialization', 'instructor_name', 'free_spots'),
+        'key': ('day_of_week', 'start_time', 'instructor_name'),
+        'check': lambda rows: _schedule_conflicts(rows),
+        'guard': conflicts.guard,
+    },
+}
+
+FORMATS = ('csv', 'json')
+
+
+def read_rows(stream, fmt):
+    """Читает строки из текстового потока: CSV с заголовком, JSON-массив или JSON Lines."""
+    if fmt == 'csv':
+        return list(csv.DictReader(stream))
+    text = stream.read().strip()
+    if text.startswith('['):
+        return json.loads(text)
+    return [json.loads(line) for line in text.splitlines() if line.strip()]
+
+
+def _conflict_errors(found):
+    # Пересечения с расписанием и внутри файла — ошибкой поля start_time, как у формы
+    return {number: {'start_time': ["Пересекается: " + "; ".join(items)]} for number, items in found.items()}
+
+
+def _schedule_conflicts(rows):
+    return _conflict_errors(conflicts.check_batch(rows))
+
+
+def validate_rows(kind, rows):
+    """Проверяет строки формой kind.
+
+    Возвращает (годные строки в виде кортежей, ошибки [{'row': №, 'errors': {...}}]).
+    Нумерация строк с 1, как их видит человек в файле.
+    """
+    valid, errors, _ = _validate(kind, rows)
+    return valid, errors
+
+
+def _validate(kind, rows):
+    spec = SPECS[kind]
+    # Одна форма на весь файл: не пересоздавать поля и списки вариантов на каждую строку
+    form = spec['form'](formdata=None, meta={'csrf': False})
+    valid, errors, checked = [], [], []
+    for number, row in enumerate(rows, start=1):
+        if not isinstance(row, dict):
+            errors.append({'row': number, 'errors': {'row': ['Ожидался объект с полями']}})
+            continue
+        form.process(MultiDict({k: '' if v is None else str(v) for k, v in row.items()}))
+        if form.validate():
+            valid.append(tuple(form.data[column] for column in spec['columns']))
+            checked.append((number, dict(form.data)))
+        else:
+            errors.append({'row': number, 'errors': form.errors})
+    if 'check' in spec and checked:
+        failed = spec['check'](checked)
+        errors = sorted(errors + [{'row': number, 'errors': failed[number]} for number in failed],
+                        key=lambda error: error['row'])
+    return valid, errors, [number for number, _ in checked]
+
+
+def _copy_buffer(rows):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerows(rows)
+    buffer.seek(0)
+    return buffer
+
+
+def load_rows(kind, rows, numbers=None):
+    """Заливает проверенные строки через временную таблицу, возвращает (добавлено, обновлено).
+
+    numbers — номера строк в файле для ошибок guard (по умолчанию по порядку с 1).
+    """
+    spec = SPECS[kind]
+    table = sql.Identifier('kurs_2', spec['table'])
+    columns = sql.SQL(', ').join(map(sql.Identifier, spec['columns']))
+    key = sql.SQL(', ').join(map(sql.Identifier, spec['key']))
+    updates = sql.SQL(', ').join(
+        sql.SQL("{0} = EXCLUDED.{0}").format(sql.Identifier(column))
+        for column in spec['columns'] if column not in spec['key']
+    )
+
+    with db.get_connection() as conn:
+        with conn.cursor() as cursor:
+            if 'guard' in spec:
+                numbered = zip(numbers or range(1, len(rows) + 1), rows)
+                spec['guard'](cursor, [(number, dict(zip(spec['columns'], row))) for number, row in numbered])
+            cursor.execute(sql.SQL("""
+                CREATE TEMP TABLE bulk_staging ON COMMIT DROP AS
+                SELECT {columns} FROM {table} WITH NO DATA;
+            """).format(columns=columns, table=table))
+            cursor.copy_expert(
+                sql.SQL("COPY bulk_staging ({columns}) FROM STDIN WITH (FORMAT csv)").format(columns=columns),
+                _copy_buffer(rows),
+            )
+            # Если в файле один ключ встречается несколько раз, побеждает последняя строка
+            cursor.execute(sql.SQL("""
+                INSERT INTO {table} ({columns})
+                SELECT DISTINCT ON ({key}) {columns}
+                FROM (SELECT *, row_number() OVER () AS position FROM bulk_staging) AS staged
+                ORDER BY {key}, position DESC
+                ON CONFLICT ({key}) DO UPDATE SET {updates}
+                RETURNING xmax = 0;
+            """).format(table=table, columns=columns, key=key, updates=updates))
+            flags = [row[0] for row in cursor.fetchall()]
+            versions = cache.publish(cursor, spec['table'])
+    cache.invalidate(spec['table'])
+    cache.note_versions(versions)
+
+    inserted = sum(1 for flag in flags if flag)
+    return inserted, len(flags) - inserted
+
+
+def import_rows(kind, rows):
+    """Проверяет и импортирует строки. Если хоть одна строка с ошибкой, ничего не пишет."""
+    valid, errors, numbers = _validate(kind, rows)
+    report = {'total': len(rows), 'valid': len(valid), 'inserted': 0, 'updated': 0, 'errors': errors}
+    if valid and not errors:
+        try:
+            report['inserted'], report['updated'] = load_rows(kind, valid, numbers)
+        except conflicts.ScheduleConflict as conflict:
+            # Пересечение появилось между проверкой по индексу и записью
+            failed = _conflict_errors(conflict.errors)
+            report['errors'] = [{'row': number, 'errors': failed[number]} for number in sorted(failed)]
+    return report
+
+
+# Сколько байт выгрузки копить перед отправкой в очередь: COPY пишет по строке
+EXPORT_CHUNK_SIZE = 64 * 1024
+
+
+class _QueueWriter:
+    """Файлоподобный объект для copy_expert, передающий куски в очередь.
+
+    Строки COPY собираются в куски по chunk_size, остаток отдаёт flush.
+    Если читатель ушёл (cancelled), прерывает COPY исключением.
+    """
+
+    def __init__(self, chunks, cancelled, chunk_size=EXPORT_CHUNK_SIZE):
+        self.chunks = chunks
+        self.cancelled = cancelled
+        self.chunk_size = chunk_size
+        self._buffer = []
+        self._size = 0
+
+    def write(self, data):
+        self._buffer.append(data)
+        self._size += len(data)
+        if self._size >= self.chunk_size:
+            self.flush()
+
+    def flush(self):
+        if self._buffer:
+            data = self._buffer[0][:0].join(self._buffer)
+            self._buffer, self._size = [], 0
+            self.put(data)
+
+    def put(self, item):
+        """Кладёт item в очередь, пока читатель на месте; иначе IOError."""
+        while True:
+            if self.cancelled.is_set():
+                raise IOError("Выгрузка прервана клиентом")
+            try:
+                self.chunks.put(item, timeout=1)
+                return
+            except queue.Full:
+                continue
+
+
+def _export_sql(kind, fmt):
+    spec = SPECS[kind]
+    table = sql.Identifier('kurs_2', spec['table'])
+    if fmt == 'csv':
+        return sql.SQL("COPY (SELECT * FROM {table} ORDER BY id) TO STDOUT WITH (FORMAT csv, HEADER)").format(
+            table=table)
+    # JSON Lines: по объекту на строку. Формат csv с «невозможными» кавычкой и
+    # разделителем, чтобы COPY не экранировал обратные слэши внутри JSON
+    return sql.SQL("""
+        COPY (SELECT row_to_json(t) FROM (SELECT * FROM {table} ORDER BY id) AS t)
+        TO STDOUT WITH (FORMAT csv, QUOTE E'\\x01', DELIMITER E'\\x02')
+    """).format(table=table)
+
+
+def export_to_file(kind, fmt, file):
+    """Выгружает таблицу через COPY TO STDOUT прямо в файл."""
+    with db.get_connection() as conn:
+        with conn.cursor() as cursor:
+            cursor.copy_expert(_export_sql(kind, fmt), file)
+
+
+def stream_export(kind, fmt, max_chunks=64):
+    """Генератор кусков выгрузки для потокового HTTP-ответа.
+
+    COPY идёт в отдельном потоке со своим соединением из пула, очередь
+    ограничена, так что медленный клиент притормаживает выгрузку, а не
+    копит её в памяти.
+    """
+    chunks = queue.Queue(maxsize=max_chunks)
+    cancelled = threading.Event()
+    done = object()
+    failure = []
+
+    writer = _QueueWriter(chunks, cancelled)
+
+    def produce():
+        try:
+            export_to_file(kind, fmt, writer)
+            writer.flush()
+        except Exception as e:
+            failure.append(e)
+        try:
+            # Сигнал «готово» — тоже с проверкой cancelled: на полной очереди
+            # без читателя поток повис бы вместе с соединением
+            writer.put(done)
+        except IOError:
+            pass
+
+    threading.Thread(target=produce, name='export-%s' % kind, daemon=True).start()
+    try:
+        while True:
+            chunk = chunks.get()
+            if chunk is done:
+                break
+            yield chunk
+    finally:
+        cancelled.set()
+    if failure:
+        raise failure[0]
+
+
+def init_app(app):
+    """Регистрирует команды flask bulk import / flask bulk export."""
+
+    @app.cli.group('bulk')
+    def bulk_group():
+        """Массовый импорт и выгрузка данных."""
+
+    @bulk_group.command('import')
+    @click.argument('kind', type=click.Choice(sorted(SPECS)))
+    @click.argument('path', type=click.Path(exists=True, dir_okay=False))
+    @click.option('--format', 'fmt', type=click.Choice(FORMATS), default=None,
+                  help='По умолчанию определяется по расширению файла.')
+    def import_command(kind, path, fmt):
+        fmt = fmt or ('json' if path.endswith(('.json', '.jsonl')) else 'csv')
+        with open(path, encoding='utf-8', newline='') as file:
+            rows = read_rows(file, fmt)
+        report = import_rows(kind, rows)
+        for error in report['errors']:
+            click.echo("Строка %(row)s: %(errors)s" % error, err=True)
+        click.echo("Всего %(total)s, добавлено %(inserted)s, обновлено %(updated)s, ошибок %(errors_count)s"
+                   % dict(report, errors_count=len(report['errors'])))
+        if report['errors']:
+            raise SystemExit(1)
+
+    @bulk_group.command('export')
+    @click.argument('kind', type=click.Choice(sorted(SPECS)))
+    @click.argument('path', type=click.Path(dir_okay=False))
+    @click.option('--format', 'fmt', type=click.Choice(FORMATS), default='csv')
+    def export_command(kind, path, fmt):
+        with open(path, 'w', encoding='utf-8', newline='') as file:
+            export_to_file(kind, fmt, file)
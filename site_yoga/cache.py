@@ -0,0 +1,211 @@
+import contextvars
+import os
+import threading
+import time
+from collections import OrderedDict
+from functools import wraps
+
+import listener
+
+# Канал PostgreSQL, через который воркеры сообщают друг другу об изменениях
+NOTIFY_CHANNEL = 'yoga_cache'
+
+_MISSING = object()
+
+
+class TTLCache:
+    """LRU-кэш ограниченного размера, записи которого живут ttl секунд."""
+
+    def __init__(self, name, maxsize=128, ttl=60):
+        self.name = name
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()  # ключ -> (срок годности, значение)
+        self._lock = threading.Lock()
+
+    def get(self, key, default=_MISSING):
+        now = time.monotonic()
+        with self._lock:
+            item = self._data.get(key)
+            if item is not None and item[0] > now:
+                self._data.move_to_end(key)
+                self.hits += 1
+                return item[1]
+            if item is not None:
+                del self._data[key]
+            self.misses += 1
+            return default
+
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = (time.monotonic() + self.ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def stats(self):
+        with self._lock:
+            return {'size': len(self._data), 'hits': self.hits, 'misses': self.misses}
+
+
+# таблица -> кэши, которые нужно сбросить при её изменении
+_caches_by_table = {}
+_all_caches = []
+
+# таблица -> (номер версии, время изменения в секундах epoch) из kurs_2.table_versions
+_versions = {}
+_versions_lock = threading.Lock()
+
+# Функция с @invalidates, выполняемая сейчас: {'tables': ..., 'versions': опубликованные версии}
+_writing = contextvars.ContextVar('cache_writing', default=None)
+
+
+def cached(*tables, maxsize=128, ttl=60):
+    """Кэширует результат функции чтения; сбрасывается при изменении tables."""
+    def decorator(func):
+        cache = TTLCache(func.__name__, maxsize=maxsize, ttl=ttl)
+        _all_caches.append(cache)
+        for table in tables:
+            _caches_by_table.setdefault(table, []).append(cache)
+
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            key = (args, tuple(sorted(kwargs.items())))
+            value = cache.get(key)
+            if value is _MISSING:
+                value = func(*args, **kwargs)
+                cache.set(key, value)
+            return value
+
+        wrapper.cache = cache
+        return wrapper
+    return decorator
+
+
+def cached_async(shared):
+    """Кэш асинхронного двойника функции, обёрнутой cached: записи и сброс у них общие."""
+    def decorator(func):
+        @wraps(func)
+        async def wrapper(*args, **kwargs):
+            key = (args, tuple(sorted(kwargs.items())))
+            value = shared.cache.get(key)
+            if value is _MISSING:
+                value = await func(*args, **kwargs)
+                shared.cache.set(key, value)
+            return value
+
+        wrapper.cache = shared.cache
+        return wrapper
+    return decorator
+
+
+def invalidate(*tables):
+    """Сбрасывает в этом процессе кэши, зависящие от tables."""
+    for table in tables:
+        for cache in _caches_by_table.get(table, ()):
+            cache.clear()
+
+
+def invalidate_all():
+    for cache in _all_caches:
+        cache.clear()
+
+
+def stats():
+    """Счётчики попаданий и промахов по каждому кэшу."""
+    return {cache.name: cache.stats() for cache in _all_caches}
+
+
+def table_versions(*tables):
+    """Текущие версии tables: [(номер, время изменения)], (0, 0.0) для неизвестных."""
+    with _versions_lock:
+        return [_versions.get(table, (0, 0.0)) for table in tables]
+
+
+def note_versions(versions):
+    """Запоминает версии {таблица: (номер, время)}; устаревшие номера игнорируются."""
+    with _versions_lock:
+        for table, (version, changed_at) in versions.items():
+            if version > _versions.get(table, (0, 0.0))[0]:
+                _versions[table] = (version, changed_at)
+
+
+def load_versions(cursor):
+    """Читает все версии таблиц из БД (после (пере)подключения слушателя)."""
+    cursor.execute("SELECT table_name, version, extract(epoch FROM changed_at)::float8 FROM kurs_2.table_versions;")
+    note_versions({table: (version, changed_at) for table, version, changed_at in cursor.fetchall()})
+
+
+def publish(cursor, *tables):
+    """Увеличивает счётчики изменений tables и оповещает остальные воркеры.
+
+    Уведомление доставляется после фиксации транзакции cursor. Возвращает
+    новые версии {таблица: (номер, время)}; запоминать их через note_versions
+    можно только после фиксации.
+    """
+    versions = {}
+    for table in tables:
+        cursor.execute("""
+            INSERT INTO kurs_2.table_versions (table_name) VALUES (%s)
+            ON CONFLICT (table_name) DO UPDATE
+                SET version = table_versions.version + 1, changed_at = now()
+            RETURNING version, extract(epoch FROM changed_at)::float8;
+        """, (table,))
+        versions[table] = cursor.fetchone()
+        cursor.execute("SELECT pg_notify(%s, %s)", (NOTIFY_CHANNEL, '%s:%d:%d:%f' % (
+            table, os.getpid(), versions[table][0], versions[table][1])))
+    return versions
+
+
+def publish_changes(cursor):
+    """Публикует изменение таблиц текущей функции с @invalidates в её транзакции.
+
+    Вызывается функцией записи перед commit на том же курсоре: версии и
+    NOTIFY фиксируются вместе с данными или не фиксируются вовсе, поэтому
+    ETag и ключи фрагментов не могут отстать от записанного.
+    """
+    state = _writing.get()
+    if state is None:
+        raise RuntimeError("publish_changes вызван вне функции с @invalidates")
+    state['versions'].update(publish(cursor, *state['tables']))
+
+
+def invalidates(*tables):
+    """Декоратор для функций записи: после успешного выполнения сбрасывает
+    локальные кэши tables и запоминает версии, опубликованные через
+    publish_changes; остальные воркеры узнают о них по NOTIFY. Функция,
+    которая ничего не изменила, publish_changes может не вызывать."""
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            state = {'tables': tables, 'versions': {}}
+            token = _writing.set(state)
+            try:
+                result = func(*args, **kwargs)
+            finally:
+                _writing.reset(token)
+            if state['versions']:
+                invalidate(*tables)
+                note_versions(state['versions'])
+            return result
+        return wrapper
+    return decorator
+
+
+def _on_notify(payload):
+    table, sender, version, changed_at = payload.split(':')
+    note_versions({table: (int(version), float(changed_at))})
+    # Свои изменения уже сброшены в invalidates
+    if sender != str(os.getpid()):
+        invalidate(table)
+
+
+listener.on_notify(NOTIFY_CHANNEL, _on_notify)
+# Пока слушатель не работал, уведомления могли потеряться
+listener.on_reconnect(invalidate_all)
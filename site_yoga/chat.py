@@ -0,0 +1,368 @@
+"""Чат-помощник студии: ответы потоком, кэш частых вопросов, ограничение нагрузки.
+
+POST /chat с {"message": "..."} отвечает потоком Server-Sent Events
+(события delta с кусками текста и завершающее done), поэтому воркер
+отдаёт первые слова сразу, не дожидаясь конца ответа. Без "stream": true
+и без Accept: text/event-stream ответ приходит одним JSON {"response": ...},
+как ждут старые клиенты.
+
+Ответы опираются на данные студии — цены и тренеров из кэшированных
+get_price_list / get_employees и расписание со свободными местами из индекса
+в памяти (schedule_index.py). Готовые ответы хранятся в LRU по
+нормализованному тексту вопроса; в ключ входят версии таблиц и отпечаток
+снимка расписания, так что после изменения цен, расписания или мест ответ
+строится заново.
+
+Модель подключается через CHAT_CONFIG['backend']:
+* 'openai' — OpenAI API, один клиент (и пул HTTP-соединений) на процесс;
+* 'stub'   — локальная заглушка без сети, отвечает по тем же данным,
+             отдавая слова с задержкой stub_delay: для нагрузочных тестов.
+Свои реализации добавляются в BACKENDS.
+"""
+import asyncio
+import json
+import logging
+import os
+import re
+import threading
+import time
+
+from flask import Response, jsonify, render_template, request
+
+import auth
+import cache
+import db
+import metrics
+import schedule_index
+
+logger = logging.getLogger(__name__)
+
+# Настройки; переопределяются через app.config['CHAT'] в init_app
+CHAT_CONFIG = {
+    'backend': os.environ.get('CHAT_BACKEND', 'openai'),
+    'model': 'gpt-4o-mini',
+    'api_key': None,            # по умолчанию OPENAI_API_KEY из окружения
+    'timeout': 30,              # секунд на ответ модели
+    'max_tokens': 400,
+    'max_concurrency': 8,       # одновременных обращений к модели на воркер
+    'queue_timeout': 2,         # сколько ждать свободного слота, потом 503
+    'max_message_length': 1000,
+    'cache_size': 512,
+    'cache_ttl': 3600,
+    'stub_delay': 0.02,         # пауза между словами у заглушки, секунды
+}
+
+# Таблицы, на которых строятся ответы (расписание — из schedule_index)
+GROUNDING_TABLES = ('price_list', 'employees')
+
+SYSTEM_PROMPT = (
+    "Ты — помощник студии йоги «Баланс». Отвечай кратко и по-русски. "
+    "О ценах, расписании и тренерах говори только то, что есть в данных ниже; "
+    "если чего-то в данных нет, так и скажи и предложи позвонить администратору.\n\n%s"
+)
+
+
+class ChatBusy(Exception):
+    """Все слоты обращения к модели заняты."""
+
+
+class OpenAIBackend:
+    """OpenAI Chat Completions с потоковой выдачей."""
+
+    def __init__(self, config):
+        import openai
+
+        # Клиент держит пул HTTP-соединений, поэтому он один на процесс
+        self.client = openai.OpenAI(api_key=config['api_key'] or os.environ.get('OPENAI_API_KEY'),
+                                    timeout=config['timeout'], max_retries=1)
+        self.model = config['model']
+        self.max_tokens = config['max_tokens']
+
+    def stream(self, message, grounding):
+        response = self.client.chat.completions.create(
+            model=self.model,
+            max_tokens=self.max_tokens,
+            stream=True,
+            messages=[
+                {'role': 'system', 'content': SYSTEM_PROMPT % grounding['text']},
+                {'role': 'user', 'content': message},
+            ],
+        )
+        for chunk in response:
+            if chunk.choices and chunk.choices[0].delta.content:
+                yield chunk.choices[0].delta.content
+
+
+class StubBackend:
+    """Заглушка без сети: отвечает по данным студии, слово за словом."""
+
+    def __init__(self, config):
+        self.delay = config['stub_delay']
+
+    def stream(self, message, grounding):
+        text = normalize(message)
+        if any(word in text for word in ('цен', 'стоим', 'абонем', 'сколько')):
+            answer = "Наши цены: " + '; '.join(grounding['prices'])
+        elif any(word in text for word in ('распис', 'заняти', 'когда', 'время')):
+            answer = "Ближайшие занятия: " + '; '.join(grounding['schedule'][:10]) + '.'
+        elif 'тренер' in text or 'инструктор' in text:
+            answer = "У нас занимаются с тренерами: " + ', '.join(grounding['trainers']) + '.'
+        else:
+            answer = "Я могу рассказать о ценах, расписании и тренерах студии «Баланс»."
+        for word in answer.split(' '):
+            if self.delay:
+                time.sleep(self.delay)
+            yield word + ' '
+
+
+BACKENDS = {
+    'openai': OpenAIBackend,
+    'stub': StubBackend,
+}
+
+_backend = None
+_backend_lock = threading.Lock()
+_slots = None
+_answers = None
+_stats = {'requests': 0, 'cache_hits': 0, 'rejected': 0, 'errors': 0, 'in_flight': 0}
+_stats_lock = threading.Lock()
+
+
+def _count(name, delta=1):
+    with _stats_lock:
+        _stats[name] += delta
+
+
+def get_backend():
+    """Бэкенд создаётся один раз на процесс, при первом вопросе."""
+    global _backend
+    if _backend is None:
+        with _backend_lock:
+            if _backend is None:
+                _backend = BACKENDS[CHAT_CONFIG['backend']](CHAT_CONFIG)
+    return _backend
+
+
+def normalize(message):
+    """Ключ кэша: регистр, ё/е, пунктуация и лишние пробелы не важны."""
+    text = message.lower().replace('ё', 'е')
+    return ' '.join(re.sub(r'[^\w\s]', ' ', text).split())
+
+
+@db.cached(*GROUNDING_TABLES)
+def _studio_facts():
+    prices = ['%s — %s руб.' % (row[1], row[2]) for row in db.get_price_list()]
+    trainers = ['%s (%s)' % (row[1], row[3]) for row in db.get_employees()]
+    return prices, trainers
+
+
+def grounding(snapshot=None):
+    """Данные студии для ответа: списки строк и готовый текст для системного промпта.
+
+    Места меняются при каждой записи без смены версии таблицы schedule,
+    поэтому расписание берётся из снимка schedule_index, а не из get_schedule.
+    """
+    if snapshot is None:
+        snapshot = schedule_index.index.snapshot()
+    prices, trainers = _studio_facts()
+    schedule = ['%s %s, %s, тренер %s, свободных мест %s' % (row[1], str(row[2])[:5], row[4], row[5], row[6])
+                for row in snapshot.rows]
+    text = "Цены:\n%s\n\nРасписание:\n%s\n\nТренеры:\n%s" % (
+        '\n'.join(prices), '\n'.join(schedule), '\n'.join(trainers))
+    return {'prices': prices, 'schedule': schedule, 'trainers': trainers, 'text': text}
+
+
+def _cache_key(message, snapshot):
+    return normalize(message), tuple(cache.table_versions(*GROUNDING_TABLES)), snapshot.content_key()
+
+
+def cached_answer(message):
+    answer = _answers.get(_cache_key(message, schedule_index.index.snapshot()), None)
+    if answer is not None:
+        _count('cache_hits')
+    return answer
+
+
+def acquire_slot():
+    if not _slots.acquire(timeout=CHAT_CONFIG['queue_timeout']):
+        _count('rejected')
+        raise ChatBusy()
+    _count('in_flight')
+
+
+def release_slot():
+    _count('in_flight', -1)
+    _slots.release()
+
+
+def generate(message):
+    """Куски ответа модели; полный ответ после успешного завершения попадает в кэш.
+
+    Слот конкурентности должен быть уже занят через acquire_slot.
+    """
+    snapshot = schedule_index.index.snapshot()
+    key = _cache_key(message, snapshot)
+    parts = []
+    for part in get_backend().stream(message, grounding(snapshot)):
+        parts.append(part)
+        yield part
+    _answers.set(key, ''.join(parts))
+
+
+async def agenerate(message):
+    """Асинхронный двойник generate для asgi.py: бэкенд работает в потоке из пула,
+    куски ответа передаются в цикл событий через очередь.
+
+    Слот должен быть уже занят; он освобождается, когда бэкенд закончил, даже
+    если клиент отключился раньше: поток тогда останавливается на следующем куске.
+    """
+    loop = asyncio.get_running_loop()
+    queue = asyncio.Queue()
+    stop = threading.Event()
+
+    def put(item):
+        try:
+            loop.call_soon_threadsafe(queue.put_nowait, item)
+        except RuntimeError:
+            stop.set()  # цикл событий уже закрыт
+
+    def produce():
+        try:
+            for part in generate(message):
+                if stop.is_set():
+                    break
+                put(('delta', part))
+            put(('done', None))
+        except Exception as e:
+            put(('error', e))
+        finally:
+            release_slot()
+
+    loop.run_in_executor(None, produce)
+    try:
+        while True:
+            kind, value = await queue.get()
+            if kind == 'done':
+                return
+            if kind == 'error':
+                raise value
+            yield value
+    finally:
+        stop.set()
+
+
+def _sse(event, data):
+    return 'event: %s\ndata: %s\n\n' % (event, json.dumps(data, ensure_ascii=False))
+
+
+def _event_stream(message, answer):
+    if answer is not None:
+        yield _sse('delta', {'text': answer})
+        yield _sse('done', {'cached': True})
+        return
+    try:
+        for part in generate(message):
+            yield _sse('delta', {'text': part})
+    except Exception:
+        _count('errors')
+        logger.exception("Ошибка бэкенда чата %s", CHAT_CONFIG['backend'])
+        yield _sse('error', {'error': "Помощник сейчас недоступен, попробуйте позже."})
+    else:
+        yield _sse('done', {'cached': False})
+
+
+async def aevent_stream(message, answer):
+    """Асинхронный двойник _event_stream (asgi.py)."""
+    if answer is not None:
+        yield _sse('delta', {'text': answer})
+        yield _sse('done', {'cached': True})
+        return
+    try:
+        async for part in agenerate(message):
+            yield _sse('delta', {'text': part})
+    except Exception:
+        _count('errors')
+        logger.exception("Ошибка бэкенда чата %s", CHAT_CONFIG['backend'])
+        yield _sse('error', {'error': "Помощник сейчас недоступен, попробуйте позже."})
+    else:
+        yield _sse('done', {'cached': False})
+
+
+def check_request(data, remote_addr):
+    """Проверяет вопрос и лимит частоты: (сообщение, None) или (None, (ошибка, код))."""
+    message = (data.get('message') or '').strip()
+    if not message:
+        return None, ("Пустое сообщение", 400)
+    if len(message) > CHAT_CONFIG['max_message_length']:
+        return None, ("Слишком длинное сообщение", 400)
+    try:
+        auth.check_rate(chat=remote_addr)
+    except auth.RateLimited:
+        return None, ("Слишком много вопросов, подождите немного.", 429)
+    _count('requests')
+    return message, None
+
+
+def chat():
+    """GET — страница чата, POST — ответ на вопрос."""
+    if request.method == 'GET':
+        return render_template('chat.html')
+
+    data = request.get_json(silent=True) or request.form
+    message, error = check_request(data, request.remote_addr)
+    if error:
+        return jsonify(error=error[0]), error[1]
+
+    streaming = bool(data.get('stream')) or 'text/event-stream' in request.headers.get('Accept', '')
+    answer = cached_answer(message)
+    if answer is None:
+        try:
+            acquire_slot()
+        except ChatBusy:
+            return jsonify(error="Помощник занят, попробуйте через минуту."), 503
+
+    if streaming:
+        response = Response(_event_stream(message, answer), mimetype='text/event-stream', headers={
+            'Cache-Control': 'no-cache',
+            'X-Accel-Buffering': 'no',
+        })
+        if answer is None:
+            # Слот освобождается, когда ответ дописан или клиент отключился
+            response.call_on_close(release_slot)
+        return response
+
+    if answer is None:
+        try:
+            answer = ''.join(generate(message))
+        except Exception:
+            _count('errors')
+            logger.exception("Ошибка бэкенда чата %s", CHAT_CONFIG['backend'])
+            return jsonify(error="Помощник сейчас недоступен, попробуйте позже."), 502
+        finally:
+            release_slot()
+    return jsonify(response=answer)
+
+
+def chat_stats():
+    with _stats_lock:
+        stats = dict(_stats)
+    stats.update(backend=CHAT_CONFIG['backend'], cache=_answers.stats())
+    return stats
+
+
+def _collector():
+    stats = chat_stats()
+    return (metrics.gauge('yoga_chat_in_flight', 'Обращения к модели в работе', stats['in_flight'])
+            + metrics.gauge('yoga_chat_rejected', 'Отказы из-за лимита одновременных обращений',
+                             stats['rejected'])
+            + metrics.gauge('yoga_chat_cache_hits', 'Ответы из кэша', stats['cache_hits']))
+
+
+def init_app(app):
+    """Маршрут /chat, лимиты и метрики; настройки из app.config['CHAT']."""
+    global _slots, _answers
+    CHAT_CONFIG.update(app.config.get('CHAT', {}))
+    _slots = threading.BoundedSemaphore(CHAT_CONFIG['max_concurrency'])
+    _answers = cache.TTLCache('chat_answers', maxsize=CHAT_CONFIG['cache_size'], ttl=CHAT_CONFIG['cache_ttl'])
+    app.add_url_rule('/chat', 'chat', chat, methods=['GET', 'POST'])
+    metrics.register_collector(_collector)
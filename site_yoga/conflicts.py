@@ -0,0 +1,259 @@
+"""Пересечения занятий одного тренера: дерево интервалов по неделе поверх индекса расписания.
+
+Занятие — интервал [начало, начало + duration) в минутах от начала недели
+(понедельник 00:00). Занятие, переходящее через полночь воскресенья,
+делится на два интервала, так что пересечение с утром понедельника тоже
+находится.
+
+Для каждого тренера строится неизменяемое дерево интервалов: интервалы
+отсортированы по началу и лежат в массивах, узел неявного сбалансированного
+дерева — середина своего отрезка, и для каждого узла хранится наибольший
+конец в его поддереве. Поиск пересечений с одним интервалом — O(log n + k),
+построение — O(n log n).
+
+Деревья строятся из снимка schedule_index и кэшируются на нём, поэтому
+отдельных запросов к БД нет, а после изменения расписания (уведомление
+yoga_schedule) при следующей проверке строятся заново. Копии снимка, в
+которых изменились только free_spots, используют те же деревья. По ним
+отвечают /schedule/conflicts и проверка файла импорта.
+
+Снимок может отставать, поэтому запись занятия (db.add_schedule, импорт)
+перепроверяет пересечения в своей транзакции — guard: под advisory-блокировкой
+тренера по его занятиям, прочитанным из БД.
+
+Зал в kurs_2.schedule не хранится, поэтому пересечения ищутся только по
+тренеру: KEYS перечисляет столбцы, по которым занятия не должны
+пересекаться, и с появлением столбца зала его достаточно добавить туда.
+"""
+import heapq
+from array import array
+
+import schedule_index
+
+WEEK = 7 * 24 * 60
+
+# Столбцы ScheduleItem, внутри значений которых занятия не должны пересекаться
+KEYS = ('instructor_name',)
+
+
+def week_intervals(day_of_week, start_time, duration):
+    """Интервалы [начало, конец) в минутах недели; через полночь воскресенья — два."""
+    start = schedule_index.DAYS.index(day_of_week) * 24 * 60 + start_time.hour * 60 + start_time.minute
+    end = start + duration
+    if end <= WEEK:
+        return [(start, end)]
+    return [(start, WEEK), (0, end - WEEK)]
+
+
+class IntervalTree:
+    """Неизменяемое дерево интервалов [start, end) с идентификаторами."""
+
+    def __init__(self, intervals):
+        items = sorted(intervals)
+        self.starts = array('l', (item[0] for item in items))
+        self.ends = array('l', (item[1] for item in items))
+        self.ids = array('l', (item[2] for item in items))
+        self.max_end = array('l', self.ends)
+        self._fill_max_end(0, len(items))
+
+    def __len__(self):
+        return len(self.starts)
+
+    def _fill_max_end(self, lo, hi):
+        # Снизу вверх по уровням, без рекурсии: сначала узлы-листья, потом их родители
+        order = []
+        stack = [(lo, hi)]
+        while stack:
+            lo, hi = stack.pop()
+            if lo >= hi:
+                continue
+            mid = (lo + hi) // 2
+            order.append((lo, mid, hi))
+            stack.append((lo, mid))
+            stack.append((mid + 1, hi))
+        for lo, mid, hi in reversed(order):
+            best = self.max_end[mid]
+            if lo < mid:
+                best = max(best, self.max_end[(lo + mid) // 2])
+            if mid + 1 < hi:
+                best = max(best, self.max_end[(mid + 1 + hi) // 2])
+            self.max_end[mid] = best
+
+    def overlapping(self, start, end):
+        """Идентификаторы интервалов, пересекающихся с [start, end)."""
+        found = []
+        stack = [(0, len(self.starts))]
+        while stack:
+            lo, hi = stack.pop()
+            if lo >= hi:
+                continue
+            mid = (lo + hi) // 2
+            if self.max_end[mid] <= start:
+                continue  # всё поддерево кончается до start
+            stack.append((lo, mid))
+            if self.starts[mid] < end:
+                if self.ends[mid] > start:
+                    found.append(self.ids[mid])
+                stack.append((mid + 1, hi))
+        return found
+
+
+class ConflictIndex:
+    """Деревья интервалов по каждому значению KEYS для одного снимка расписания."""
+
+    def __init__(self, rows):
+        grouped = {}
+        for row in rows:
+            for start, end in week_intervals(row.day_of_week, row.start_time, row.duration):
+                for key in KEYS:
+                    grouped.setdefault((key, getattr(row, key)), []).append((start, end, row.id))
+        self.trees = {group: IntervalTree(intervals) for group, intervals in grouped.items()}
+
+    def check(self, day_of_week, start_time, duration, values, exclude=()):
+        """id занятий, с которыми пересеклось бы новое; values — {столбец KEYS: значение}."""
+        found = set()
+        for key in KEYS:
+            tree = self.trees.get((key, values.get(key)))
+            if tree is None:
+                continue
+            for start, end in week_intervals(day_of_week, start_time, duration):
+                found.update(tree.overlapping(start, end))
+        found.difference_update(exclude)
+        return sorted(found)
+
+    def all_conflicts(self):
+        """Все пары пересекающихся занятий за один проход по каждому дереву.
+
+        Возвращает [(столбец, значение, id, id, минут пересечения)].
+        """
+        conflicts = {}
+        for (key, value), tree in self.trees.items():
+            active = []  # куча (конец, id) начатых и ещё не закончившихся интервалов
+            for start, end, schedule_id in zip(tree.starts, tree.ends, tree.ids):
+                while active and active[0][0] <= start:
+                    heapq.heappop(active)
+                for other_end, other_id in active:
+                    pair = (key, value) + tuple(sorted((other_id, schedule_id)))
+                    conflicts[pair] = conflicts.get(pair, 0) + min(end, other_end) - start
+                heapq.heappush(active, (end, schedule_id))
+        return [pair + (minutes,) for pair, minutes in sorted(conflicts.items())]
+
+
+def index_for(snapshot):
+    """ConflictIndex снимка; строится при первом обращении и хранится на снимке.
+
+    Снимок с новыми free_spots копирует атрибуты исходного, поэтому деревья
+    переходят к нему без перестройки (в деревьях только id и время).
+    """
+    conflict_index = snapshot.__dict__.get('_conflicts')
+    if conflict_index is None:
+        conflict_index = snapshot._conflicts = ConflictIndex(snapshot.rows)
+    return conflict_index
+
+
+def _row(snapshot, schedule_id):
+    return snapshot.rows[snapshot.position[schedule_id]]
+
+
+def find_all():
+    """Все пересечения текущего расписания: [(столбец, значение, занятие, занятие, минут)]."""
+    snapshot = schedule_index.index.snapshot()
+    return [(key, value, _row(snapshot, first), _row(snapshot, second), minutes)
+            for key, value, first, second, minutes in index_for(snapshot).all_conflicts()]
+
+
+class ScheduleConflict(Exception):
+    """Запись пересекла бы занятия тех же тренеров; errors — {№ строки: [описания]}."""
+
+    def __init__(self, errors):
+        super().__init__("Занятия пересекаются: %s" % errors)
+        self.errors = errors
+
+
+def _latest(rows):
+    # Если ключ встречается в пакете несколько раз, остаётся последняя строка (как в bulk.load_rows)
+    latest = {}
+    for number, values in rows:
+        values = dict(values, start_time=schedule_index.parse_time(values['start_time']),
+                      duration=int(values['duration']))
+        latest[(values['day_of_week'], values['start_time'], values['instructor_name'])] = (number, values)
+    return latest
+
+
+def _batch_conflicts(conflict_index, existing, rows, replaces=True):
+    """{№ строки: [описания]} для пакета rows поверх существующих занятий existing {id: строка}.
+
+    replaces — строка с тем же ключом, что и существующее занятие, заменит его (импорт).
+    """
+    latest = _latest(rows)
+    by_key = {(row.day_of_week, row.start_time, row.instructor_name): row.id for row in existing.values()}
+    exclude = {by_key[key] for key in latest if key in by_key} if replaces else set()
+
+    errors = {}
+    grouped = {}
+    for number, values in latest.values():
+        for schedule_id in conflict_index.check(values['day_of_week'], values['start_time'], values['duration'],
+                                                values, exclude):
+            errors.setdefault(number, set()).add(describe(existing[schedule_id]))
+        for start, end in week_intervals(values['day_of_week'], values['start_time'], values['duration']):
+            for key in KEYS:
+                grouped.setdefault((key, values[key]), []).append((start, end, number))
+
+    # Пересечения внутри пакета — тем же проходом, что и в all_conflicts
+    for intervals in grouped.values():
+        active = []
+        for start, end, number in sorted(intervals):
+            while active and active[0][0] <= start:
+                heapq.heappop(active)
+            for _, other in active:
+                if other != number:
+                    errors.setdefault(number, set()).add("строка %d" % other)
+                    errors.setdefault(other, set()).add("строка %d" % number)
+            heapq.heappush(active, (end, number))
+    return {number: sorted(found) for number, found in errors.items()}
+
+
+def check_batch(rows):
+    """Пересечения для пакета новых занятий по индексу в памяти (проверка файла до записи).
+
+    rows — [(№ строки, {столбец: значение})], где значения уже проверены
+    ScheduleForm. Занятие с тем же ключом (день, время, тренер), что и у
+    строки пакета, импорт заменит, поэтому с ним пересечение не считается.
+    Возвращает {№ строки: [описание пересечения, ...]}.
+    """
+    snapshot = schedule_index.index.snapshot()
+    return _batch_conflicts(index_for(snapshot), {row.id: row for row in snapshot.rows}, rows)
+
+
+# Первый ключ двухключевых advisory-блокировок тренеров (у migrate.py — одноключевая, они не пересекаются)
+LOCK_CLASS = 7301
+
+
+def guard(cursor, rows, replaces=True):
+    """Проверка в транзакции записи: ScheduleConflict, если rows пересекутся с занятиями в БД.
+
+    replaces — как в check_batch; для добавления одного занятия (INSERT) — False.
+
+    Снимок в памяти может отставать (другой воркер только что записал
+    занятие, слушатель отключён), поэтому перед записью берутся
+    транзакционные advisory-блокировки тренеров пакета (по порядку имён —
+    без взаимных блокировок) и их занятия перечитываются из БД. Все записи
+    расписания идут через guard, так что до фиксации транзакции никто другой
+    занятия этих тренеров не добавит.
+    """
+    import db
+
+    names = sorted({values['instructor_name'] for _, values in rows})
+    for name in names:
+        cursor.execute("SELECT pg_advisory_xact_lock(%s, hashtext(%s));", (LOCK_CLASS, name))
+    cursor.execute("SELECT %s FROM kurs_2.schedule WHERE instructor_name = ANY(%%s);" % db.SCHEDULE_COLUMNS,
+                   (names,))
+    existing = {row.id: row for row in map(db.ScheduleItem._make, cursor.fetchall())}
+    errors = _batch_conflicts(ConflictIndex(existing.values()), existing, rows, replaces)
+    if errors:
+        raise ScheduleConflict(errors)
+
+
+def describe(row):
+    return "%s %s, %s (%s мин)" % (row.day_of_week, row.start_time.strftime('%H:%M'), row.instructor_name,
+                                   row.duration)
@@ -1,7 +1,26 @@
+import base64
+import contextvars
+import datetime
+import functools
+import itertools
+import json
+import os
+import time
+
 import psycopg2
 from psycopg2 import sql
-from contextlib import closing
-from werkzeug.security import generate_password_hash
+from contextlib import asynccontextmanager, contextmanager
+from flask import g, has_app_context
+
+import auth
+import cache
+import conflicts
+import live
+import metrics
+import prepared
+import replicas
+from pool import ConnectionPool, PoolError
+from prepared import Query, record
 
 # Настройки для подключения к БД
 DB_CONFIG = {
@@ -12,14 +31,330 @@ DB_CONFIG = {
     'port': '5432',
 }
 
+# Время жизни кэша справочных данных (секунды) и его размер
+CACHE_TTL = 60
+CACHE_SIZE = 128
+
+# Настройки пула соединений
+DB_POOL_CONFIG = {
+    'min_size': 1,
+    'max_size': 10,
+    'idle_timeout': 300,        # секунд простоя, после которых лишнее соединение закрывается
+    'checkout_timeout': 10,     # сколько ждать свободное соединение
+    'health_check': True,       # проверять соединение при выдаче
+    'health_check_after': 30,   # ...если оно пролежало в пуле дольше стольких секунд
+}
+
+_pool = None
+_pool_pid = None
+_inherited_pools = []  # пулы мастер-процесса, которые нельзя ни использовать, ни закрывать
+
+
+def get_pool():
+    """Возвращает общий для приложения пул соединений (создаётся при первом обращении)."""
+    global _pool, _pool_pid
+    if _pool is None:
+        dsn_config = dict(DB_CONFIG, cursor_factory=metrics.cursor_factory(),
+                          connection_factory=prepared.PreparingConnection)
+        _pool = ConnectionPool(dsn_config, **DB_POOL_CONFIG)
+        _pool_pid = os.getpid()
+    return _pool
+
+
+def close_pool():
+    """Закрывает пул, например перед завершением процесса."""
+    global _pool
+    if _pool is not None:
+        _pool.closeall()
+        _pool = None
+
+
+def _checkout():
+    started = time.perf_counter()
+    conn = get_pool().getconn()
+    metrics.observe_pool_wait(time.perf_counter() - started)
+    return conn
+
+
+def _request_connection():
+    """Соединение текущего запроса: берётся из пула один раз и хранится в g."""
+    if 'db_conn' not in g:
+        g.db_conn = _checkout()
+    return g.db_conn
+
+
+def release_request_connection(exc=None):
+    """Возвращает соединения запроса в пулы (вызывается на teardown)."""
+    conn = g.pop('db_conn', None)
+    if conn is not None:
+        get_pool().putconn(conn, close=bool(conn.closed))
+    replica_conn = g.pop('db_replica_conn', None)
+    if replica_conn is not None:
+        replica, conn = replica_conn
+        replica.putconn(conn)
+
+
+def _replica_checkout():
+    """(реплика, соединение) для чтения или None, если читать нужно с основного сервера."""
+    replica = replicas.router.choose()
+    if replica is None:
+        return None
+    try:
+        return replica, replica.getconn()
+    except (psycopg2.Error, PoolError):
+        replica.mark_down()
+        return None
+
+
+def _request_replica_connection():
+    """Соединение с репликой на время запроса; None — реплики недоступны."""
+    if 'db_replica_conn' not in g:
+        replica_conn = _replica_checkout()
+        if replica_conn is None:
+            return None
+        g.db_replica_conn = replica_conn
+    return g.db_replica_conn
+
+
+_read_only = contextvars.ContextVar('read_only', default=False)
+
+
+def replica_read(func):
+    """Помечает функцию, которая только читает: её запросы могут уйти на реплику (replicas.py).
+
+    Функции с @cached так не помечаются: ответ отстающей реплики,
+    прочитанный сразу после сброса кэша, остался бы в кэше до CACHE_TTL.
+    """
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        token = _read_only.set(True)
+        try:
+            return func(*args, **kwargs)
+        finally:
+            _read_only.reset(token)
+    return wrapper
+
+
+def reset_after_fork():
+    """Забывает пул, унаследованный воркером от мастер-процесса.
+
+    Соединения родителя не закрываются: закрытие оборвало бы их и в родителе.
+    """
+    global _pool
+    if _pool is not None and _pool_pid != os.getpid():
+        _inherited_pools.append(_pool)
+        _pool = None
+
+
+def init_app(app):
+    """Подключает выдачу соединений на время запроса к приложению Flask.
+
+    CACHE_LISTEN = True — в каждом воркере работает слушатель LISTEN/NOTIFY
+    (его запускает app.start_background), и кэш сбрасывается во всех воркерах сразу.
+    DB_PREPARE = False — запросы Query отправляются текстом, без PREPARE
+    (нужно за пулером соединений в режиме транзакций).
+    """
+    app.config.setdefault('DB_POOL', {})
+    app.config.setdefault('CACHE_LISTEN', True)
+    app.config.setdefault('DB_PREPARE', True)
+    DB_POOL_CONFIG.update(app.config['DB_POOL'])
+    prepared.ENABLED = app.config['DB_PREPARE']
+    app.teardown_appcontext(release_request_connection)
+
+
+@contextmanager
 def get_connection():
-    """Возвращает соединение с базой данных PostgreSQL."""
-    return psycopg2.connect(**DB_CONFIG)
+    """Выдаёт соединение с базой данных PostgreSQL.
+
+    Внутри запроса Flask все функции используют одно соединение из пула,
+    вне запроса соединение берётся из пула на время блока with.
+    Транзакция фиксируется при успешном выходе и откатывается при ошибке.
+    Функции с @replica_read получают соединение с репликой, если она есть
+    и годится (replicas.wants_replica), иначе — то же основное.
+    """
+    in_request = has_app_context()
+    replica_conn = None
+    if _read_only.get() and replicas.wants_replica():
+        replica_conn = _request_replica_connection() if in_request else _replica_checkout()
+    if replica_conn is not None:
+        conn = replica_conn[1]
+    else:
+        conn = _request_connection() if in_request else _checkout()
+    try:
+        yield conn
+        if not conn.closed:
+            conn.commit()
+    except Exception:
+        if not conn.closed:
+            conn.rollback()
+        raise
+    finally:
+        if not in_request:
+            if replica_conn is not None:
+                replica_conn[0].putconn(conn)
+            else:
+                get_pool().putconn(conn)
+
+
+# Асинхронный пул для режима ASGI (asgi.py): psycopg 3 и psycopg_pool
+# импортируются только в этом режиме, WSGI-воркеры их не загружают
+ASYNC_POOL_CONFIG = {
+    'min_size': 1,
+    'max_size': 20,
+    'timeout': 10,              # сколько ждать свободное соединение
+    'max_idle': 300,
+}
+
+_async_pool = None
+
+
+async def get_async_pool():
+    """Общий асинхронный пул процесса; открывается при первом обращении."""
+    global _async_pool
+    if _async_pool is None:
+        from psycopg.conninfo import make_conninfo
+        from psycopg_pool import AsyncConnectionPool
+
+        pool = AsyncConnectionPool(make_conninfo(**DB_CONFIG), open=False, **ASYNC_POOL_CONFIG)
+        await pool.open()
+        _async_pool = pool
+    return _async_pool
+
+
+async def close_async_pool():
+    global _async_pool
+    if _async_pool is not None:
+        await _async_pool.close()
+        _async_pool = None
+
+
+@asynccontextmanager
+async def get_async_connection():
+    """Асинхронный двойник get_connection: фиксация при успешном выходе, откат при ошибке."""
+    pool = await get_async_pool()
+    async with pool.connection() as conn:
+        yield conn
+
+
+# Размер страницы по умолчанию, максимальный размер и сколько строк
+# за раз подтягивает серверный курсор при потоковой выдаче
+PAGE_SIZE = 50
+MAX_PAGE_SIZE = 500
+STREAM_ITERSIZE = 2000
+
+_stream_ids = itertools.count()
+
+
+def encode_cursor(values):
+    """Упаковывает ключ последней строки страницы в непрозрачную строку для URL."""
+    if values is None:
+        return None
+    raw = json.dumps([str(v) if not isinstance(v, (int, str)) else v for v in values], ensure_ascii=False)
+    return base64.urlsafe_b64encode(raw.encode('utf-8')).decode('ascii')
+
+
+def _key_id(value):
+    if type(value) is not int:
+        raise ValueError(value)
+    return value
+
+
+def _key_text(value):
+    if not isinstance(value, str):
+        raise ValueError(value)
+    return value
+
+
+def _key_day(value):
+    if type(value) is not int or not 1 <= value <= 7:
+        raise ValueError(value)
+    return value
+
+
+def _key_time(value):
+    return datetime.time.fromisoformat(_key_text(value))
+
+
+def _key_date(value):
+    return datetime.date.fromisoformat(_key_text(value))
+
+
+# Форма ключей страниц: по проверке на каждый элемент, в порядке сортировки
+CLIENTS_PAGE_KEY = (_key_text, _key_id)               # (full_name, id)
+SCHEDULE_PAGE_KEY = (_key_day, _key_time, _key_id)    # (номер дня недели, start_time, id)
+HISTORY_PAGE_KEY = (_key_date, _key_id)               # (date_class, id)
+
+
+def decode_cursor(token, key):
+    """Обратное к encode_cursor; key — форма ключа (*_PAGE_KEY).
+
+    ValueError для испорченной строки и для элементов не того типа: иначе
+    они дошли бы до сравнения в SQL и вместо 400 вышла бы DataError.
+    """
+    if not token:
+        return None
+    try:
+        values = json.loads(base64.urlsafe_b64decode(token.encode('ascii')).decode('utf-8'))
+        if not isinstance(values, list) or len(values) != len(key):
+            raise ValueError(values)
+        return [check(value) for check, value in zip(key, values)]
+    except (ValueError, TypeError, UnicodeError) as e:
+        raise ValueError("Некорректный курсор страницы") from e
+
+
+def page_size(limit):
+    return max(1, min(int(limit or PAGE_SIZE), MAX_PAGE_SIZE))
+
+
+def stream_rows(statement, params=None, itersize=STREAM_ITERSIZE):
+    """Генератор строк через именованный (серверный) курсор.
+
+    В памяти одновременно держится не больше itersize строк, поэтому
+    подходит для выгрузки таблицы целиком.
+    """
+    with get_connection() as conn:
+        with conn.cursor(name='stream_%d' % next(_stream_ids)) as cursor:
+            cursor.itersize = itersize
+            cursor.execute(statement, params)
+            yield from cursor
+
+
+def cached(*tables):
+    """Кэширует функцию чтения до изменения любой из tables."""
+    return cache.cached(*tables, maxsize=CACHE_SIZE, ttl=CACHE_TTL)
+
+
+def invalidates(*tables):
+    """Помечает функцию записи: после неё кэши tables сбрасываются во всех воркерах.
+
+    Сама функция вызывает cache.publish_changes(cursor) перед commit.
+    """
+    return cache.invalidates(*tables)
+
+
+# Записи для строк результатов (namedtuple: доступ и по индексу, и по имени)
+ClientAccount = record('ClientAccount', 'id full_name password')
+Client = record('Client', 'id full_name phone')
+Employee = record('Employee', 'id full_name phone specialization passport birthday photo description')
+PriceItem = record('PriceItem', 'id membership_type price')
+ScheduleItem = record('ScheduleItem', 'id day_of_week start_time duration specialization instructor_name free_spots')
+AttendanceItem = record('AttendanceItem', 'date_class day_of_week start_time specialization instructor_name attended')
+
+CLIENT_COLUMNS = 'id, full_name, phone'
+EMPLOYEE_COLUMNS = 'id, full_name, phone, specialization, passport, birthday, photo, description'
+SCHEDULE_COLUMNS = 'id, day_of_week, start_time, duration, specialization, instructor_name, free_spots'
+
+CLIENT_ACCOUNT_BY_PHONE = Query('client_account_by_phone', """
+    SELECT id, full_name, password FROM kurs_2.client_auth WHERE phone = %s
+""", ClientAccount)
+CLIENT_ACCOUNT_EXISTS = Query('client_account_exists', """
+    SELECT EXISTS (SELECT 1 FROM kurs_2.client_auth WHERE phone = %s)
+""")
 
 
 def add_client_account(full_name, phone, password):
     """Добавляет новые регистрации в БД"""
-    hashed_password = generate_password_hash(password)
+    hashed_password = auth.hash_password(password)
 
     with get_connection() as conn:
         with conn.cursor() as cursor:
@@ -29,35 +364,38 @@ def add_client_account(full_name, phone, password):
             """, (full_name, phone, hashed_password))
 
 def get_client_by_phone(phone):
+    """ClientAccount(id, full_name, password) или None."""
     with get_connection() as conn:
         with conn.cursor() as cursor:
-            cursor.execute("SELECT id, full_name, password FROM kurs_2.client_auth WHERE phone = %s", (phone,))
-            return cursor.fetchone()
+            return CLIENT_ACCOUNT_BY_PHONE.one(cursor, (phone,))
 
 def check_phone_exists(phone):
     with get_connection() as conn:
         with conn.cursor() as cur:
-            cur.execute("SELECT id FROM client_auth WHERE phone = %s", (phone,))
-            return cur.fetchone() is not None
+            return CLIENT_ACCOUNT_EXISTS.one(cur, (phone,))[0]
 
 def update_password(phone, new_password):
-    password_hash = generate_password_hash(new_password)
+    password_hash = auth.hash_password(new_password)
     with get_connection() as conn:
         with conn.cursor() as cur:
             cur.execute("UPDATE client_auth SET password = %s WHERE phone = %s", (password_hash, phone))
         conn.commit()
 
 
+EMPLOYEES = Query('employees', "SELECT %s FROM kurs_2.employees ORDER BY full_name;" % EMPLOYEE_COLUMNS, Employee)
+
+
+@cached('employees')
 def get_employees():
     """Получает список всех сотрудников (тренеров)."""
-    with closing(get_connection()) as conn:
+    with get_connection() as conn:
         with conn.cursor() as cursor:
-            cursor.execute("SELECT * FROM kurs_2.employees ORDER BY full_name;")
-            return cursor.fetchall()
+            return EMPLOYEES.all(cursor)
 
+@invalidates('employees')
 def add_employee(full_name, phone, specialization, passport, birthday):
     """Добавляет нового тренера."""
-    with closing(get_connection()) as conn:
+    with get_connection() as conn:
         with conn.cursor() as cursor:
             try:
                 cursor.execute("""
@@ -65,20 +403,23 @@ def add_employee(full_name, phone, specialization, passport, birthday):
                     VALUES (%s, %s, %s, %s, %s);
                 """, (full_name, phone, specialization, passport, birthday)
                 )
+                cache.publish_changes(cursor)
                 conn.commit()
             except psycopg2.IntegrityError as e:
                 conn.rollback()
                 raise e
 
+@invalidates('employees')
 def del_employee(full_name, phone, specialization, passport, birthday):
     """Удаляет данные о тренере."""
-    with closing(get_connection()) as conn:
+    with get_connection() as conn:
         with conn.cursor() as cursor:
             try:
                 cursor.execute(
                     "DELETE FROM kurs_2.employees WHERE full_name = %s AND phone = %s AND specialization = %s AND passport = %sAND birthday = %s",
                     (full_name, phone, specialization, passport, birthday)
                 )
+                cache.publish_changes(cursor)
                 conn.commit()
             except psycopg2.IntegrityError as e:
                 conn.rollback()
@@ -86,24 +427,71 @@ def del_employee(full_name, phone, specialization, passport, birthday):
 
 # Функции для работы с таблицей clients (клиенты)
 
+@replica_read
 def get_clients():
     """Получает список всех клиентов."""
-    with closing(get_connection()) as conn:
+    with get_connection() as conn:
         with conn.cursor() as cursor:
             cursor.execute("SELECT * FROM kurs_2.clients ORDER BY full_name;")
             return cursor.fetchall()
 
+CLIENTS_FIRST_PAGE = Query('clients_first_page', """
+    SELECT %s FROM kurs_2.clients ORDER BY full_name, id LIMIT %%s;
+""" % CLIENT_COLUMNS, Client)
+CLIENTS_PAGE_AFTER = Query('clients_page_after', """
+    SELECT %s FROM kurs_2.clients
+    WHERE (full_name, id) > (%%s, %%s)
+    ORDER BY full_name, id
+    LIMIT %%s;
+""" % CLIENT_COLUMNS, Client)
+
+
+@replica_read
+def get_clients_page(after=None, limit=PAGE_SIZE):
+    """Страница клиентов в порядке (full_name, id), начиная после ключа after.
+
+    Возвращает (строки, ключ для следующей страницы или None).
+    """
+    limit = page_size(limit)
+    with get_connection() as conn:
+        with conn.cursor() as cursor:
+            if after:
+                rows = CLIENTS_PAGE_AFTER.all(cursor, (after[0], int(after[1]), limit + 1))
+            else:
+                rows = CLIENTS_FIRST_PAGE.all(cursor, (limit + 1,))
+    if len(rows) > limit:
+        rows = rows[:limit]
+        return rows, (rows[-1].full_name, rows[-1].id)
+    return rows, None
+
+
+def iter_clients():
+    """Все клиенты потоком, без загрузки таблицы в память."""
+    return stream_rows("SELECT * FROM kurs_2.clients ORDER BY full_name, id;")
+
+CLIENT_NAME_EXISTS = Query('client_name_exists', """
+    SELECT EXISTS (SELECT 1 FROM kurs_2.clients WHERE full_name = %s)
+""")
+CLIENT_PHONE_EXISTS = Query('client_phone_exists', """
+    SELECT EXISTS (SELECT 1 FROM kurs_2.clients WHERE phone = %s)
+""")
+
+
+def client_name_exists(full_name):
+    """Есть ли клиент с таким ФИО (по индексу на full_name)."""
+    with get_connection() as conn:
+        with conn.cursor() as cursor:
+            return CLIENT_NAME_EXISTS.one(cursor, (full_name,))[0]
+
 def client_exists(phone):
     """Проверяет, существует ли клиент с таким номером телефона."""
-    with closing(get_connection()) as conn:
+    with get_connection() as conn:
         with conn.cursor() as cursor:
-            cursor.execute("SELECT id FROM kurs_2.clients WHERE phone = %s", (phone,))
-            result = cursor.fetchone()
-            return result is not None
+            return CLIENT_PHONE_EXISTS.one(cursor, (phone,))[0]
 
 def add_client(full_name, phone):
     """Добавляет нового клиента."""
-    with closing(get_connection()) as conn:
+    with get_connection() as conn:
         with conn.cursor() as cursor:
             try:
                 cursor.execute(
@@ -117,7 +505,7 @@ def add_client(full_name, phone):
 
 def del_client(full_name, phone):
     """Удаляет данные о клиенте."""
-    with closing(get_connection()) as conn:
+    with get_connection() as conn:
         with conn.cursor() as cursor:
             try:
                 cursor.execute(
@@ -131,7 +519,7 @@ def del_client(full_name, phone):
 
 def change_client(full_name, phone):
     """Изменяет данные о клиенте."""
-    with closing(get_connection()) as conn:
+    with get_connection() as conn:
         with conn.cursor() as cursor:
             try:
                 cursor.execute(
@@ -145,129 +533,656 @@ def change_client(full_name, phone):
 
 
 
+# Поиск клиентов и тренеров (индексы — в sql/0003_search.sql)
+
+SEARCH_LIMIT = 20
+SEARCH_MAX_LIMIT = 100
+
+
+def _like_escape(text):
+    return text.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+
+
+def _search(table, columns, query, limit):
+    """Ищет по ФИО и телефону с ранжированием.
+
+    Короткие запросы (1–2 символа) ищутся по началу ФИО через btree-индекс,
+    более длинные — по вхождению через триграммный индекс. Запрос из цифр
+    ищется и по телефону. Сначала идут совпадения с начала ФИО, затем
+    наиболее похожие.
+    """
+    query = query.strip().lower()
+    limit = max(1, min(int(limit or SEARCH_LIMIT), SEARCH_MAX_LIMIT))
+    digits = ''.join(ch for ch in query if ch.isdigit())
+    escaped = _like_escape(query)
+
+    params = {
+        'query': query,
+        'prefix': escaped + '%',
+        'contains': '%' + escaped + '%',
+        'phone': '%' + digits + '%',
+        'limit': limit,
+    }
+    if len(query) < 3:
+        name_condition = sql.SQL("lower(full_name) LIKE %(prefix)s")
+    else:
+        name_condition = sql.SQL("lower(full_name) LIKE %(contains)s")
+    # Телефон ищем, только если в запросе есть хотя бы 3 цифры и нет букв
+    if len(digits) >= 3 and not any(ch.isalpha() for ch in query):
+        condition = sql.SQL("{} OR phone LIKE %(phone)s").format(name_condition)
+    else:
+        condition = name_condition
+
+    statement = sql.SQL("""
+        SELECT {columns} FROM {table}
+        WHERE {condition}
+        ORDER BY lower(full_name) LIKE %(prefix)s DESC,
+                 similarity(full_name, %(query)s) DESC,
+                 full_name
+        LIMIT %(limit)s;
+    """).format(
+        columns=sql.SQL(', ').join(map(sql.Identifier, columns)),
+        table=sql.Identifier('kurs_2', table),
+        condition=condition,
+    )
+
+    with get_connection() as conn:
+        with conn.cursor() as cursor:
+            cursor.execute(statement, params)
+            return cursor.fetchall()
+
+
+@replica_read
+def search_clients(query, limit=SEARCH_LIMIT):
+    """Ищет клиентов по ФИО или телефону: [(full_name, phone), ...]."""
+    return _search('clients', ('full_name', 'phone'), query, limit)
+
+
+@replica_read
+def search_employees(query, limit=SEARCH_LIMIT):
+    """Ищет тренеров по ФИО или телефону:
+    [(full_name, phone, specialization, passport, birthday), ...]."""
+    return _search('employees', ('full_name', 'phone', 'specialization', 'passport', 'birthday'), query, limit)
+
+
 # Функции для работы с таблицей price_list (прайс-лист)
 
+PRICE_LIST = Query('price_list', "SELECT id, membership_type, price FROM kurs_2.price_list ORDER BY id;", PriceItem)
+TICKET_TYPES = Query('ticket_types', "SELECT membership_type FROM kurs_2.price_list ORDER BY id;")
+
+
+@cached('price_list')
 def get_price_list():
     """Получает список всех цен."""
-    with closing(get_connection()) as conn:
+    with get_connection() as conn:
         with conn.cursor() as cursor:
-            cursor.execute("SELECT * FROM kurs_2.price_list ORDER BY id;")
-            return cursor.fetchall()
+            return PRICE_LIST.all(cursor)
 
 
+@invalidates('price_list')
 def add_price_list(membership_type, price):
     """Добавляет новоый абонемент."""
-    with closing(get_connection()) as conn:
+    with get_connection() as conn:
         with conn.cursor() as cursor:
             cursor.execute(
                 "INSERT INTO kurs_2.price_list (membership_type, price) VALUES (%s, %s)",
                 (membership_type, price))
+            cache.publish_changes(cursor)
             conn.commit()
 
 
+UPDATE_TICKET_PRICE_SQL = "UPDATE kurs_2.price_list SET price = %s WHERE membership_type = %s;"
+
+
+@invalidates('price_list')
 def update_ticket_price(membership_type, new_price):
     with get_connection() as conn:
         with conn.cursor() as cursor:
-            cursor.execute(
-                "UPDATE kurs_2.price_list SET price = %s WHERE membership_type = %s;",
-                (new_price, membership_type)
-            )
+            cursor.execute(UPDATE_TICKET_PRICE_SQL, (new_price, membership_type))
+            cache.publish_changes(cursor)
             conn.commit()
 
+@cached('price_list')
 def get_all_ticket_types():
     with get_connection() as conn:
         with conn.cursor() as cursor:
-            cursor.execute("SELECT membership_type FROM kurs_2.price_list ORDER BY id;")
-            return [row[0] for row in cursor.fetchall()]
+            return [row[0] for row in TICKET_TYPES.all(cursor)]
 
 # Функции для работы с таблицей schedule (расписание)
 
+# Порядковый номер дня недели для сортировки расписания.
+# Выражение повторено в индексе schedule_day_number_idx (sql/0009_access_paths.sql):
+# при изменении здесь нужна миграция с новым индексом.
+DAY_NUMBER_SQL = """
+    CASE day_of_week
+        WHEN 'Пн' THEN 1
+        WHEN 'Вт' THEN 2
+        WHEN 'Ср' THEN 3
+        WHEN 'Чт' THEN 4
+        WHEN 'Пт' THEN 5
+        WHEN 'Сб' THEN 6
+        WHEN 'Вс' THEN 7
+    END"""
+
+
+SCHEDULE = Query('schedule', """
+    SELECT %s FROM kurs_2.schedule
+    ORDER BY %s, start_time;  -- Дополнительно сортируем по времени начала занятия
+""" % (SCHEDULE_COLUMNS, DAY_NUMBER_SQL), ScheduleItem)
+# day_number нужен только для ключа страницы, наружу его не отдаём
+SCHEDULE_FIRST_PAGE = Query('schedule_first_page', """
+    SELECT %s, %s AS day_number FROM kurs_2.schedule
+    ORDER BY day_number, start_time, id
+    LIMIT %%s;
+""" % (SCHEDULE_COLUMNS, DAY_NUMBER_SQL))
+SCHEDULE_PAGE_AFTER = Query('schedule_page_after', """
+    SELECT %s, %s AS day_number FROM kurs_2.schedule
+    WHERE (%s, start_time, id) > (%%s, %%s, %%s)
+    ORDER BY day_number, start_time, id
+    LIMIT %%s;
+""" % (SCHEDULE_COLUMNS, DAY_NUMBER_SQL, DAY_NUMBER_SQL))
+
+
+@cached('schedule')
 def get_schedule():
-    """Получает расписание всех занятий."""
-    with closing(get_connection()) as conn:
+    """Получает расписание всех занятий.
+
+    Запись, отмена и перевод из листа ожидания версию schedule не меняют:
+    иначе каждая запись сериализовалась бы на строке table_versions и
+    сбрасывала кэш всех воркеров. Поэтому free_spots здесь могут отставать
+    на время записей до TTL кэша; текущие места — в schedule_index и live,
+    и страницы с местами (/client_schedule, чат) берут их оттуда.
+    """
+    with get_connection() as conn:
         with conn.cursor() as cursor:
-            cursor.execute("""
-                            SELECT * FROM kurs_2.schedule
-                            ORDER BY 
-                                CASE day_of_week
-                                    WHEN 'Пн' THEN 1
-                                    WHEN 'Вт' THEN 2
-                                    WHEN 'Ср' THEN 3
-                                    WHEN 'Чт' THEN 4
-                                    WHEN 'Пт' THEN 5
-                                    WHEN 'Сб' THEN 6
-                                    WHEN 'Вс' THEN 7
-                                END,
-                                start_time;  -- Дополнительно сортируем по времени начала занятия
-                        """)
-            return cursor.fetchall()
+            return SCHEDULE.all(cursor)
+
+
+@replica_read
+def get_schedule_page(after=None, limit=PAGE_SIZE):
+    """Страница расписания в порядке (день недели, start_time, id) после ключа after.
+
+    Возвращает (строки, ключ для следующей страницы или None).
+    """
+    limit = page_size(limit)
+    with get_connection() as conn:
+        with conn.cursor() as cursor:
+            if after:
+                rows = SCHEDULE_PAGE_AFTER.all(cursor, (int(after[0]), after[1], int(after[2]), limit + 1))
+            else:
+                rows = SCHEDULE_FIRST_PAGE.all(cursor, (limit + 1,))
+    has_more = len(rows) > limit
+    last = rows[limit - 1] if has_more else None
+    rows = [ScheduleItem._make(row[:-1]) for row in rows[:limit]]
+    if has_more:
+        return rows, (last[-1], last[2], last[0])
+    return rows, None
 
+
+def iter_schedule():
+    """Всё расписание потоком через серверный курсор."""
+    return stream_rows("""
+        SELECT * FROM kurs_2.schedule
+        ORDER BY %s, start_time, id;
+    """ % DAY_NUMBER_SQL)
+
+@invalidates('schedule')
 def add_schedule(day_of_week, start_time, duration, specialization, instructor_name, free_spots):
-    """Добавляет новое расписание занятия."""
-    with closing(get_connection()) as conn:
+    """Добавляет новое расписание занятия.
+
+    conflicts.ScheduleConflict, если у тренера в это время уже есть занятие.
+    """
+    with get_connection() as conn:
         with conn.cursor() as cursor:
+            conflicts.guard(cursor, [(1, {'day_of_week': day_of_week, 'start_time': start_time,
+                                          'duration': duration, 'instructor_name': instructor_name})],
+                           replaces=False)
             cursor.execute("""
                             INSERT INTO kurs_2.schedule (day_of_week, start_time, duration, specialization, instructor_name, free_spots)
                             VALUES (%s, %s, %s, %s, %s, %s);
                         """, (day_of_week, start_time, duration, specialization, instructor_name, free_spots))
+            cache.publish_changes(cursor)
             conn.commit()
 
+@invalidates('schedule')
 def update_free_spots(schedule_id, new_free_spots):
-    """Обновляет количество свободных мест на занятии по его ID."""
-    with closing(get_connection()) as conn:
+    """Обновляет количество свободных мест на занятии по его ID.
+
+    Правка администратора редкая, поэтому версия schedule меняется (в
+    отличие от записи и отмены, см. get_schedule).
+    """
+    with get_connection() as conn:
         with conn.cursor() as cursor:
             cursor.execute("""
                 UPDATE kurs_2.schedule SET free_spots = %s WHERE id = %s;
             """, (new_free_spots, schedule_id))
+            live.publish(cursor, {schedule_id: new_free_spots})
+            cache.publish_changes(cursor)
             conn.commit()
 
 
-def book_schedule_spot(schedule_id):
-    """Уменьшить количество свободных мест на занятии"""
+# Результаты записи на занятие
+BOOKED = 'booked'                  # место забронировано
+ALREADY_BOOKED = 'already_booked'  # клиент уже записан на это занятие в эту дату
+NO_SPOTS = 'no_spots'              # мест нет или занятия не существует
+
+# Ближайшая дата занятия с нужным днём недели, начиная с сегодняшней
+NEXT_CLASS_DATE_SQL = """
+    current_date + (%s - EXTRACT(ISODOW FROM current_date)::int + 7) %%%% 7""" % DAY_NUMBER_SQL
+
+# Одна запись = один запрос к БД: строки расписания блокируются в порядке id
+# (без взаимных блокировок при пакетной записи), регистрация вставляется
+# идемпотентно по (client_id, schedule_id, date_class), а места уменьшаются
+# только для реально вставленных регистраций. Если date_class не передана,
+# берётся ближайшая дата занятия. Пока у занятия есть лист ожидания,
+# освободившиеся места достаются очереди, а не новым запросам: проверка —
+# один шаг по частичному индексу, сколько бы человек ни ждало.
+# Требует уникального ограничения из sql/0002_booking.sql и таблицы из sql/0005_waitlist.sql.
+BOOK_SPOTS_SQL = """
+    WITH target AS (
+        SELECT id, COALESCE(%%(date_class)s::date, %s) AS date_class
+        FROM kurs_2.schedule s
+        WHERE id = ANY(%%(schedule_ids)s::int[]) AND free_spots > 0
+          AND NOT EXISTS (SELECT 1 FROM kurs_2.waitlist w
+                          WHERE w.schedule_id = s.id AND w.status = 'waiting'
+                            AND w.date_class >= current_date)
+        ORDER BY id
+        FOR UPDATE
+    ), reg AS (
+        INSERT INTO kurs_2.registrations (client_id, schedule_id, date_class)
+        SELECT %%(client_id)s, id, date_class FROM target
+        ON CONFLICT (client_id, schedule_id, date_class) DO NOTHING
+        RETURNING schedule_id
+    ), spot AS (
+        UPDATE kurs_2.schedule SET free_spots = free_spots - 1
+        WHERE id IN (SELECT schedule_id FROM reg) AND free_spots > 0
+        RETURNING id, free_spots
+    )
+    SELECT r.id, t.id IS NOT NULL, g.schedule_id IS NOT NULL, s.free_spots
+    FROM unnest(%%(schedule_ids)s::int[]) AS r(id)
+    LEFT JOIN target t ON t.id = r.id
+    LEFT JOIN reg g ON g.schedule_id = r.id
+    LEFT JOIN spot s ON s.id = r.id;
+""" % NEXT_CLASS_DATE_SQL
+
+
+def book_schedule_spots(client_id, schedule_ids, date_class=None):
+    """Записывает клиента сразу на несколько занятий одним запросом.
+
+    Возвращает словарь {schedule_id: BOOKED | ALREADY_BOOKED | NO_SPOTS}.
+    Повторная запись на то же занятие в ту же дату места не расходует.
+    """
+    schedule_ids = sorted({int(schedule_id) for schedule_id in schedule_ids})
+    if not schedule_ids:
+        return {}
+
     with get_connection() as conn:
         with conn.cursor() as cursor:
-            # Проверяем, есть ли свободные места
-            cursor.execute("SELECT free_spots FROM kurs_2.schedule WHERE id = %s", (schedule_id,))
-            result = cursor.fetchone()
+            cursor.execute(BOOK_SPOTS_SQL, {
+                'client_id': client_id,
+                'schedule_ids': schedule_ids,
+                'date_class': date_class,
+            })
+            results = {}
+            spots = {}
+            for schedule_id, has_spot, inserted, free_spots in cursor.fetchall():
+                if inserted:
+                    results[schedule_id] = BOOKED
+                    spots[schedule_id] = free_spots
+                elif has_spot:
+                    results[schedule_id] = ALREADY_BOOKED
+                else:
+                    results[schedule_id] = NO_SPOTS
+            live.publish(cursor, spots)
+            return results
+
+
+def book_schedule_spot(schedule_id, client_id, date_class=None):
+    """Записывает клиента на занятие, уменьшая количество свободных мест."""
+    return book_schedule_spots(client_id, [schedule_id], date_class)[int(schedule_id)]
+
+
+def cancel_registration(client_id, schedule_id, date_class):
+    """Отменяет запись клиента и возвращает место; True, если запись была.
+
+    Освободившееся место подхватит фоновый перевод из листа ожидания (waitlist.py).
+    """
+    with get_connection() as conn:
+        with conn.cursor() as cursor:
+            cursor.execute("""
+                WITH gone AS (
+                    DELETE FROM kurs_2.registrations
+                    WHERE client_id = %s AND schedule_id = %s AND date_class = %s
+                    RETURNING schedule_id
+                )
+                UPDATE kurs_2.schedule SET free_spots = free_spots + 1
+                WHERE id IN (SELECT schedule_id FROM gone)
+                RETURNING id, free_spots;
+            """, (client_id, schedule_id, date_class))
+            row = cursor.fetchone()
+            if row is None:
+                return False
+            live.publish(cursor, {row[0]: row[1]})
+            return True
+
 
-            if result and result[0] > 0:
+# Функции для работы с листом ожидания (sql/0005_waitlist.sql)
+
+# Сколько ожидающих переводить в записи одним запросом
+WAITLIST_BATCH = 100
+
+
+def enqueue_waitlist(client_id, schedule_ids, date_class=None):
+    """Ставит клиента в очередь на занятия, на которые не хватило мест.
+
+    Уже записанных и уже стоящих в очереди повторно не добавляет.
+    Возвращает места в очереди {schedule_id: позиция} по всем очередям клиента.
+    """
+    schedule_ids = sorted({int(schedule_id) for schedule_id in schedule_ids})
+    if schedule_ids:
+        with get_connection() as conn:
+            with conn.cursor() as cursor:
                 cursor.execute("""
-                    UPDATE kurs_2.schedule
-                    SET free_spots = free_spots - 1
-                    WHERE id = %s
-                """, (schedule_id,))
-                return True
-            return False
+                    INSERT INTO kurs_2.waitlist (client_id, schedule_id, date_class)
+                    SELECT %%(client_id)s, s.id, t.date_class
+                    FROM kurs_2.schedule s,
+                         LATERAL (SELECT COALESCE(%%(date_class)s::date, %s) AS date_class) t
+                    WHERE s.id = ANY(%%(schedule_ids)s::int[])
+                      AND NOT EXISTS (SELECT 1 FROM kurs_2.registrations r
+                                      WHERE r.client_id = %%(client_id)s AND r.schedule_id = s.id
+                                        AND r.date_class = t.date_class)
+                    ON CONFLICT DO NOTHING;
+                """ % NEXT_CLASS_DATE_SQL, {
+                    'client_id': client_id,
+                    'schedule_ids': schedule_ids,
+                    'date_class': date_class,
+                })
+    return get_waitlist_positions(client_id)
+
+
+WAITLIST_POSITIONS = Query('waitlist_positions', """
+    SELECT w.schedule_id,
+           (SELECT count(*) FROM kurs_2.waitlist o
+            WHERE o.schedule_id = w.schedule_id AND o.status = 'waiting' AND o.id <= w.id)
+    FROM kurs_2.waitlist w
+    WHERE w.client_id = %s AND w.status = 'waiting';
+""")
+
+
+@replica_read
+def get_waitlist_positions(client_id):
+    """Места клиента в очередях {schedule_id: позиция}, начиная с 1.
+
+    Позиция — число ожидающих с меньшим id на том же занятии; считается
+    по частичному индексу waitlist_schedule_fifo_idx, без чтения таблицы.
+    """
+    with get_connection() as conn:
+        with conn.cursor() as cursor:
+            return dict(WAITLIST_POSITIONS.all(cursor, (client_id,)))
+
+
+def leave_waitlist(client_id, schedule_id):
+    """Убирает клиента из очереди на занятие; True, если он там был."""
+    with get_connection() as conn:
+        with conn.cursor() as cursor:
+            cursor.execute("""
+                UPDATE kurs_2.waitlist SET status = 'cancelled'
+                WHERE client_id = %s AND schedule_id = %s AND status = 'waiting';
+            """, (client_id, schedule_id))
+            return cursor.rowcount > 0
+
+
+def expire_waitlist():
+    """Помечает 'expired' ожидающих на уже прошедшие даты; возвращает их число.
+
+    Запись и перевод такие строки и так пропускают (date_class >= current_date),
+    а без статуса они оставались бы в очередях и в местах клиентов.
+    """
+    with get_connection() as conn:
+        with conn.cursor() as cursor:
+            cursor.execute("""
+                UPDATE kurs_2.waitlist SET status = 'expired'
+                WHERE status = 'waiting' AND date_class < current_date;
+            """)
+            return cursor.rowcount
+
+
+def waitlisted_schedules():
+    """id занятий, где есть и ожидающие, и свободные места."""
+    with get_connection() as conn:
+        with conn.cursor() as cursor:
+            cursor.execute("""
+                SELECT s.id FROM kurs_2.schedule s
+                WHERE s.free_spots > 0
+                  AND EXISTS (SELECT 1 FROM kurs_2.waitlist w
+                              WHERE w.schedule_id = s.id AND w.status = 'waiting'
+                                AND w.date_class >= current_date)
+                ORDER BY s.id;
+            """)
+            return [row[0] for row in cursor.fetchall()]
+
+
+# Перевод из очереди в записи: строка расписания блокируется так же, как при
+# обычной записи, первые min(free_spots, batch) ожидающих по id становятся
+# регистрациями, места списываются только за реально вставленные строки.
+PROMOTE_WAITLIST_SQL = """
+    WITH target AS (
+        SELECT id, free_spots FROM kurs_2.schedule
+        WHERE id = %(schedule_id)s AND free_spots > 0
+        FOR UPDATE
+    ), batch AS (
+        SELECT w.id, w.client_id, w.schedule_id, w.date_class
+        FROM kurs_2.waitlist w
+        WHERE w.schedule_id = (SELECT id FROM target) AND w.status = 'waiting'
+          AND w.date_class >= current_date
+        ORDER BY w.id
+        LIMIT LEAST((SELECT free_spots FROM target), %(batch)s)
+        FOR UPDATE SKIP LOCKED
+    ), reg AS (
+        INSERT INTO kurs_2.registrations (client_id, schedule_id, date_class)
+        SELECT client_id, schedule_id, date_class FROM batch
+        ON CONFLICT (client_id, schedule_id, date_class) DO NOTHING
+        RETURNING client_id
+    ), promoted AS (
+        UPDATE kurs_2.waitlist SET status = 'promoted', promoted_at = now()
+        WHERE id IN (SELECT id FROM batch)
+        RETURNING id
+    ), spot AS (
+        UPDATE kurs_2.schedule SET free_spots = free_spots - (SELECT count(*) FROM reg)
+        WHERE id = (SELECT id FROM target)
+        RETURNING free_spots
+    )
+    SELECT (SELECT count(*) FROM promoted), (SELECT free_spots FROM spot);
+"""
+
 
+def promote_waitlist(schedule_id, batch=WAITLIST_BATCH):
+    """Переводит одну партию ожидающих на занятие в записи.
 
+    Возвращает, сколько строк очереди обработано (0 — очередь пуста или мест нет).
+    """
+    with get_connection() as conn:
+        with conn.cursor() as cursor:
+            cursor.execute(PROMOTE_WAITLIST_SQL, {'schedule_id': schedule_id, 'batch': batch})
+            promoted, free_spots = cursor.fetchone()
+            if promoted:
+                live.publish(cursor, {schedule_id: free_spots})
+    return promoted
+
+
+SCHEDULE_DAY = Query('schedule_day', """
+    SELECT %s FROM kurs_2.schedule
+    WHERE day_of_week = %%s
+    ORDER BY start_time, id;
+""" % SCHEDULE_COLUMNS, ScheduleItem)
+
+
+@replica_read
 def get_filtered_schedule(day=None):
+    """Расписание, при day — только на этот день; дни по порядку недели, а не по алфавиту.
+
+    На фильтры страницы расписания отвечает индекс в памяти (schedule_index.py),
+    эта функция — тот же результат запросом к БД.
+    """
     with get_connection() as conn:
         with conn.cursor() as cursor:
             if day:
-                cursor.execute("""
-                    SELECT * FROM kurs_2.schedule
-                    WHERE day_of_week = %s
-                    ORDER BY day_of_week, start_time
-                """, (day,))
-            else:
-                cursor.execute("""
-                    SELECT * FROM kurs_2.schedule
-                    ORDER BY day_of_week, start_time
-                """)
-            return cursor.fetchall()
-
+                return SCHEDULE_DAY.all(cursor, (day,))
+            cursor.execute("""
+                SELECT %s FROM kurs_2.schedule
+                ORDER BY %s, start_time, id
+            """ % (SCHEDULE_COLUMNS, DAY_NUMBER_SQL))
+            return [ScheduleItem._make(row) for row in cursor.fetchall()]
 
 
 # Функции для работы с лк клиента
 
-def get_client_attendance(client_id):
+DASHBOARD_MONTHS = 12     # месяцев в помесячной статистике кабинета
+STREAK_WEEKS = 104        # дальше серия недель не считается
+
+
+DASHBOARD_TOTALS = Query('dashboard_totals', """
+    SELECT classes, attended FROM kurs_2.client_stats WHERE client_id = %s;
+""")
+DASHBOARD_MONTHS_STATS = Query('dashboard_months', """
+    SELECT month, classes, attended FROM kurs_2.client_monthly_stats
+    WHERE client_id = %s AND month > date_trunc('month', current_date) - make_interval(months => %s)
+      AND classes > 0
+    ORDER BY month DESC;
+""")
+DASHBOARD_FAVOURITE = Query('dashboard_favourite', """
+    SELECT instructor_name FROM kurs_2.client_instructor_stats
+    WHERE client_id = %s AND attended > 0
+    ORDER BY attended DESC, instructor_name
+    LIMIT 1;
+""")
+DASHBOARD_WEEKS = Query('dashboard_weeks', """
+    SELECT (date_trunc('week', current_date)::date - week) / 7 FROM kurs_2.client_weekly_stats
+    WHERE client_id = %s AND attended > 0 AND week <= current_date
+    ORDER BY week DESC
+    LIMIT %s;
+""")
+
+
+@replica_read
+def get_client_dashboard(client_id):
+    """Сводка кабинета из агрегатов sql/0008_dashboard.sql: объём работы не зависит от длины истории.
+
+    Возвращает словарь: classes, attended, months [(месяц, записей, посещено)]
+    за последние DASHBOARD_MONTHS месяцев, favourite_instructor (или None)
+    и streak_weeks — сколько недель подряд, включая текущую или прошлую, были посещения.
+    """
     with get_connection() as conn:
-        with conn.cursor() as cur:
-            cur.execute("""
-                SELECT r.date_class, s.day_of_week, s.start_time, s.specialization, s.instructor_name, r.attended
-                FROM kurs_2.registrations r
-                JOIN kurs_2.schedule s ON r.schedule_id = s.id
-                WHERE r.client_id = %s
-                ORDER BY s.start_time DESC;
-            """, (client_id,))
-            return cur.fetchall()
+        with conn.cursor() as cursor:
+            totals = DASHBOARD_TOTALS.one(cursor, (client_id,)) or (0, 0)
+            months = DASHBOARD_MONTHS_STATS.all(cursor, (client_id, DASHBOARD_MONTHS))
+            favourite = DASHBOARD_FAVOURITE.one(cursor, (client_id,))
+            weeks_ago = [row[0] for row in DASHBOARD_WEEKS.all(cursor, (client_id, STREAK_WEEKS))]
+    return {
+        'classes': totals[0],
+        'attended': totals[1],
+        'months': months,
+        'favourite_instructor': favourite[0] if favourite else None,
+        'streak_weeks': streak_length(weeks_ago),
+    }
+
+
+def streak_length(weeks_ago):
+    """Длина серии по номерам недель с посещениями (0 — текущая), отсортированным по возрастанию.
+
+    Текущая неделя ещё не закончилась, поэтому серия может начинаться и с прошлой.
+    """
+    if not weeks_ago or weeks_ago[0] > 1:
+        return 0
+    streak = 1
+    for previous, week in zip(weeks_ago, weeks_ago[1:]):
+        if week != previous + 1:
+            break
+        streak += 1
+    return streak
+
+
+CLIENT_HISTORY_SQL = """
+    SELECT r.date_class, s.day_of_week, s.start_time, s.specialization, s.instructor_name, r.attended, r.id
+    FROM kurs_2.registrations r
+    JOIN kurs_2.schedule s ON r.schedule_id = s.id
+    WHERE r.client_id = %%s %s
+    ORDER BY r.date_class DESC, r.id DESC
+    LIMIT %%s;
+"""
+CLIENT_HISTORY_FIRST_PAGE = Query('client_history_first_page', CLIENT_HISTORY_SQL % "")
+CLIENT_HISTORY_PAGE_AFTER = Query('client_history_page_after',
+                                  CLIENT_HISTORY_SQL % "AND (r.date_class, r.id) < (%s, %s)")
+
+
+@replica_read
+def get_client_history_page(client_id, after=None, limit=PAGE_SIZE):
+    """Страница посещений клиента от новых к старым, ключ страницы — (date_class, id).
+
+    Возвращает (строки, ключ для следующей страницы или None).
+    """
+    limit = page_size(limit)
+    with get_connection() as conn:
+        with conn.cursor() as cursor:
+            if after:
+                rows = CLIENT_HISTORY_PAGE_AFTER.all(cursor, (client_id, after[0], int(after[1]), limit + 1))
+            else:
+                rows = CLIENT_HISTORY_FIRST_PAGE.all(cursor, (client_id, limit + 1))
+    has_more = len(rows) > limit
+    last = rows[limit - 1] if has_more else None
+    rows = [AttendanceItem._make(row[:-1]) for row in rows[:limit]]
+    if has_more:
+        return rows, (last[0], last[-1])
+    return rows, None
+
+
+# Асинхронные двойники для режима ASGI (asgi.py). SQL и записи — те же
+# объекты Query, кэш у get_schedule и get_schedule_async общий.
+
+@cache.cached_async(get_schedule)
+async def get_schedule_async():
+    async with get_async_connection() as conn:
+        async with conn.cursor() as cursor:
+            return await SCHEDULE.aall(cursor)
+
+
+async def get_schedule_page_async(after=None, limit=PAGE_SIZE):
+    limit = page_size(limit)
+    async with get_async_connection() as conn:
+        async with conn.cursor() as cursor:
+            if after:
+                rows = await SCHEDULE_PAGE_AFTER.aall(cursor, (int(after[0]), after[1], int(after[2]), limit + 1))
+            else:
+                rows = await SCHEDULE_FIRST_PAGE.aall(cursor, (limit + 1,))
+    has_more = len(rows) > limit
+    last = rows[limit - 1] if has_more else None
+    rows = [ScheduleItem._make(row[:-1]) for row in rows[:limit]]
+    if has_more:
+        return rows, (last[-1], last[2], last[0])
+    return rows, None
+
+
+@cache.cached_async(get_price_list)
+async def get_price_list_async():
+    async with get_async_connection() as conn:
+        async with conn.cursor() as cursor:
+            return await PRICE_LIST.aall(cursor)
+
+
+@cache.cached_async(get_employees)
+async def get_employees_async():
+    async with get_async_connection() as conn:
+        async with conn.cursor() as cursor:
+            return await EMPLOYEES.aall(cursor)
+
+
+async def get_client_by_phone_async(phone):
+    async with get_async_connection() as conn:
+        async with conn.cursor() as cursor:
+            return await CLIENT_ACCOUNT_BY_PHONE.aone(cursor, (phone,))
+
+
+async def get_waitlist_positions_async(client_id):
+    async with get_async_connection() as conn:
+        async with conn.cursor() as cursor:
+            return dict(await WAITLIST_POSITIONS.aall(cursor, (client_id,)))
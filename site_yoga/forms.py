@@ -1,7 +1,47 @@
+from flask import url_for
 from flask_wtf import FlaskForm
 from wtforms import StringField, IntegerField, SelectField, PasswordField, SubmitField
-from wtforms.validators import DataRequired, Length, NumberRange, Regexp, EqualTo
-from site_yoga.db import get_connection
+from wtforms.validators import DataRequired, Length, NumberRange, Regexp, EqualTo, ValidationError
+from wtforms.widgets import TextInput
+from db import cached, get_employees, client_name_exists
+from schedule_index import parse_time
+
+
+@cached('employees')
+def employee_choices():
+    """Варианты для выбора тренера; берутся из кэша get_employees, без отдельного запроса."""
+    employees = get_employees()
+    return [(employee[1], employee[1]) for employee in employees] if employees else [('', 'Нет тренеров')]
+
+
+class Exists:
+    """Проверяет наличие значения в БД точечным запросом вместо списка всех вариантов."""
+
+    def __init__(self, check, message="Запись не найдена"):
+        self.check = check
+        self.message = message
+
+    def __call__(self, form, field):
+        if field.data and not self.check(field.data):
+            raise ValidationError(self.message)
+
+
+class TypeaheadInput(TextInput):
+    """Поле ввода с подсказками: варианты подгружаются по мере набора (static/typeahead.js).
+
+    fill — какие поля ответа подставить в одноимённые поля формы при выборе.
+    """
+
+    def __init__(self, endpoint, fill=()):
+        super().__init__()
+        self.endpoint = endpoint
+        self.fill = fill
+
+    def __call__(self, field, **kwargs):
+        kwargs.setdefault('autocomplete', 'off')
+        kwargs.setdefault('data-typeahead-url', url_for(self.endpoint))
+        kwargs.setdefault('data-typeahead-fill', ','.join(self.fill))
+        return super().__call__(field, **kwargs)
 
 
 class ClientRegisterForm(FlaskForm):
@@ -39,15 +79,7 @@ class EmployeeFormChanges(FlaskForm):
 
     def __init__(self, *args, **kwargs):
         super(EmployeeFormChanges, self).__init__(*args, **kwargs)
-        self.full_name.choices = self.get_employees()
-
-    def get_employees(self):
-        """Получаем список тренеров из базы данных"""
-        with get_connection() as conn:
-            with conn.cursor() as cursor:
-                cursor.execute("SELECT full_name FROM kurs_2.employees ORDER BY full_name ASC;")
-                employees = cursor.fetchall()  # [(Имя1,), (Имя2,)]
-                return [(employee[0], employee[0], employee[0], employee[0], employee[0]) for employee in employees] if employees else [('', 'Нет тренеров')]
+        self.full_name.choices = employee_choices()
 
 
 class PriceForm(FlaskForm):
@@ -59,21 +91,13 @@ class ClientForm(FlaskForm):
     phone = StringField('Телефон', validators=[DataRequired(), Length(min=10, max=15)])
 
 class ClientFormChanges(FlaskForm):
-    full_name = SelectField('Фамилия Имя Отчество клиента', validators=[DataRequired(), Length(min=3, max=100)])
+    # Клиентов может быть очень много, поэтому без списка всех имён:
+    # подсказки приходят из /search_clients, а имя проверяется запросом по индексу
+    full_name = StringField('Фамилия Имя Отчество клиента', validators=[
+        DataRequired(), Length(min=3, max=100), Exists(client_name_exists, message="Такого клиента нет")
+    ], widget=TypeaheadInput('search_clients', fill=('phone',)))
     phone = StringField('Телефон', validators=[DataRequired(), Length(min=10, max=15)])
 
-    def __init__(self, *args, **kwargs):
-        super(ClientFormChanges, self).__init__(*args, **kwargs)
-        self.full_name.choices = self.get_clients()
-
-    def get_clients(self):
-        """Получаем список клиентов из базы данных"""
-        with get_connection() as conn:
-            with conn.cursor() as cursor:
-                cursor.execute("SELECT full_name FROM kurs_2.clients ORDER BY full_name ASC;")
-                clients = cursor.fetchall()  # [(Имя1,), (Имя2,)]
-                return [(client[0], client[0]) for client in clients] if clients else [('', 'Нет клиентов')]
-
 class ScheduleForm(FlaskForm):
     day_of_week = SelectField('День недели', choices=[
         ('Пн', 'Понедельник'),
@@ -89,7 +113,7 @@ class ScheduleForm(FlaskForm):
     duration = SelectField('Продолжительность', choices=[
         (60, '60 минут'),
         (90, '90 минут')
-    ], validators=[DataRequired()])
+    ], coerce=int, validators=[DataRequired()])
 
     specialization = SelectField('Специализация', choices=[
         ('Хатха-йога', 'Хатха-йога'),
@@ -108,13 +132,11 @@ class ScheduleForm(FlaskForm):
 
     def __init__(self, *args, **kwargs):
         super(ScheduleForm, self).__init__(*args, **kwargs)
-        self.instructor_name.choices = self.get_instructors()
-
-    def get_instructors(self):
-        """Получаем список тренеров из базы данных"""
-        with get_connection() as conn:
-            with conn.cursor() as cursor:
-                cursor.execute("SELECT full_name FROM kurs_2.employees ORDER BY full_name ASC;")
-                instructors = cursor.fetchall()  # [(Имя1,), (Имя2,)]
-                return [(instr[0], instr[0]) for instr in instructors] if instructors else [('', 'Нет тренеров')]
-
+        self.instructor_name.choices = employee_choices()
+
+    def validate_start_time(self, field):
+        # Пересечения с другими занятиями проверяет conflicts.py, ему нужно настоящее время
+        try:
+            parse_time(field.data)
+        except ValueError:
+            raise ValidationError("Время в формате ЧЧ:ММ")
@@ -0,0 +1,172 @@
+"""Кэш фрагментов шаблонов: готовый HTML блока по версиям таблиц, из которых он построен.
+
+    {% cache 'index_trainers', 'employees' %}
+        {% for emploee in emploees() %} ... {% endfor %}
+    {% endcache %}
+
+Первый аргумент — имя фрагмента (none — не кэшировать), остальные —
+таблицы. Вариант страницы дописывается к имени через двоеточие
+('client_schedule:' ~ фильтры): статистика ведётся по части до него.
+Необязательные version=... (строка, от которой ещё зависит блок, кроме
+таблиц) и shared=false (не класть в общий слой: например, если вариантов
+имени столько, сколько разных запросов пользователей) идут последними.
+Ключ — имя, версии таблиц из kurs_2.table_versions (cache.table_versions)
+и версия сборки, поэтому сбрасывать ничего не нужно: после записи ключ
+просто становится другим, а старые записи вытесняются LRU. Чтобы при попадании не выполнялись и
+запросы, маршрут передаёт в шаблон функции (get_employees), а не их
+результат, и блок вызывает их сам.
+
+HTML хранится в LRU процесса (cache.TTLCache). При shared = True промах
+в процессе проверяется ещё и в UNLOGGED-таблице kurs_2.fragments
+(sql/0010_fragments.sql): фрагмент, отрисованный одним воркером, достаётся
+остальным одним запросом по первичному ключу вместо запросов и рендера.
+
+Пока версии таблиц ненадёжны (слушатель уведомлений не подключён), блоки
+рендерятся как обычно. Попадания и промахи по каждому фрагменту — в
+stats(), на /cache_stats и /metrics.
+"""
+import logging
+import threading
+
+import psycopg2
+from jinja2 import nodes
+from jinja2.ext import Extension
+from markupsafe import Markup
+
+import cache
+import httpcache
+import metrics
+
+logger = logging.getLogger(__name__)
+
+# Настройки; переопределяются через app.config['FRAGMENT_CACHE'] в init_app
+FRAGMENT_CONFIG = {
+    'enabled': True,
+    'maxsize': 512,       # фрагментов в памяти процесса
+    'ttl': 3600,          # подстраховка: ключи и так меняются вместе с данными
+    'shared': False,      # общий для воркеров слой в kurs_2.fragments
+}
+
+_local = None
+_stats = {}               # имя фрагмента без варианта -> [попадания, промахи, в обход кэша]
+_stats_lock = threading.Lock()
+
+
+def _count(name, column):
+    group = name.split(':', 1)[0]
+    with _stats_lock:
+        _stats.setdefault(group, [0, 0, 0])[column] += 1
+
+
+def _shared_get(name, versions):
+    import db
+
+    try:
+        with db.get_connection() as conn:
+            with conn.cursor() as cursor:
+                cursor.execute("SELECT html FROM kurs_2.fragments WHERE name = %s AND versions = %s;",
+                               (name, versions))
+                row = cursor.fetchone()
+        return row[0] if row else None
+    except psycopg2.Error:
+        logger.exception("Не удалось прочитать фрагмент %s из общего кэша", name)
+        return None
+
+
+def _shared_set(name, versions, html):
+    import db
+
+    try:
+        with db.get_connection() as conn:
+            with conn.cursor() as cursor:
+                cursor.execute("""
+                    INSERT INTO kurs_2.fragments (name, versions, html) VALUES (%s, %s, %s)
+                    ON CONFLICT (name) DO UPDATE SET versions = EXCLUDED.versions, html = EXCLUDED.html;
+                """, (name, versions, html))
+    except psycopg2.Error:
+        logger.exception("Не удалось сохранить фрагмент %s в общий кэш", name)
+
+
+def fragment(name, tables, render, version=None, shared=True):
+    """HTML фрагмента name: из кэша, если версии tables и version не изменились, иначе render()."""
+    if name is None or _local is None or not FRAGMENT_CONFIG['enabled'] or not httpcache.versions_ready():
+        if name is not None:
+            _count(name, 2)
+        return render()
+
+    versions = repr((httpcache.HTTP_CACHE_CONFIG['build'], cache.table_versions(*tables), version))
+    shared = shared and FRAGMENT_CONFIG['shared']
+    key = (name, versions)
+    html = _local.get(key, None)
+    if html is None and shared:
+        html = _shared_get(name, versions)
+        if html is not None:
+            _local.set(key, html)
+    if html is not None:
+        _count(name, 0)
+        return Markup(html)
+
+    _count(name, 1)
+    html = str(render())
+    _local.set(key, html)
+    if shared:
+        _shared_set(name, versions, html)
+    return Markup(html)
+
+
+class FragmentCacheExtension(Extension):
+    """Тег {% cache имя, таблица, ..., version=..., shared=... %} ... {% endcache %}."""
+
+    tags = {'cache'}
+    options = ('version', 'shared')
+
+    def parse(self, parser):
+        lineno = next(parser.stream).lineno
+        args = [parser.parse_expression()]
+        kwargs = []
+        while parser.stream.skip_if('comma'):
+            if parser.stream.current.type == 'name' and parser.stream.look().type == 'assign':
+                key = parser.stream.expect('name')
+                if key.value not in self.options:
+                    parser.fail("Неизвестный параметр cache: %s" % key.value, key.lineno)
+                next(parser.stream)
+                kwargs.append(nodes.Keyword(key.value, parser.parse_expression()))
+            elif kwargs:
+                parser.fail("Таблицы перечисляются до параметров", lineno)
+            else:
+                args.append(parser.parse_expression())
+        body = parser.parse_statements(('name:endcache',), drop_needle=True)
+        call = self.call_method('_render', [args[0], nodes.List(args[1:])], kwargs)
+        return nodes.CallBlock(call, [], [], body).set_lineno(lineno)
+
+    def _render(self, name, tables, caller, version=None, shared=True):
+        return fragment(name, tables, caller, version, shared)
+
+
+def stats():
+    """{имя: {'hits', 'misses', 'bypassed', 'hit_rate'}} по фрагментам этого процесса."""
+    with _stats_lock:
+        items = {name: list(counts) for name, counts in _stats.items()}
+    report = {}
+    for name, (hits, misses, bypassed) in sorted(items.items()):
+        total = hits + misses
+        report[name] = {'hits': hits, 'misses': misses, 'bypassed': bypassed,
+                        'hit_rate': round(hits / total, 3) if total else None}
+    return report
+
+
+def _collector():
+    report = stats()
+    return (metrics.gauge('yoga_fragment_hits', 'Фрагменты шаблонов из кэша',
+                          {name: item['hits'] for name, item in report.items()}, 'fragment')
+            + metrics.gauge('yoga_fragment_misses', 'Фрагменты шаблонов, отрисованные заново',
+                            {name: item['misses'] for name, item in report.items()}, 'fragment'))
+
+
+def init_app(app):
+    """Подключает тег {% cache %}; настройки из app.config['FRAGMENT_CACHE']."""
+    global _local
+    FRAGMENT_CONFIG.update(app.config.get('FRAGMENT_CACHE', {}))
+    _local = cache.TTLCache('fragments', maxsize=FRAGMENT_CONFIG['maxsize'], ttl=FRAGMENT_CONFIG['ttl'])
+    app.jinja_env.add_extension(FragmentCacheExtension)
+    metrics.register_collector(_collector)
@@ -0,0 +1,55 @@
+"""Настройки gunicorn: приложение загружается один раз в мастере и делится с воркерами.
+
+    gunicorn -c gunicorn.conf.py
+
+С preload_app код и данные модулей остаются в памяти мастера и достаются
+воркерам при fork без копирования (copy-on-write), а новый воркер при
+перезапуске не импортирует всё заново. Соединения с БД и фоновые потоки
+открываются только в воркерах: мастер создаёт приложение с
+DEFER_BACKGROUND, а post_fork запускает потоки в каждом воркере.
+
+Свободные места на /client_schedule здесь обновляются опросом; для потока
+SSE сайт запускается через asgi.py (см. там же).
+
+Метрики воркеров складываются в общий каталог YOGA_METRICS_DIR, и /metrics
+любого воркера отдаёт их сумму (metrics.py); каталог очищается при старте.
+"""
+import gc
+import glob
+import os
+import tempfile
+
+os.environ.setdefault('YOGA_DEFER_BACKGROUND', '1')
+os.environ.setdefault('YOGA_METRICS_DIR', os.path.join(
+    tempfile.gettempdir(), 'yoga-metrics-%s' % os.environ.get('YOGA_BIND', '127.0.0.1:5000').replace(':', '-')))
+
+wsgi_app = 'app:create_app()'
+preload_app = True
+bind = os.environ.get('YOGA_BIND', '127.0.0.1:5000')
+workers = int(os.environ.get('YOGA_WORKERS', 4))
+# Поток на запрос. gevent не годится: psycopg2 без psycogreen блокирует весь
+# воркер, а блокировки модулей (live, cache, pool) создаются в мастере до
+# monkey-patching. Долгих соединений в этом режиме нет: без LIVE_CONFIG['sse']
+# /client_schedule/stream отвечает 204, а страница расписания опрашивает
+# /client_schedule/spots (live.py). Живые обновления через SSE — только в
+# режиме ASGI (uvicorn asgi:app), где подписчик — корутина, а не поток.
+worker_class = os.environ.get('YOGA_WORKER_CLASS', 'gthread')
+threads = int(os.environ.get('YOGA_THREADS', 16))
+
+
+def on_starting(server):
+    # Гистограммы прошлого запуска не должны попасть в сумму нового
+    for path in glob.glob(os.path.join(os.environ['YOGA_METRICS_DIR'], '*.json')):
+        os.remove(path)
+
+
+def when_ready(server):
+    # Объекты, созданные при загрузке, сборщик мусора больше не трогает:
+    # иначе он перепишет их заголовки и страницы памяти перестанут быть общими
+    gc.freeze()
+
+
+def post_fork(server, worker):
+    import app
+
+    app.start_background(server.app.wsgi())
@@ -0,0 +1,123 @@
+"""Условные GET для страниц, которые почти не меняются.
+
+ETag и Last-Modified страницы собираются из версий таблиц, на которых она
+построена. Версии — счётчики kurs_2.table_versions (sql/0006_versions.sql): их
+увеличивает cache.publish при каждой записи через db.py, а воркеры узнают
+новые значения из уведомлений yoga_cache. Поэтому ответ 304 на If-None-Match
+отдаётся по словарю в памяти, без запросов к БД и без рендера шаблона.
+
+Пока слушатель уведомлений не подключён, версии из других воркеров могут
+быть устаревшими — тогда страницы, зависящие от таблиц, отдаются как
+обычно, без ETag. Страницы без таблиц (conditional() без аргументов)
+получают ETag по версии сборки и свой Cache-Control всегда.
+"""
+import hashlib
+import logging
+import os
+from datetime import datetime, timezone
+from functools import wraps
+
+from flask import Response, make_response, request, session
+
+import cache
+import listener
+
+logger = logging.getLogger(__name__)
+
+# Настройки; переопределяются через app.config['HTTP_CACHE'] в init_app
+HTTP_CACHE_CONFIG = {
+    'enabled': True,
+    'build': None,   # меняется при выкладке; по умолчанию — время изменения шаблонов и статики
+}
+
+# Политика по умолчанию: браузер хранит страницу, но каждый раз сверяет ETag
+PRIVATE_REVALIDATE = 'private, no-cache'
+
+_build_time = 0.0
+_loaded = False
+
+
+def _load_versions():
+    """Перечитывает версии после (пере)подключения слушателя."""
+    global _loaded
+    import db
+
+    try:
+        with db.get_connection() as conn:
+            with conn.cursor() as cursor:
+                cache.load_versions(cursor)
+        _loaded = True
+    except Exception:
+        _loaded = False
+        logger.exception("Не удалось загрузить версии таблиц, условные GET отключены")
+
+
+listener.on_reconnect(_load_versions)
+
+
+def versions_ready():
+    """True, если версии таблиц в памяти актуальны (их же использует fragments.py)."""
+    return _loaded and listener.connected()
+
+
+def _active(tables):
+    # Страницам без таблиц (только шаблон) версии не нужны: их ETag — по сборке
+    return HTTP_CACHE_CONFIG['enabled'] and (not tables or versions_ready())
+
+
+def _validators(tables, vary_key):
+    """(ETag, Last-Modified) для текущего URL при текущих версиях tables."""
+    versions = cache.table_versions(*tables)
+    digest = hashlib.blake2b(digest_size=12)
+    digest.update(repr((HTTP_CACHE_CONFIG['build'], request.full_path, versions, vary_key)).encode('utf-8'))
+    last_modified = max([_build_time] + [changed_at for _, changed_at in versions])
+    return digest.hexdigest(), datetime.fromtimestamp(int(last_modified), timezone.utc)
+
+
+def conditional(*tables, cache_control=PRIVATE_REVALIDATE, vary=None):
+    """Декоратор GET-маршрута, страница которого зависит только от tables.
+
+    cache_control — значение заголовка Cache-Control для этого маршрута.
+    vary() возвращает то, от чего ещё зависит страница (состояние входа
+    и т.п.); оно входит в ETag, а If-Modified-Since без ETag для таких
+    страниц не учитывается.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            if session.get('_flashes'):
+                # В странице будут одноразовые flash-сообщения: её нельзя ни кэшировать, ни подтверждать
+                response = make_response(view(*args, **kwargs))
+                response.headers['Cache-Control'] = 'no-store'
+                return response
+            if not _active(tables):
+                return view(*args, **kwargs)
+
+            vary_key = vary() if vary is not None else None
+            etag, last_modified = _validators(tables, vary_key)
+            if request.if_none_match:
+                not_modified = request.if_none_match.contains(etag)
+            else:
+                not_modified = (vary is None and request.if_modified_since is not None
+                                and last_modified <= request.if_modified_since)
+            response = Response(status=304) if not_modified else make_response(view(*args, **kwargs))
+            if response.status_code in (200, 304):
+                response.set_etag(etag)
+                response.last_modified = last_modified
+                response.headers['Cache-Control'] = cache_control
+            return response
+        return wrapper
+    return decorator
+
+
+def init_app(app):
+    """Берёт настройки из app.config; версия сборки по умолчанию — время изменения шаблонов и статики."""
+    global _build_time
+    HTTP_CACHE_CONFIG.update(app.config.get('HTTP_CACHE', {}))
+    template_dir = os.path.join(app.root_path, app.template_folder)
+    paths = [os.path.join(template_dir, name) for name in os.listdir(template_dir)]
+    # Страницы ссылаются на собранную статику по адресам с отпечатками
+    paths.append(os.path.join(app.static_folder, 'dist', 'manifest.json'))
+    _build_time = max((os.path.getmtime(path) for path in paths if os.path.exists(path)), default=0.0)
+    if HTTP_CACHE_CONFIG['build'] is None:
+        HTTP_CACHE_CONFIG['build'] = int(_build_time)
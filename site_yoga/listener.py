@@ -0,0 +1,78 @@
+"""Один LISTEN-соединение на воркер для всех каналов PostgreSQL NOTIFY.
+
+Модули регистрируют обработчики через on_notify(channel, callback), а
+start() поднимает фоновый поток, который слушает все зарегистрированные
+каналы и раздаёт полезную нагрузку уведомлений обработчикам.
+"""
+import logging
+import select
+import threading
+import time
+
+import psycopg2
+
+logger = logging.getLogger(__name__)
+
+_handlers = {}            # канал -> [callback(payload)]
+_reconnect_handlers = []  # вызываются после (пере)подключения: уведомления могли потеряться
+_thread = None
+_connected = threading.Event()
+
+
+def on_notify(channel, callback):
+    _handlers.setdefault(channel, []).append(callback)
+
+
+def on_reconnect(callback):
+    _reconnect_handlers.append(callback)
+
+
+def connected():
+    """True, пока слушатель подключён: без него изменения из других воркеров не видны."""
+    return _connected.is_set()
+
+
+def _dispatch(notify):
+    for callback in _handlers.get(notify.channel, ()):
+        try:
+            callback(notify.payload)
+        except Exception:
+            logger.exception("Ошибка в обработчике уведомления %s", notify.channel)
+
+
+def _listen_forever(dsn_config, poll_interval):
+    while True:
+        conn = None
+        try:
+            conn = psycopg2.connect(**dsn_config)
+            conn.autocommit = True
+            with conn.cursor() as cursor:
+                for channel in _handlers:
+                    cursor.execute("LISTEN %s;" % channel)
+            for callback in _reconnect_handlers:
+                callback()
+            _connected.set()
+            while True:
+                if select.select([conn], [], [], poll_interval) == ([], [], []):
+                    continue
+                conn.poll()
+                while conn.notifies:
+                    _dispatch(conn.notifies.pop(0))
+        except Exception:
+            _connected.clear()
+            logger.exception("Слушатель уведомлений упал, переподключение")
+            time.sleep(poll_interval)
+        finally:
+            if conn is not None:
+                conn.close()
+
+
+def start(dsn_config, poll_interval=5):
+    """Запускает фоновый поток-слушатель. Нужно вызывать в каждом воркере (после fork)."""
+    global _thread
+    if _thread is not None and _thread.is_alive():
+        return _thread
+    _thread = threading.Thread(target=_listen_forever, args=(dsn_config, poll_interval),
+                               name='pg-listener', daemon=True)
+    _thread.start()
+    return _thread
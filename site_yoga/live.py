@@ -0,0 +1,195 @@
+"""Живое обновление свободных мест на /client_schedule (Server-Sent Events).
+
+Запись на занятие и update_free_spots отправляют pg_notify в канал
+yoga_spots с новыми значениями free_spots. В каждом воркере их принимает
+общий слушатель (listener.py) и складывает в кольцевой журнал событий с
+номерами версий. Подписчики не держат своих очередей и потоков чтения:
+каждый помнит только номер последней отданной версии и ждёт на общем
+Condition, пока журнал не продвинется.
+
+В WSGI-воркере (gunicorn gthread) каждый подписчик занимал бы поток, и
+несколько десятков открытых вкладок остановили бы весь сайт. Поэтому поток
+SSE включается только в режиме ASGI (asgi.py, LIVE_CONFIG['sse']): там
+подписчики — корутины astream, которые ждут общего asyncio.Event своего
+цикла событий. В WSGI страница опрашивает /client_schedule/spots раз в
+poll_seconds, а /client_schedule/stream отвечает 204 — по стандарту
+EventSource после этого не переподключается.
+
+Поток живёт не дольше stream_seconds: потом он закрывается, браузер
+переподключается через retry, и сессия клиента проверяется заново — после
+выхода или отзыва сессии обновления перестают приходить.
+"""
+import asyncio
+import json
+import threading
+import time
+import weakref
+from collections import deque
+
+import listener
+
+NOTIFY_CHANNEL = 'yoga_spots'
+
+# Сколько последних изменений помнить; отставшему подписчику уйдёт снимок
+JOURNAL_SIZE = 10000
+# Пустое событие раз в столько секунд, чтобы прокси не рвали соединение
+HEARTBEAT_SECONDS = 15
+
+# Настройки; переопределяются через app.config['LIVE'] в init_app
+LIVE_CONFIG = {
+    'sse': False,           # поток SSE; включает asgi.py, в WSGI подписчик занимал бы поток
+    'stream_seconds': 300,  # сколько держать поток до переподключения (и новой проверки сессии)
+    'poll_seconds': 10,     # период опроса /client_schedule/spots без SSE
+}
+
+
+def publish(cursor, spots):
+    """Отправляет новые значения free_spots {schedule_id: free_spots} после фиксации транзакции."""
+    if spots:
+        cursor.execute("SELECT pg_notify(%s, %s)",
+                       (NOTIFY_CHANNEL, json.dumps({str(k): v for k, v in spots.items()})))
+
+
+class SpotsHub:
+    """Журнал изменений свободных мест одного воркера."""
+
+    def __init__(self, size=JOURNAL_SIZE):
+        self.version = 0
+        self._journal = deque(maxlen=size)  # (версия, schedule_id, free_spots)
+        self._latest = {}                   # schedule_id -> free_spots
+        self._cond = threading.Condition()
+        # цикл asyncio -> Event его подписчиков; закрытый и собранный цикл уходит сам
+        self._loop_events = weakref.WeakKeyDictionary()
+        self.subscribers = 0
+
+    def apply(self, spots):
+        with self._cond:
+            for schedule_id, free_spots in spots.items():
+                self.version += 1
+                self._journal.append((self.version, int(schedule_id), free_spots))
+                self._latest[int(schedule_id)] = free_spots
+            self._cond.notify_all()
+            loops = list(self._loop_events)
+        # apply вызывается из потока слушателя: циклы будим через call_soon_threadsafe
+        for loop in loops:
+            if loop.is_closed():
+                self._forget_loop(loop)
+                continue
+            try:
+                loop.call_soon_threadsafe(self._wake_loop, loop)
+            except RuntimeError:
+                # Цикл закрылся между проверкой и вызовом
+                self._forget_loop(loop)
+
+    def _forget_loop(self, loop):
+        with self._cond:
+            self._loop_events.pop(loop, None)
+
+    def _wake_loop(self, loop):
+        # Выполняется в самом цикле: старое событие будит всех, кто его ждал,
+        # новые ожидания встают на свежее
+        with self._cond:
+            event = self._loop_events.get(loop)
+            self._loop_events[loop] = asyncio.Event()
+        if event is not None:
+            event.set()
+
+    def changes_since(self, version):
+        """Изменения после version: (новая версия, {schedule_id: free_spots})."""
+        with self._cond:
+            return self._changes_since(version)
+
+    def _changes_since(self, version):
+        if version >= self.version:
+            return self.version, {}
+        if not self._journal or self._journal[0][0] > version + 1:
+            # Подписчик отстал сильнее, чем помнит журнал
+            return self.version, dict(self._latest)
+        changes = {}
+        for entry_version, schedule_id, free_spots in reversed(self._journal):
+            if entry_version <= version:
+                break
+            changes.setdefault(schedule_id, free_spots)
+        return self.version, changes
+
+    def wait(self, version, timeout):
+        """Ждёт изменений после version не дольше timeout секунд."""
+        with self._cond:
+            self._cond.wait_for(lambda: self.version > version, timeout)
+            return self._changes_since(version)
+
+    def stream(self, heartbeat=HEARTBEAT_SECONDS, lifetime=None):
+        """Генератор SSE-сообщений для одного подписчика.
+
+        Значения в событиях абсолютные, поэтому первым сообщением подписчик
+        получает всё, что воркер знает об изменениях: это закрывает окно между
+        рендером страницы и подключением, в том числе к другому воркеру.
+        Через lifetime секунд (по умолчанию stream_seconds) поток кончается.
+        """
+        version = 0
+        deadline = time.monotonic() + (lifetime or LIVE_CONFIG['stream_seconds'])
+        with self._cond:
+            self.subscribers += 1
+        try:
+            # Подсказка браузеру, через сколько переподключаться
+            yield 'retry: 3000\n\n'
+            while True:
+                left = deadline - time.monotonic()
+                if left <= 0:
+                    return
+                version, changes = self.wait(version, min(heartbeat, left))
+                if changes:
+                    yield 'id: %d\nevent: spots\ndata: %s\n\n' % (version, json.dumps(changes))
+                else:
+                    yield ': ping %d\n\n' % int(time.time())
+        finally:
+            with self._cond:
+                self.subscribers -= 1
+
+    async def astream(self, heartbeat=HEARTBEAT_SECONDS, lifetime=None):
+        """Асинхронный двойник stream: те же сообщения, без потока на подписчика."""
+        loop = asyncio.get_running_loop()
+        version = 0
+        deadline = time.monotonic() + (lifetime or LIVE_CONFIG['stream_seconds'])
+        with self._cond:
+            self.subscribers += 1
+            self._loop_events.setdefault(loop, asyncio.Event())
+        try:
+            yield 'retry: 3000\n\n'
+            while True:
+                left = deadline - time.monotonic()
+                if left <= 0:
+                    return
+                # Событие берётся до проверки версии, и между ними нет await:
+                # изменение, пришедшее после проверки, разбудит именно его
+                with self._cond:
+                    event = self._loop_events[loop]
+                version, changes = self.changes_since(version)
+                if not changes:
+                    try:
+                        await asyncio.wait_for(event.wait(), min(heartbeat, left))
+                    except asyncio.TimeoutError:
+                        pass
+                    version, changes = self.changes_since(version)
+                if changes:
+                    yield 'id: %d\nevent: spots\ndata: %s\n\n' % (version, json.dumps(changes))
+                else:
+                    yield ': ping %d\n\n' % int(time.time())
+        finally:
+            with self._cond:
+                self.subscribers -= 1
+
+
+hub = SpotsHub()
+
+
+def _on_notify(payload):
+    hub.apply(json.loads(payload))
+
+
+listener.on_notify(NOTIFY_CHANNEL, _on_notify)
+
+
+def init_app(app):
+    """Берёт настройки из app.config['LIVE']."""
+    LIVE_CONFIG.update(app.config.get('LIVE', {}))
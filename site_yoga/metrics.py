@@ -0,0 +1,362 @@
+"""Встроенные метрики: задержка маршрутов, SQL-запросы, ожидание пула, рендер шаблонов.
+
+Всё собирается в памяти процесса и отдаётся в формате Prometheus на /metrics.
+Запросы к БД считаются курсором InstrumentedCursor и подписываются именем
+функции, которая вызвала execute (get_employees, client_name_exists…).
+При app.config['METRICS'] = {'enabled': False} курсор не подменяется, а хуки
+запроса выходят после одной проверки флага.
+
+Воркеров несколько (gunicorn, uvicorn --workers), а /metrics отвечает тот,
+кому достался запрос. Поэтому при заданном shared_dir (YOGA_METRICS_DIR,
+gunicorn.conf.py задаёт его сам) каждый воркер раз в dump_interval секунд
+пишет туда свои гистограммы, а /metrics отдаёт их сумму по всем файлам —
+ряды не скачут между воркерами. Файлы завершившихся воркеров остаются, так
+что счётчики не убывают; каталог очищается при старте мастера. Gauge (пул,
+кэш, очередь хеширования) — состояние ответившего воркера, с меткой worker.
+
+/metrics открыт только с localhost или с заголовком
+Authorization: Bearer <token> (METRICS_CONFIG['token']).
+"""
+import bisect
+import glob
+import hmac
+import json
+import logging
+import os
+import sys
+import threading
+import time
+
+import psycopg2.extensions
+from flask import g, has_app_context, request, template_rendered, before_render_template
+
+logger = logging.getLogger(__name__)
+slow_query_log = logging.getLogger('yoga.slow_query')
+
+# Настройки; переопределяются через app.config в init_app
+METRICS_CONFIG = {
+    'enabled': True,
+    'slow_query_ms': 200,     # None — не писать медленные запросы в лог
+    'server_timing': True,    # добавлять заголовок Server-Timing
+    'shared_dir': os.environ.get('YOGA_METRICS_DIR'),  # каталог для суммы по воркерам; None — только свои
+    'dump_interval': 5,       # секунд между записями гистограмм в shared_dir
+    'token': os.environ.get('YOGA_METRICS_TOKEN'),      # доступ к /metrics не с localhost
+}
+
+# Границы корзин гистограмм, секунды
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+
+class Histogram:
+    """Гистограмма в стиле Prometheus с метками."""
+
+    def __init__(self, name, help_text, label_names, buckets=BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = label_names
+        self.buckets = buckets
+        self._series = {}  # метки -> [счётчики по корзинам..., сумма, количество]
+        self._lock = threading.Lock()
+
+    def observe(self, labels, value):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [0] * (len(self.buckets) + 1) + [0.0, 0]
+            series[index] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    def snapshot(self):
+        with self._lock:
+            return {labels: list(series) for labels, series in self._series.items()}
+
+    def render(self, snapshot=None):
+        """Строки Prometheus; snapshot — ряды вместо собственных (сумма по воркерам)."""
+        lines = ['# HELP %s %s' % (self.name, self.help_text), '# TYPE %s histogram' % self.name]
+        for labels, series in sorted((self.snapshot() if snapshot is None else snapshot).items()):
+            label_text = ','.join('%s="%s"' % (k, _escape(v)) for k, v in zip(self.label_names, labels))
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), series):
+                cumulative += count
+                le = '+Inf' if bound == float('inf') else repr(bound)
+                lines.append('%s_bucket{%s%sle="%s"} %d' % (self.name, label_text, ',' if label_text else '',
+                                                           le, cumulative))
+            suffix = '{%s}' % label_text if label_text else ''
+            lines.append('%s_sum%s %.6f' % (self.name, suffix, series[-2]))
+            lines.append('%s_count%s %d' % (self.name, suffix, series[-1]))
+        return lines
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+REQUEST_LATENCY = Histogram('yoga_request_duration_seconds', 'Время обработки запроса',
+                            ('endpoint', 'method', 'status'))
+QUERY_LATENCY = Histogram('yoga_db_query_duration_seconds', 'Время SQL-запроса по вызывающей функции',
+                          ('function',))
+POOL_WAIT = Histogram('yoga_db_pool_wait_seconds', 'Ожидание соединения из пула', ())
+RENDER_LATENCY = Histogram('yoga_template_render_seconds', 'Время рендера шаблона', ('template',))
+
+HISTOGRAMS = [REQUEST_LATENCY, QUERY_LATENCY, POOL_WAIT, RENDER_LATENCY]
+
+# Дополнительные источники строк для /metrics (кэш, хеширование и т.п.)
+_collectors = []
+
+_thread = None
+
+
+def register_collector(func):
+    """func() возвращает список строк в формате Prometheus."""
+    if func not in _collectors:
+        _collectors.append(func)
+    return func
+
+
+def _request_totals():
+    """Счётчики текущего запроса: [время в БД, число запросов, ожидание пула, рендер]."""
+    if not has_app_context():
+        return None
+    totals = g.get('_metrics')
+    if totals is None:
+        totals = g._metrics = [0.0, 0, 0.0, 0.0]
+    return totals
+
+
+def _caller_name(depth):
+    # Query.all/one/execute (prepared.py) — обёртка: запрос относится к функции, вызвавшей её
+    frame = sys._getframe(depth)
+    while frame.f_back is not None and frame.f_globals.get('__name__') == 'prepared':
+        frame = frame.f_back
+    code = frame.f_code
+    return getattr(code, 'co_qualname', code.co_name)
+
+
+def _record_query(function, elapsed, query):
+    QUERY_LATENCY.observe((function,), elapsed)
+    totals = _request_totals()
+    if totals is not None:
+        totals[0] += elapsed
+        totals[1] += 1
+    threshold = METRICS_CONFIG['slow_query_ms']
+    if threshold is not None and elapsed * 1000 >= threshold:
+        if isinstance(query, bytes):
+            query = query.decode('utf-8', 'replace')
+        slow_query_log.warning("%.1f мс в %s: %s", elapsed * 1000, function, ' '.join(str(query).split()))
+
+
+class InstrumentedCursor(psycopg2.extensions.cursor):
+    """Курсор, замеряющий каждый execute и copy_expert."""
+
+    def execute(self, query, vars=None):
+        function = _caller_name(2)
+        started = time.perf_counter()
+        try:
+            return super().execute(query, vars)
+        finally:
+            _record_query(function, time.perf_counter() - started, query)
+
+    def executemany(self, query, vars_list):
+        function = _caller_name(2)
+        started = time.perf_counter()
+        try:
+            return super().executemany(query, vars_list)
+        finally:
+            _record_query(function, time.perf_counter() - started, query)
+
+    def copy_expert(self, sql, file, size=8192):
+        function = _caller_name(2)
+        started = time.perf_counter()
+        try:
+            return super().copy_expert(sql, file, size)
+        finally:
+            _record_query(function, time.perf_counter() - started, sql)
+
+
+def cursor_factory():
+    """Класс курсора для новых соединений: инструментированный или обычный."""
+    return InstrumentedCursor if METRICS_CONFIG['enabled'] else None
+
+
+def observe_pool_wait(elapsed):
+    if not METRICS_CONFIG['enabled']:
+        return
+    POOL_WAIT.observe((), elapsed)
+    totals = _request_totals()
+    if totals is not None:
+        totals[2] += elapsed
+
+
+def _before_request():
+    if METRICS_CONFIG['enabled']:
+        g._metrics_started = time.perf_counter()
+
+
+def _after_request(response):
+    if not METRICS_CONFIG['enabled']:
+        return response
+    started = g.pop('_metrics_started', None)
+    if started is None:
+        return response
+    elapsed = time.perf_counter() - started
+    endpoint = request.endpoint or 'unknown'
+    REQUEST_LATENCY.observe((endpoint, request.method, str(response.status_code)), elapsed)
+
+    if METRICS_CONFIG['server_timing']:
+        db_time, db_count, pool_time, render_time = g.get('_metrics') or (0.0, 0, 0.0, 0.0)
+        response.headers.add('Server-Timing', ', '.join([
+            'db;dur=%.2f;desc="%d queries"' % (db_time * 1000, db_count),
+            'pool;dur=%.2f' % (pool_time * 1000),
+            'render;dur=%.2f' % (render_time * 1000),
+            'app;dur=%.2f' % (elapsed * 1000),
+        ]))
+    return response
+
+
+def _before_render(sender, template, context, **extra):
+    if METRICS_CONFIG['enabled']:
+        g._metrics_render_started = time.perf_counter()
+
+
+def _after_render(sender, template, context, **extra):
+    started = g.pop('_metrics_render_started', None)
+    if started is None:
+        return
+    elapsed = time.perf_counter() - started
+    RENDER_LATENCY.observe((template.name or 'unknown',), elapsed)
+    totals = _request_totals()
+    totals[3] += elapsed
+
+
+def gauge(name, help_text, values, label_name=None):
+    """Строки для gauge: values — {значение метки: число} или одно число."""
+    lines = ['# HELP %s %s' % (name, help_text), '# TYPE %s gauge' % name]
+    if not isinstance(values, dict):
+        return lines + ['%s %s' % (name, values)]
+    for label, value in sorted(values.items()):
+        lines.append('%s{%s="%s"} %s' % (name, label_name, _escape(label), value))
+    return lines
+
+
+def _app_collector():
+    """Пул соединений, кэш справочников и очередь хеширования."""
+    import auth
+    import cache
+    import db
+
+    lines = []
+    pool = db._pool
+    if pool is not None:
+        lines += gauge('yoga_db_pool_connections', 'Открытые соединения пула', pool._size)
+        lines += gauge('yoga_db_pool_idle_connections', 'Свободные соединения пула', len(pool._idle))
+    cache_stats = cache.stats()
+    lines += gauge('yoga_cache_hits', 'Попадания в кэш',
+                    {name: stats['hits'] for name, stats in cache_stats.items()}, 'cache')
+    lines += gauge('yoga_cache_misses', 'Промахи кэша',
+                    {name: stats['misses'] for name, stats in cache_stats.items()}, 'cache')
+    hash_stats = auth.hash_stats()
+    lines += gauge('yoga_password_hash_in_flight', 'Операции с паролями в очереди и в работе',
+                    hash_stats['in_flight'])
+    lines += gauge('yoga_password_hash_rejected', 'Отклонённые из-за переполнения очереди',
+                    hash_stats['rejected'])
+    return lines
+
+
+def _dump_path():
+    return os.path.join(METRICS_CONFIG['shared_dir'], '%d.json' % os.getpid())
+
+
+def dump():
+    """Пишет гистограммы процесса в shared_dir/<pid>.json; файл заменяется целиком."""
+    data = {histogram.name: [[list(labels), series] for labels, series in histogram.snapshot().items()]
+            for histogram in HISTOGRAMS}
+    path = _dump_path()
+    os.makedirs(METRICS_CONFIG['shared_dir'], exist_ok=True)
+    with open(path + '.tmp', 'w') as file:
+        json.dump(data, file)
+    os.replace(path + '.tmp', path)
+
+
+def _merged():
+    """{имя гистограммы: {метки: ряды}} — сумма файлов всех воркеров из shared_dir."""
+    dump()
+    merged = {histogram.name: {} for histogram in HISTOGRAMS}
+    for path in glob.glob(os.path.join(METRICS_CONFIG['shared_dir'], '*.json')):
+        try:
+            with open(path) as file:
+                data = json.load(file)
+        except (OSError, ValueError):
+            continue  # файл удалили или воркер как раз его пишет
+        for name, items in data.items():
+            target = merged.get(name)
+            if target is None:
+                continue
+            for labels, series in items:
+                total = target.setdefault(tuple(labels), [0] * len(series))
+                for pos, value in enumerate(series):
+                    total[pos] += value
+    return merged
+
+
+def _with_worker(line):
+    # Метка worker для строки-значения gauge: у каждого воркера своё состояние
+    if line.startswith('#'):
+        return line
+    name, rest = line.split(' ', 1)
+    worker = 'worker="%d"' % os.getpid()
+    if name.endswith('}'):
+        return '%s,%s} %s' % (name[:-1], worker, rest)
+    return '%s{%s} %s' % (name, worker, rest)
+
+
+def render_metrics():
+    lines = []
+    if METRICS_CONFIG['shared_dir']:
+        merged = _merged()
+        for histogram in HISTOGRAMS:
+            lines.extend(histogram.render(merged[histogram.name]))
+        for collector in _collectors:
+            lines.extend(_with_worker(line) for line in collector())
+    else:
+        for histogram in HISTOGRAMS:
+            lines.extend(histogram.render())
+        for collector in _collectors:
+            lines.extend(collector())
+    return '\n'.join(lines) + '\n'
+
+
+def allowed(remote_addr, authorization):
+    """Можно ли отдать /metrics: запрос с localhost или с верным Bearer-токеном."""
+    if remote_addr in ('127.0.0.1', '::1'):
+        return True
+    token = METRICS_CONFIG['token']
+    return bool(token) and hmac.compare_digest(authorization or '', 'Bearer %s' % token)
+
+
+def _dump_forever():
+    while True:
+        time.sleep(METRICS_CONFIG['dump_interval'])
+        try:
+            dump()
+        except OSError:
+            logger.exception("Не удалось записать метрики в %s", METRICS_CONFIG['shared_dir'])
+
+
+def start():
+    """Запись гистограмм в shared_dir в этом процессе; без shared_dir поток не нужен."""
+    global _thread
+    if METRICS_CONFIG['enabled'] and METRICS_CONFIG['shared_dir'] and (_thread is None or not _thread.is_alive()):
+        _thread = threading.Thread(target=_dump_forever, name='metrics-dump', daemon=True)
+        _thread.start()
+
+
+def init_app(app):
+    """Подключает хуки замера к приложению. Вызывать до первого запроса к БД."""
+    METRICS_CONFIG.update(app.config.get('METRICS', {}))
+    app.before_request(_before_request)
+    app.after_request(_after_request)
+    template_rendered.connect(_after_render, app)
+    before_render_template.connect(_before_render, app)
+    register_collector(_app_collector)
@@ -0,0 +1,155 @@
+"""Версионированные миграции схемы kurs_2 из каталога sql/.
+
+Миграция — файл sql/NNNN_название.sql, номер задаёт порядок. Применённые
+записываются в kurs_2.schema_migrations вместе с контрольной суммой, каждая
+миграция выполняется в своей транзакции вместе с этой записью. Изменять уже
+применённый файл нельзя: upgrade откажется работать, нужна новая миграция.
+
+    flask schema status          # что применено, что ждёт
+    flask schema upgrade         # применить ожидающие
+    flask schema stamp 8         # БД создана вручную до 0008: отметить 1..8 применёнными
+
+Несколько процессов могут запускать upgrade одновременно: миграции
+выполняет тот, кто первым взял advisory-блокировку.
+"""
+import hashlib
+import re
+from pathlib import Path
+
+import click
+import psycopg2
+
+MIGRATIONS_DIR = Path(__file__).resolve().parent / 'sql'
+MIGRATION_RE = re.compile(r'^(\d{4})_(\w+)\.sql$')
+LOCK_KEY = 0x796f6761  # 'yoga'
+
+
+class MigrationError(Exception):
+    """Каталог миграций не совпадает с тем, что записано в БД."""
+
+
+def discover(directory=MIGRATIONS_DIR):
+    """[(версия, имя, текст, контрольная сумма)] по возрастанию версии."""
+    migrations = []
+    for path in sorted(directory.glob('*.sql')):
+        match = MIGRATION_RE.match(path.name)
+        if not match:
+            raise MigrationError("Имя миграции не по шаблону NNNN_name.sql: %s" % path.name)
+        text = path.read_text(encoding='utf-8')
+        migrations.append((int(match.group(1)), match.group(2), text, hashlib.sha256(text.encode('utf-8')).hexdigest()))
+    versions = [migration[0] for migration in migrations]
+    if len(set(versions)) != len(versions):
+        raise MigrationError("Повторяющиеся номера миграций")
+    return migrations
+
+
+def _ensure_table(cursor):
+    cursor.execute("""
+        CREATE SCHEMA IF NOT EXISTS kurs_2;
+        CREATE TABLE IF NOT EXISTS kurs_2.schema_migrations (
+            version    integer PRIMARY KEY,
+            name       text NOT NULL,
+            checksum   text NOT NULL,
+            applied_at timestamptz NOT NULL DEFAULT now()
+        );
+    """)
+
+
+def applied(conn):
+    """{версия: контрольная сумма} применённых миграций."""
+    with conn.cursor() as cursor:
+        _ensure_table(cursor)
+        cursor.execute("SELECT version, checksum FROM kurs_2.schema_migrations;")
+        rows = dict(cursor.fetchall())
+    conn.commit()
+    return rows
+
+
+def pending(conn, migrations=None):
+    """Миграции, которые ещё не применены; MigrationError, если применённый файл изменён."""
+    migrations = discover() if migrations is None else migrations
+    done = applied(conn)
+    for version, name, _, checksum in migrations:
+        if version in done and done[version] != checksum:
+            raise MigrationError("Миграция %04d_%s изменена после применения" % (version, name))
+    return [migration for migration in migrations if migration[0] not in done]
+
+
+def upgrade(conn, target=None):
+    """Применяет ожидающие миграции до target включительно; возвращает их версии."""
+    with conn.cursor() as cursor:
+        _ensure_table(cursor)
+        cursor.execute("SELECT pg_advisory_lock(%s);", (LOCK_KEY,))
+    conn.commit()
+    try:
+        done = []
+        for version, name, text, checksum in pending(conn):
+            if target is not None and version > target:
+                break
+            with conn.cursor() as cursor:
+                cursor.execute(text)
+                cursor.execute("INSERT INTO kurs_2.schema_migrations (version, name, checksum) VALUES (%s, %s, %s);",
+                               (version, name, checksum))
+            conn.commit()
+            done.append(version)
+        return done
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        with conn.cursor() as cursor:
+            cursor.execute("SELECT pg_advisory_unlock(%s);", (LOCK_KEY,))
+        conn.commit()
+
+
+def stamp(conn, target):
+    """Отмечает миграции до target применёнными, не выполняя их."""
+    rows = [(version, name, checksum) for version, name, _, checksum in pending(conn) if version <= target]
+    with conn.cursor() as cursor:
+        cursor.executemany("INSERT INTO kurs_2.schema_migrations (version, name, checksum) VALUES (%s, %s, %s);", rows)
+    conn.commit()
+    return [row[0] for row in rows]
+
+
+def connect():
+    import db
+
+    return psycopg2.connect(**db.DB_CONFIG)
+
+
+def init_app(app):
+    """Регистрирует команды flask schema status / upgrade / stamp."""
+
+    @app.cli.group('schema')
+    def schema_group():
+        """Миграции схемы kurs_2."""
+
+    @schema_group.command('status')
+    def status_command():
+        """Применённые и ожидающие миграции."""
+        with connect() as conn:
+            done = applied(conn)
+            for version, name, _, checksum in discover():
+                if version not in done:
+                    state = 'ожидает'
+                elif done[version] != checksum:
+                    state = 'ИЗМЕНЕНА'
+                else:
+                    state = 'применена'
+                click.echo("%04d_%-24s %s" % (version, name, state))
+
+    @schema_group.command('upgrade')
+    @click.option('--target', type=int, help='Последняя версия, которую нужно применить.')
+    def upgrade_command(target):
+        """Применяет ожидающие миграции."""
+        with connect() as conn:
+            versions = upgrade(conn, target)
+        click.echo("Применено: %s" % (', '.join('%04d' % v for v in versions) or 'нечего'))
+
+    @schema_group.command('stamp')
+    @click.argument('target', type=int)
+    def stamp_command(target):
+        """Отмечает миграции до TARGET применёнными без выполнения."""
+        with connect() as conn:
+            versions = stamp(conn, target)
+        click.echo("Отмечено: %s" % (', '.join('%04d' % v for v in versions) or 'нечего'))
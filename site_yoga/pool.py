@@ -0,0 +1,132 @@
+import threading
+import time
+
+import psycopg2
+
+
+class PoolError(Exception):
+    """Пул не смог выдать соединение за отведённое время."""
+
+
+class ConnectionPool:
+    """Потокобезопасный пул соединений с PostgreSQL.
+
+    Держит от min_size до max_size соединений, закрывает простаивающие
+    дольше idle_timeout секунд и при выдаче проверяет соединения, которые
+    пролежали в пуле дольше health_check_after секунд.
+    """
+
+    def __init__(self, dsn_config, min_size=1, max_size=10, idle_timeout=300,
+                 checkout_timeout=10, health_check=True, health_check_after=30):
+        self.dsn_config = dsn_config
+        self.min_size = min_size
+        self.max_size = max_size
+        self.idle_timeout = idle_timeout
+        self.checkout_timeout = checkout_timeout
+        self.health_check = health_check
+        self.health_check_after = health_check_after
+
+        self._idle = []  # [(соединение, время возврата в пул)]
+        self._size = 0
+        self._closed = False
+        self._cond = threading.Condition()
+
+    def _connect(self):
+        return psycopg2.connect(**self.dsn_config)
+
+    @staticmethod
+    def _is_alive(conn):
+        """Проверяет, что соединение живо и не оставлено в транзакции."""
+        if conn.closed:
+            return False
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute("SELECT 1")
+            conn.rollback()
+            return True
+        except psycopg2.Error:
+            return False
+
+    def _discard(self, conn):
+        try:
+            conn.close()
+        except psycopg2.Error:
+            pass
+
+    def _prune_idle(self):
+        """Закрывает соединения, простоявшие дольше idle_timeout (под блокировкой)."""
+        if not self.idle_timeout:
+            return
+        deadline = time.monotonic() - self.idle_timeout
+        while len(self._idle) > 0 and self._size > self.min_size and self._idle[0][1] < deadline:
+            conn, _ = self._idle.pop(0)
+            self._size -= 1
+            self._discard(conn)
+
+    def getconn(self):
+        """Выдаёт соединение из пула, при необходимости открывая новое."""
+        deadline = time.monotonic() + self.checkout_timeout
+        while True:
+            with self._cond:
+                if self._closed:
+                    raise PoolError("Пул соединений закрыт")
+                self._prune_idle()
+                if self._idle:
+                    conn, returned_at = self._idle.pop()
+                elif self._size < self.max_size:
+                    self._size += 1
+                    conn = None
+                else:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        raise PoolError("Нет свободных соединений в пуле")
+                    self._cond.wait(remaining)
+                    continue
+
+            if conn is None:
+                try:
+                    return self._connect()
+                except Exception:
+                    with self._cond:
+                        self._size -= 1
+                        self._cond.notify()
+                    raise
+
+            if not conn.closed and (
+                    not self.health_check
+                    or time.monotonic() - returned_at < self.health_check_after
+                    or self._is_alive(conn)):
+                return conn
+
+            # Соединение умерло, пока лежало в пуле, — заменяем его новым
+            self._discard(conn)
+            with self._cond:
+                self._size -= 1
+                self._cond.notify()
+
+    def putconn(self, conn, close=False):
+        """Возвращает соединение в пул."""
+        if not close and not conn.closed:
+            try:
+                if conn.status != psycopg2.extensions.STATUS_READY:
+                    conn.rollback()
+            except psycopg2.Error:
+                close = True
+
+        with self._cond:
+            if close or conn.closed or self._closed:
+                self._size -= 1
+                self._discard(conn)
+            else:
+                self._idle.append((conn, time.monotonic()))
+            self._cond.notify()
+
+    def closeall(self):
+        """Закрывает все соединения и запрещает выдачу новых."""
+        with self._cond:
+            self._closed = True
+            for conn, _ in self._idle:
+                self._discard(conn)
+            self._size -= len(self._idle)
+            self._idle = []
+            self._cond.notify_all()
@@ -0,0 +1,92 @@
+"""Подготовленные на сервере запросы и записи-кортежи для результатов.
+
+Query описывает запрос один раз, на уровне модуля. При первом выполнении на
+соединении пула он отправляет PREPARE, дальше — только EXECUTE с
+параметрами: PostgreSQL не разбирает текст заново, а после нескольких
+выполнений берёт общий план и не планирует запрос на каждый вызов.
+Соединения пула создаются классом PreparingConnection, который помнит,
+какие запросы на нём уже подготовлены.
+
+Строки возвращаются как namedtuple: индексы в шаблонах (employee[1])
+работают по-прежнему, а в коде можно писать user.password.
+
+Те же объекты Query выполняются и асинхронно (aall/aone) на соединениях
+psycopg 3 — так асинхронные двойники функций db.py не дублируют SQL.
+
+С пулером в режиме транзакций (pgbouncer transaction pooling) подготовленные
+запросы не работают — для такой установки ENABLED = False.
+"""
+import re
+from collections import namedtuple
+
+import psycopg2.extensions
+
+ENABLED = True
+
+_PLACEHOLDER_RE = re.compile(r'%s|%%')
+
+
+class PreparingConnection(psycopg2.extensions.connection):
+    """Соединение, которое помнит имена подготовленных на нём запросов."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.prepared = set()
+
+
+def record(name, fields):
+    """Тип записи для строк запроса; поля через пробел, в порядке столбцов SELECT."""
+    return namedtuple(name, fields)
+
+
+class Query:
+    """Запрос с параметрами %s, который выполняется через PREPARE/EXECUTE."""
+
+    def __init__(self, name, statement, row=None):
+        self.name = name
+        self.statement = statement
+        self.row = row
+        numbers = iter(range(1, statement.count('%s') + 1))
+        server_text = _PLACEHOLDER_RE.sub(lambda m: '$%d' % next(numbers) if m.group() == '%s' else '%', statement)
+        self.prepare_sql = 'PREPARE %s AS %s' % (name, server_text.strip().rstrip(';'))
+        count = statement.count('%s')
+        self.execute_sql = 'EXECUTE %s (%s)' % (name, ', '.join(['%s'] * count)) if count else 'EXECUTE %s' % name
+
+    def execute(self, cursor, params=()):
+        conn = cursor.connection
+        prepared = getattr(conn, 'prepared', None)
+        if not ENABLED or prepared is None:
+            cursor.execute(self.statement, params)
+            return cursor
+        if self.name not in prepared:
+            # Мимо замеров курсора (metrics.InstrumentedCursor): разовый PREPARE — не запрос функции
+            psycopg2.extensions.cursor.execute(cursor, self.prepare_sql)
+            prepared.add(self.name)
+        cursor.execute(self.execute_sql, params)
+        return cursor
+
+    def _wrap(self, row):
+        return self.row._make(row) if self.row is not None and row is not None else row
+
+    def all(self, cursor, params=()):
+        rows = self.execute(cursor, params).fetchall()
+        if self.row is None:
+            return rows
+        return [self.row._make(row) for row in rows]
+
+    def one(self, cursor, params=()):
+        return self._wrap(self.execute(cursor, params).fetchone())
+
+    # Асинхронный режим (asgi.py, курсор psycopg 3): драйвер сам готовит
+    # запрос на соединении и помнит это, достаточно передать prepare=True
+
+    async def aall(self, cursor, params=()):
+        await cursor.execute(self.statement, params, prepare=ENABLED)
+        rows = await cursor.fetchall()
+        if self.row is None:
+            return rows
+        return [self.row._make(row) for row in rows]
+
+    async def aone(self, cursor, params=()):
+        await cursor.execute(self.statement, params, prepare=ENABLED)
+        return self._wrap(await cursor.fetchone())
@@ -0,0 +1,214 @@
+"""Чтение с реплик: функции db.py с @replica_read идут на реплики, остальное — на основной сервер.
+
+Реплики задаются в app.config['DB_REPLICAS']['dsns'] — список словарей,
+которые дополняют db.DB_CONFIG (обычно достаточно host/port). У каждой реплики
+свой пул соединений, запрос получает реплику с наименьшим числом выданных
+соединений.
+
+Фоновый поток раз в check_interval секунд проверяет реплики и меряет
+отставание воспроизведения WAL. Недоступная реплика или реплика, отставшая
+больше чем на max_lag секунд, не используется, пока не догонит; если
+подходящих нет, чтение идёт на основной сервер.
+
+Читать свои записи: запросы, изменяющие данные (не GET), читают только с
+основного сервера, а после успешного такого запроса сессия вошедшего
+пользователя на pin_seconds закрепляется за основным сервером — так клиент
+сразу видит свою запись или бронь, даже если реплика ещё не догнала.
+
+Второй DSN без репликации (тот же сервер на другом порту, pgbouncer)
+тоже подходит: pg_is_in_recovery() там false, и отставание считается нулевым.
+"""
+import itertools
+import logging
+import os
+import threading
+import time
+
+import psycopg2
+from flask import has_request_context, request, session
+
+import metrics
+import prepared
+from pool import ConnectionPool, PoolError
+
+logger = logging.getLogger(__name__)
+
+# Настройки; переопределяются через app.config['DB_REPLICAS'] в init_app
+REPLICA_CONFIG = {
+    'dsns': [],                # [{'host': ..., 'port': ...}] поверх db.DB_CONFIG
+    'max_lag': 5.0,            # секунд отставания, после которых реплика не используется
+    'check_interval': 2.0,     # секунд между проверками
+    'pin_seconds': 5.0,        # сколько после записи читать сессии с основного сервера
+    'pool': {'min_size': 0, 'max_size': 10},
+}
+
+PIN_KEY = '_primary_until'
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+LAG_SQL = """
+    SELECT CASE
+        WHEN NOT pg_is_in_recovery() THEN 0
+        WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+        ELSE coalesce(extract(epoch FROM now() - pg_last_xact_replay_timestamp()), 0)
+    END::float8
+"""
+
+
+class Replica:
+    """Одна реплика: пул, состояние последней проверки и число выданных соединений."""
+
+    def __init__(self, name, dsn_config):
+        self.name = name
+        self.dsn_config = dsn_config
+        self.healthy = False       # до первой проверки реплика не используется
+        self.lag = None
+        self.checked_at = None
+        self.in_use = 0
+        self._pool = None
+        self._pool_pid = None
+        self._lock = threading.Lock()
+
+    def pool(self):
+        if self._pool is None or self._pool_pid != os.getpid():
+            # Пул мастер-процесса воркеру не годится, закрывать его тоже нельзя
+            self._pool = ConnectionPool(self.dsn_config, **dict(REPLICA_CONFIG['pool'],
+                                                                checkout_timeout=1))
+            self._pool_pid = os.getpid()
+        return self._pool
+
+    def usable(self):
+        return self.healthy and self.lag is not None and self.lag <= REPLICA_CONFIG['max_lag']
+
+    def getconn(self):
+        conn = self.pool().getconn()
+        with self._lock:
+            self.in_use += 1
+        return conn
+
+    def putconn(self, conn, close=False):
+        with self._lock:
+            self.in_use -= 1
+        self.pool().putconn(conn, close=close or bool(conn.closed))
+
+    def check(self):
+        """Проверяет доступность и отставание; результат — в healthy и lag."""
+        try:
+            conn = self.pool().getconn()
+        except (psycopg2.Error, PoolError):
+            self.mark_down()
+            return
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute(LAG_SQL)
+                self.lag = cursor.fetchone()[0]
+            conn.rollback()
+            self.healthy = True
+        except psycopg2.Error:
+            self.mark_down()
+            conn.close()
+        finally:
+            self.pool().putconn(conn)
+            self.checked_at = time.time()
+
+    def mark_down(self):
+        if self.healthy:
+            logger.warning("Реплика %s недоступна, чтение идёт на основной сервер", self.name)
+        self.healthy = False
+
+    def status(self):
+        return {'name': self.name, 'healthy': self.healthy, 'lag': self.lag,
+                'in_use': self.in_use, 'checked_at': self.checked_at}
+
+
+class Router:
+    """Выбирает реплику для чтения."""
+
+    def __init__(self, replicas=()):
+        self.replicas = list(replicas)
+        self.fallbacks = 0         # чтений, ушедших на основной сервер из-за реплик
+        self._turn = itertools.count()
+
+    def choose(self):
+        """Наименее загруженная годная реплика или None; при равенстве — по очереди."""
+        usable = [replica for replica in self.replicas if replica.usable()]
+        if not usable:
+            self.fallbacks += 1
+            return None
+        start = next(self._turn) % len(usable)
+        ordered = usable[start:] + usable[:start]
+        return min(ordered, key=lambda replica: replica.in_use)
+
+    def check_all(self):
+        for replica in self.replicas:
+            replica.check()
+
+    def status(self):
+        return [replica.status() for replica in self.replicas]
+
+
+router = Router()
+
+
+def wants_replica():
+    """Можно ли отправить чтение на реплику прямо сейчас (вызывает db.get_connection)."""
+    if not router.replicas:
+        return False
+    if not has_request_context():
+        return True
+    if request.method not in SAFE_METHODS:
+        return False
+    return session.get(PIN_KEY, 0) <= time.time()
+
+
+def _pin_after_write(response):
+    # Анонимным посетителям сессию ради закрепления не заводим
+    if request.method not in SAFE_METHODS and response.status_code < 400 and session.get('logged_in'):
+        session[PIN_KEY] = time.time() + REPLICA_CONFIG['pin_seconds']
+    return response
+
+
+def _collector():
+    replicas = {replica.name: replica for replica in router.replicas}
+    return (metrics.gauge('yoga_db_replica_healthy', 'Реплика доступна',
+                          {name: int(r.healthy) for name, r in replicas.items()}, 'replica')
+            + metrics.gauge('yoga_db_replica_lag_seconds', 'Отставание реплики по последней проверке',
+                            {name: r.lag if r.lag is not None else -1 for name, r in replicas.items()}, 'replica')
+            + metrics.gauge('yoga_db_replica_in_use', 'Выданные соединения реплики',
+                            {name: r.in_use for name, r in replicas.items()}, 'replica')
+            + metrics.gauge('yoga_db_replica_fallbacks', 'Чтения на основном сервере из-за недоступных реплик',
+                            router.fallbacks))
+
+
+_thread = None
+
+
+def _check_forever():
+    while True:
+        try:
+            router.check_all()
+        except Exception:
+            logger.exception("Не удалось проверить реплики")
+        time.sleep(REPLICA_CONFIG['check_interval'])
+
+
+def start():
+    """Проверка реплик в этом процессе; без реплик поток не нужен."""
+    global _thread
+    if router.replicas and (_thread is None or not _thread.is_alive()):
+        _thread = threading.Thread(target=_check_forever, name='replica-checker', daemon=True)
+        _thread.start()
+
+
+def init_app(app):
+    """Настраивает реплики из app.config['DB_REPLICAS'] и закрепление сессий после записи."""
+    import db
+
+    global router
+    REPLICA_CONFIG.update(app.config.get('DB_REPLICAS', {}))
+    router = Router(
+        Replica('replica%d' % n, dict(db.DB_CONFIG, **dsn, cursor_factory=metrics.cursor_factory(),
+                                      connection_factory=prepared.PreparingConnection))
+        for n, dsn in enumerate(REPLICA_CONFIG['dsns'], 1))
+    app.after_request(_pin_after_write)
+    if router.replicas:
+        metrics.register_collector(_collector)
@@ -0,0 +1,294 @@
+"""Индекс расписания в памяти: фильтры по дню, времени, тренеру, направлению и местам без запросов к БД.
+
+kurs_2.schedule читается целиком один раз. Снимок (Snapshot) хранит строки
+в порядке показа (день недели, время, id), столбцы — в массивах array, а
+для каждого измерения — битовые маски строк (целые Python): маска на каждый
+день, тренера и направление, маска «есть свободные места» и маски «начало
+раньше t» для каждого встречающегося времени. Любая комбинация фильтров —
+это несколько AND/OR над масками, а порядок битов уже совпадает с порядком
+показа.
+
+Изменения приходят из триггера sql/0011_schedule_changes.sql в канал
+yoga_schedule вместе с самими строками. Изменение одних только free_spots
+(запись на занятие, отмена) меняет массив мест и одну маску, прочие
+изменения пересобирают снимок из строк в памяти. Запросов к БД при этом
+нет. Перечитывание таблицы нужно только по {"reload": true}, после
+переподключения слушателя и, пока он не подключён, раз в stale_after секунд.
+
+Снимки не изменяются: фоновый поток собирает новый и подменяет ссылку,
+запросы читают ту, что была в момент обращения.
+"""
+import bisect
+import hashlib
+import json
+import logging
+import threading
+import time
+from array import array
+from datetime import datetime, time as dtime
+
+import listener
+
+logger = logging.getLogger(__name__)
+
+NOTIFY_CHANNEL = 'yoga_schedule'
+
+# Порядок дней как в db.DAY_NUMBER_SQL
+DAYS = ('Пн', 'Вт', 'Ср', 'Чт', 'Пт', 'Сб', 'Вс')
+
+# Настройки; переопределяются через app.config['SCHEDULE_INDEX'] в init_app
+INDEX_CONFIG = {
+    'stale_after': 60,    # секунд, после которых снимок перечитывается, пока слушатель не подключён
+}
+
+_generations = iter(range(1, 1 << 62))
+
+
+def _minutes(value):
+    return value.hour * 60 + value.minute
+
+
+def _bits(mask):
+    """Номера установленных битов по возрастанию."""
+    while mask:
+        low = mask & -mask
+        yield low.bit_length() - 1
+        mask ^= low
+
+
+def _sort_key(row):
+    day = DAYS.index(row.day_of_week) if row.day_of_week in DAYS else len(DAYS)
+    return day, row.start_time, row.id
+
+
+class Snapshot:
+    """Неизменяемый снимок расписания с масками по измерениям."""
+
+    def __init__(self, rows):
+        self.generation = next(_generations)
+        self.rows = sorted(rows, key=_sort_key)
+        self.position = {row.id: pos for pos, row in enumerate(self.rows)}
+        self.minutes = array('H', (_minutes(row.start_time) for row in self.rows))
+        self.free_spots = array('l', (row.free_spots for row in self.rows))
+        self.all = (1 << len(self.rows)) - 1
+
+        self.by_day, self.by_instructor, self.by_specialization = {}, {}, {}
+        self.with_spots = 0
+        by_minute = {}
+        for pos, row in enumerate(self.rows):
+            bit = 1 << pos
+            by_minute[self.minutes[pos]] = by_minute.get(self.minutes[pos], 0) | bit
+            self.by_day[row.day_of_week] = self.by_day.get(row.day_of_week, 0) | bit
+            self.by_instructor[row.instructor_name] = self.by_instructor.get(row.instructor_name, 0) | bit
+            self.by_specialization[row.specialization] = self.by_specialization.get(row.specialization, 0) | bit
+            if row.free_spots > 0:
+                self.with_spots |= bit
+
+        # times[i] — i-е по возрастанию время начала, before[i] — строки, начинающиеся раньше него
+        self.times = sorted(by_minute)
+        self.before = [0]
+        for minute in self.times:
+            self.before.append(self.before[-1] | by_minute[minute])
+
+        # Отпечаток всего, кроме free_spots: у одинаковых данных он одинаков во всех воркерах
+        self._layout_digest = hashlib.blake2b(
+            repr([row._replace(free_spots=None) for row in self.rows]).encode('utf-8'), digest_size=16).digest()
+        self._content_key = None
+
+    def content_key(self):
+        """Отпечаток содержимого снимка вместе с free_spots (для ключей кэша фрагментов).
+
+        В отличие от generation, не зависит от процесса и от того, сколько
+        изменений снимок пережил: совпадает у всех воркеров с одинаковыми данными.
+        """
+        if self._content_key is None:
+            self._content_key = hashlib.blake2b(self._layout_digest + self.free_spots.tobytes(),
+                                                digest_size=16).hexdigest()
+        return self._content_key
+
+    def with_free_spots(self, changes):
+        """Копия снимка с новыми free_spots {id: значение}; маски остальных измерений общие."""
+        snapshot = object.__new__(Snapshot)
+        snapshot.__dict__.update(self.__dict__)
+        snapshot.generation = next(_generations)
+        snapshot.rows = list(self.rows)
+        snapshot.free_spots = array('l', self.free_spots)
+        snapshot._content_key = None
+        for schedule_id, free_spots in changes.items():
+            pos = self.position[schedule_id]
+            snapshot.rows[pos] = snapshot.rows[pos]._replace(free_spots=free_spots)
+            snapshot.free_spots[pos] = free_spots
+            if free_spots > 0:
+                snapshot.with_spots |= 1 << pos
+            else:
+                snapshot.with_spots &= ~(1 << pos)
+        return snapshot
+
+    def _any_of(self, index, values):
+        mask = 0
+        for value in values:
+            mask |= index.get(value, 0)
+        return mask
+
+    def _starting_before(self, minute, inclusive=False):
+        find = bisect.bisect_right if inclusive else bisect.bisect_left
+        return self.before[find(self.times, minute)]
+
+    def mask(self, day=(), instructor=(), specialization=(), time_from=None, time_to=None, has_spots=False):
+        """Маска строк, подходящих под все фильтры; внутри одного измерения значения — через ИЛИ."""
+        mask = self.all
+        if day:
+            mask &= self._any_of(self.by_day, day)
+        if instructor:
+            mask &= self._any_of(self.by_instructor, instructor)
+        if specialization:
+            mask &= self._any_of(self.by_specialization, specialization)
+        if time_from is not None:
+            mask &= ~self._starting_before(_minutes(time_from))
+        if time_to is not None:
+            mask &= self._starting_before(_minutes(time_to), inclusive=True)
+        if has_spots:
+            mask &= self.with_spots
+        return mask
+
+    def query(self, limit=None, **filters):
+        """Подходящие строки (db.ScheduleItem) в порядке показа."""
+        rows = []
+        for pos in _bits(self.mask(**filters)):
+            if limit is not None and len(rows) >= limit:
+                break
+            rows.append(self.rows[pos])
+        return rows
+
+    def count(self, **filters):
+        return bin(self.mask(**filters)).count('1')
+
+    def options(self):
+        """Значения для выпадающих списков фильтра."""
+        return {
+            'days': [day for day in DAYS if day in self.by_day],
+            'instructors': sorted(self.by_instructor),
+            'specializations': sorted(self.by_specialization),
+        }
+
+
+def _row_from_json(item):
+    import db
+
+    return db.ScheduleItem(
+        item['id'], item['day_of_week'], dtime.fromisoformat(item['start_time']), item['duration'],
+        item['specialization'], item['instructor_name'], item['free_spots'])
+
+
+class ScheduleIndex:
+    """Текущий снимок расписания процесса и его обновление по уведомлениям."""
+
+    def __init__(self):
+        self._snapshot = None
+        self._loaded_at = 0.0
+        self._lock = threading.Lock()
+        self.reloads = 0
+        self.updates = 0
+
+    def snapshot(self):
+        snapshot = self._snapshot
+        if snapshot is None or (not listener.connected()
+                                and time.monotonic() - self._loaded_at > INDEX_CONFIG['stale_after']):
+            snapshot = self.reload()
+        return snapshot
+
+    def reload(self):
+        """Перечитывает таблицу целиком."""
+        import db
+
+        with self._lock:
+            with db.get_connection() as conn:
+                with conn.cursor() as cursor:
+                    rows = db.SCHEDULE.all(cursor)
+            self._snapshot = Snapshot(rows)
+            self._loaded_at = time.monotonic()
+            self.reloads += 1
+            return self._snapshot
+
+    def forget(self):
+        """Следующий запрос перечитает таблицу."""
+        with self._lock:
+            self._snapshot = None
+
+    def apply(self, change):
+        """Применяет уведомление {'upsert': [строки], 'delete': [id]} или {'reload': true}."""
+        if change.get('reload'):
+            self.forget()
+            return
+        upserts = [_row_from_json(item) for item in change.get('upsert', ())]
+        deleted = set(change.get('delete', ()))
+        with self._lock:
+            current = self._snapshot
+            if current is None:
+                return  # ещё не загружен: первый запрос прочитает всё сразу
+            self.updates += 1
+            if not deleted and all(row.id in current.position and
+                                   current.rows[current.position[row.id]]._replace(free_spots=row.free_spots) == row
+                                   for row in upserts):
+                self._snapshot = current.with_free_spots({row.id: row.free_spots for row in upserts})
+                return
+            rows = {row.id: row for row in current.rows}
+            for schedule_id in deleted:
+                rows.pop(schedule_id, None)
+            rows.update((row.id, row) for row in upserts)
+            self._snapshot = Snapshot(rows.values())
+
+    def stats(self):
+        snapshot = self._snapshot
+        return {'rows': len(snapshot.rows) if snapshot else None, 'generation': snapshot.generation if snapshot else None,
+                'reloads': self.reloads, 'updates': self.updates}
+
+
+index = ScheduleIndex()
+
+
+def parse_time(value):
+    """datetime.time из 'ЧЧ:ММ' или 'ЧЧ:ММ:СС' (час можно одной цифрой); ValueError иначе."""
+    value = str(value).strip()
+    return datetime.strptime(value, '%H:%M:%S' if value.count(':') == 2 else '%H:%M').time()
+
+
+def parse_filters(args):
+    """Фильтры из параметров запроса (day, instructor, specialization — можно повторять;
+    from, to — ЧЧ:ММ; has_spots=1). ValueError для неверного времени."""
+    filters = {
+        'day': tuple(value for value in args.getlist('day') if value),
+        'instructor': tuple(value for value in args.getlist('instructor') if value),
+        'specialization': tuple(value for value in args.getlist('specialization') if value),
+        'time_from': None,
+        'time_to': None,
+        'has_spots': args.get('has_spots') in ('1', 'on', 'true'),
+    }
+    for name, arg in (('time_from', 'from'), ('time_to', 'to')):
+        if args.get(arg):
+            filters[name] = parse_time(args[arg])
+    return filters
+
+
+def filters_key(filters):
+    """Строка, однозначно описывающая набор фильтров (для ключа кэша фрагментов)."""
+    return json.dumps([sorted(filters['day']), sorted(filters['instructor']), sorted(filters['specialization']),
+                       str(filters['time_from']), str(filters['time_to']), filters['has_spots']],
+                      ensure_ascii=False)
+
+
+def _on_notify(payload):
+    try:
+        index.apply(json.loads(payload))
+    except (ValueError, KeyError):
+        logger.exception("Не удалось применить изменение расписания, индекс будет перечитан")
+        index.forget()
+
+
+listener.on_notify(NOTIFY_CHANNEL, _on_notify)
+# Пока слушатель не работал, уведомления могли потеряться
+listener.on_reconnect(index.forget)
+
+
+def init_app(app):
+    INDEX_CONFIG.update(app.config.get('SCHEDULE_INDEX', {}))
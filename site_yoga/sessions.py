@@ -0,0 +1,333 @@
+"""Серверные сессии: в cookie только случайный id, данные — в хранилище.
+
+Хранилище выбирается через app.config['SESSION_STORE']['backend']:
+* 'postgres' — UNLOGGED-таблица kurs_2.sessions (sql/0007_sessions.sql), общая для
+  всех воркеров; просроченные строки удаляет фоновый поток пачками;
+* 'memory'   — LRU в памяти процесса: для разработки и одного воркера.
+
+Id сессии — 32 случайных символа, подпись ему не нужна, поэтому запрос
+не тратит время на HMAC. Данные читаются лениво, при первом обращении к
+session: маршрут, который сессию не трогает, в хранилище не ходит. Чтобы
+шаблонам не приходилось загружать сессию ради get_flashed_messages, в cookie
+есть признак ожидающих flash-сообщений (суффикс .f).
+
+session.clear() выдаёт новый id (старая запись удаляется): так вход
+защищён от фиксации сессии, а выход не оставляет старых ключей.
+revoke_client(client_id) завершает все сессии клиента разом.
+"""
+import json
+import logging
+import re
+import secrets
+import threading
+import time
+from collections import OrderedDict
+
+from flask.sessions import SessionInterface, SessionMixin
+
+logger = logging.getLogger(__name__)
+
+# Настройки; переопределяются через app.config['SESSION_STORE'] в init_app
+SESSION_CONFIG = {
+    'backend': 'postgres',
+    'maxsize': 100000,         # сессий в памяти процесса (backend 'memory')
+    'sweep_interval': 300,     # секунд между чистками просроченных (backend 'postgres')
+    'sweep_batch': 1000,       # строк за один DELETE
+}
+
+SID_LENGTH = 32
+SID_RE = re.compile(r'^[A-Za-z0-9_-]{%d}$' % SID_LENGTH)
+FLASHES_SUFFIX = '.f'
+
+
+def new_sid():
+    return secrets.token_urlsafe(SID_LENGTH * 3 // 4)
+
+
+class ServerSession(SessionMixin):
+    """Сессия, которая загружается из хранилища при первом обращении."""
+
+    def __init__(self, store, sid=None, has_flashes=False):
+        self.store = store
+        self.sid = sid
+        self.has_flashes = has_flashes
+        self.expires_at = None
+        self.modified = False
+        self.accessed = False
+        self.rotate = False
+        self._data = None
+
+    @property
+    def loaded(self):
+        return self._data is not None
+
+    def _load(self):
+        if self._data is None:
+            self.accessed = True
+            record = self.store.load(self.sid) if self.sid else None
+            if record is None:
+                self._data = {}
+                self.sid = None
+            else:
+                self._data, self.expires_at = record
+        return self._data
+
+    def _no_flashes(self, key):
+        # Flask проверяет flash-сообщения на каждой странице; признак в cookie избавляет от загрузки
+        return key == '_flashes' and self._data is None and not self.has_flashes
+
+    def __getitem__(self, key):
+        if self._no_flashes(key):
+            raise KeyError(key)
+        return self._load()[key]
+
+    def __setitem__(self, key, value):
+        self._load()[key] = value
+        self.modified = True
+
+    def __delitem__(self, key):
+        del self._load()[key]
+        self.modified = True
+
+    def __contains__(self, key):
+        return not self._no_flashes(key) and key in self._load()
+
+    def __iter__(self):
+        return iter(self._load())
+
+    def __len__(self):
+        return len(self._load())
+
+    def get(self, key, default=None):
+        if self._no_flashes(key):
+            return default
+        return self._load().get(key, default)
+
+    def clear(self):
+        self._data = {}
+        self.accessed = self.modified = self.rotate = True
+
+
+class MemoryStore:
+    """LRU сессий в памяти процесса."""
+
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self._data = OrderedDict()  # sid -> (данные в JSON, срок годности)
+        self._lock = threading.Lock()
+
+    def load(self, sid):
+        with self._lock:
+            item = self._data.get(sid)
+            if item is None:
+                return None
+            if item[1] <= time.time():
+                del self._data[sid]
+                return None
+            self._data.move_to_end(sid)
+            return json.loads(item[0]), item[1]
+
+    async def aload(self, sid):
+        return self.load(sid)
+
+    def save(self, sid, data, expires_at):
+        with self._lock:
+            self._data[sid] = (json.dumps(data), expires_at)
+            self._data.move_to_end(sid)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def delete(self, sid):
+        with self._lock:
+            self._data.pop(sid, None)
+
+    def revoke_client(self, client_id):
+        with self._lock:
+            sids = [sid for sid, (raw, _) in self._data.items() if json.loads(raw).get('client_id') == client_id]
+            for sid in sids:
+                del self._data[sid]
+        return len(sids)
+
+    def sweep(self):
+        now = time.time()
+        with self._lock:
+            expired = [sid for sid, (_, expires_at) in self._data.items() if expires_at <= now]
+            for sid in expired:
+                del self._data[sid]
+        return len(expired)
+
+
+class PostgresStore:
+    """Сессии в UNLOGGED-таблице kurs_2.sessions."""
+
+    def load(self, sid):
+        import db
+
+        with db.get_connection() as conn:
+            with conn.cursor() as cursor:
+                cursor.execute("""
+                    SELECT data, extract(epoch FROM expires_at)::float8 FROM kurs_2.sessions
+                    WHERE sid = %s AND expires_at > now();
+                """, (sid,))
+                return cursor.fetchone()
+
+    async def aload(self, sid):
+        import db
+
+        async with db.get_async_connection() as conn:
+            async with conn.cursor() as cursor:
+                await cursor.execute("""
+                    SELECT data, extract(epoch FROM expires_at)::float8 FROM kurs_2.sessions
+                    WHERE sid = %s AND expires_at > now();
+                """, (sid,))
+                return await cursor.fetchone()
+
+    def save(self, sid, data, expires_at):
+        import db
+
+        with db.get_connection() as conn:
+            with conn.cursor() as cursor:
+                cursor.execute("""
+                    INSERT INTO kurs_2.sessions (sid, client_id, data, expires_at)
+                    VALUES (%s, %s, %s, to_timestamp(%s))
+                    ON CONFLICT (sid) DO UPDATE
+                        SET client_id = EXCLUDED.client_id, data = EXCLUDED.data, expires_at = EXCLUDED.expires_at;
+                """, (sid, data.get('client_id'), json.dumps(data), expires_at))
+
+    def delete(self, sid):
+        import db
+
+        with db.get_connection() as conn:
+            with conn.cursor() as cursor:
+                cursor.execute("DELETE FROM kurs_2.sessions WHERE sid = %s;", (sid,))
+
+    def revoke_client(self, client_id):
+        import db
+
+        with db.get_connection() as conn:
+            with conn.cursor() as cursor:
+                cursor.execute("DELETE FROM kurs_2.sessions WHERE client_id = %s;", (client_id,))
+                return cursor.rowcount
+
+    def sweep(self):
+        """Удаляет просроченные сессии пачками по sweep_batch, каждую в своей транзакции."""
+        import db
+
+        total = 0
+        while True:
+            with db.get_connection() as conn:
+                with conn.cursor() as cursor:
+                    cursor.execute("""
+                        DELETE FROM kurs_2.sessions WHERE sid = ANY(ARRAY(
+                            SELECT sid FROM kurs_2.sessions WHERE expires_at < now()
+                            LIMIT %s FOR UPDATE SKIP LOCKED));
+                    """, (SESSION_CONFIG['sweep_batch'],))
+                    deleted = cursor.rowcount
+            total += deleted
+            if deleted < SESSION_CONFIG['sweep_batch']:
+                return total
+
+
+STORES = {
+    'memory': lambda: MemoryStore(SESSION_CONFIG['maxsize']),
+    'postgres': PostgresStore,
+}
+
+store = None
+
+
+def parse_cookie(value):
+    """Значение cookie -> (sid или None, есть ли ожидающие flash-сообщения)."""
+    has_flashes = value.endswith(FLASHES_SUFFIX)
+    sid = value[:-len(FLASHES_SUFFIX)] if has_flashes else value
+    return (sid if SID_RE.match(sid) else None), has_flashes
+
+
+async def load_async(cookie_value):
+    """Данные сессии для асинхронных маршрутов (asgi.py), только чтение; {} без сессии."""
+    sid, _ = parse_cookie(cookie_value or '')
+    record = await store.aload(sid) if sid else None
+    return record[0] if record else {}
+
+
+class ServerSessionInterface(SessionInterface):
+
+    def open_session(self, app, request):
+        sid, has_flashes = parse_cookie(request.cookies.get(self.get_cookie_name(app), ''))
+        if sid is None:
+            return ServerSession(store)
+        return ServerSession(store, sid, has_flashes)
+
+    def save_session(self, app, session, response):
+        if not session.loaded:
+            return
+        name = self.get_cookie_name(app)
+        domain = self.get_cookie_domain(app)
+        path = self.get_cookie_path(app)
+        if session.accessed:
+            response.vary.add('Cookie')
+
+        if session.rotate and session.sid:
+            store.delete(session.sid)
+            session.sid = None
+        if not session:
+            # Пустая сессия не хранится: например, после выхода остались только показанные сообщения
+            if session.sid:
+                store.delete(session.sid)
+            if session.sid or session.rotate:
+                response.delete_cookie(name, domain=domain, path=path)
+            return
+
+        lifetime = app.permanent_session_lifetime.total_seconds()
+        now = time.time()
+        # Срок продлевается не на каждом запросе, а когда прошла половина
+        touch = session.expires_at is None or session.expires_at - now < lifetime / 2
+        if not (session.modified or touch or session.sid is None):
+            return
+        if session.sid is None:
+            session.sid = new_sid()
+        store.save(session.sid, dict(session), now + lifetime)
+
+        value = session.sid + (FLASHES_SUFFIX if '_flashes' in session else '')
+        response.set_cookie(
+            name, value,
+            expires=self.get_expiration_time(app, session),
+            httponly=self.get_cookie_httponly(app),
+            domain=domain,
+            path=path,
+            secure=self.get_cookie_secure(app),
+            samesite=self.get_cookie_samesite(app),
+        )
+
+
+def revoke_client(client_id):
+    """Завершает все сессии клиента (смена пароля, «выйти везде»); возвращает их число."""
+    return store.revoke_client(client_id)
+
+
+_thread = None
+
+
+def _sweep_forever():
+    while True:
+        time.sleep(SESSION_CONFIG['sweep_interval'])
+        try:
+            store.sweep()
+        except Exception:
+            logger.exception("Не удалось удалить просроченные сессии")
+
+
+def start():
+    """Фоновая чистка просроченных сессий в этом процессе."""
+    global _thread
+    if _thread is None or not _thread.is_alive():
+        _thread = threading.Thread(target=_sweep_forever, name='session-sweeper', daemon=True)
+        _thread.start()
+
+
+def init_app(app):
+    """Подменяет cookie-сессии Flask серверными; настройки из app.config['SESSION_STORE']."""
+    global store
+    SESSION_CONFIG.update(app.config.get('SESSION_STORE', {}))
+    store = STORES[SESSION_CONFIG['backend']]()
+    app.session_interface = ServerSessionInterface()
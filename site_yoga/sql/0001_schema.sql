@@ -0,0 +1,51 @@
+-- Базовая схема kurs_2, восстановленная по запросам в db.py.
+-- Следующие миграции каталога sql/ добавляют к ней ограничения, индексы и таблицы.
+CREATE SCHEMA IF NOT EXISTS kurs_2;
+
+CREATE TABLE IF NOT EXISTS kurs_2.client_auth (
+    id        serial PRIMARY KEY,
+    full_name text NOT NULL,
+    phone     text NOT NULL,
+    password  text NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS kurs_2.clients (
+    id        serial PRIMARY KEY,
+    full_name text NOT NULL,
+    phone     text NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS kurs_2.employees (
+    id             serial PRIMARY KEY,
+    full_name      text NOT NULL,
+    phone          text NOT NULL,
+    specialization text NOT NULL,
+    passport       text NOT NULL,
+    birthday       text NOT NULL,
+    photo          text,
+    description    text
+);
+
+CREATE TABLE IF NOT EXISTS kurs_2.price_list (
+    id              serial PRIMARY KEY,
+    membership_type text NOT NULL,
+    price           integer NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS kurs_2.schedule (
+    id              serial PRIMARY KEY,
+    day_of_week     text NOT NULL,
+    start_time      time NOT NULL,
+    duration        integer NOT NULL,
+    specialization  text NOT NULL,
+    instructor_name text NOT NULL,
+    free_spots      integer NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS kurs_2.registrations (
+    id          serial PRIMARY KEY,
+    client_id   integer NOT NULL,
+    schedule_id integer NOT NULL REFERENCES kurs_2.schedule (id) ON DELETE CASCADE,
+    date_class  date NOT NULL,
+    attended    boolean
+);
@@ -0,0 +1,5 @@
+-- Одна запись клиента на занятие в конкретную дату.
+-- Нужна для идемпотентной записи в db.book_schedule_spots (ON CONFLICT).
+ALTER TABLE kurs_2.registrations
+    ADD CONSTRAINT registrations_client_schedule_date_key
+    UNIQUE (client_id, schedule_id, date_class);
@@ -0,0 +1,23 @@
+-- Индексы для поиска клиентов и тренеров (db.search_clients / db.search_employees).
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
+
+-- Поиск по вхождению подстроки в ФИО и телефон (запросы от 3 символов)
+CREATE INDEX IF NOT EXISTS clients_full_name_trgm_idx
+    ON kurs_2.clients USING gin (lower(full_name) gin_trgm_ops);
+CREATE INDEX IF NOT EXISTS clients_phone_trgm_idx
+    ON kurs_2.clients USING gin (phone gin_trgm_ops);
+CREATE INDEX IF NOT EXISTS employees_full_name_trgm_idx
+    ON kurs_2.employees USING gin (lower(full_name) gin_trgm_ops);
+CREATE INDEX IF NOT EXISTS employees_phone_trgm_idx
+    ON kurs_2.employees USING gin (phone gin_trgm_ops);
+
+-- Поиск по началу ФИО (короткие запросы)
+CREATE INDEX IF NOT EXISTS clients_full_name_prefix_idx
+    ON kurs_2.clients (lower(full_name) text_pattern_ops);
+CREATE INDEX IF NOT EXISTS employees_full_name_prefix_idx
+    ON kurs_2.employees (lower(full_name) text_pattern_ops);
+
+-- Проверка существования клиента по ФИО (forms.ClientFormChanges)
+-- и постраничный вывод клиентов в порядке (full_name, id)
+CREATE INDEX IF NOT EXISTS clients_full_name_id_idx
+    ON kurs_2.clients (full_name, id);
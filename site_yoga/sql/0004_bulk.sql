@@ -0,0 +1,7 @@
+-- Уникальные ключи, по которым массовый импорт (bulk.py) обновляет существующие строки.
+ALTER TABLE kurs_2.clients
+    ADD CONSTRAINT clients_phone_key UNIQUE (phone);
+ALTER TABLE kurs_2.employees
+    ADD CONSTRAINT employees_passport_key UNIQUE (passport);
+ALTER TABLE kurs_2.schedule
+    ADD CONSTRAINT schedule_day_time_instructor_key UNIQUE (day_of_week, start_time, instructor_name);
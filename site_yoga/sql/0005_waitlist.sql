@@ -0,0 +1,23 @@
+-- Лист ожидания на занятия (db.enqueue_waitlist, db.promote_waitlist, waitlist.py).
+-- Строки не удаляются: после перевода в записи статус меняется на 'promoted',
+-- при выходе из очереди — на 'cancelled'. Все индексы частичные, поэтому
+-- обработанные строки не замедляют работу с активной очередью.
+CREATE TABLE IF NOT EXISTS kurs_2.waitlist (
+    id          bigserial PRIMARY KEY,
+    client_id   integer NOT NULL,
+    schedule_id integer NOT NULL REFERENCES kurs_2.schedule (id) ON DELETE CASCADE,
+    date_class  date NOT NULL,
+    status      text NOT NULL DEFAULT 'waiting'
+                CHECK (status IN ('waiting', 'promoted', 'cancelled')),
+    created_at  timestamptz NOT NULL DEFAULT now(),
+    promoted_at timestamptz
+);
+
+-- Клиент стоит в очереди на занятие в конкретную дату не больше одного раза
+CREATE UNIQUE INDEX IF NOT EXISTS waitlist_waiting_key
+    ON kurs_2.waitlist (client_id, schedule_id, date_class) WHERE status = 'waiting';
+
+-- Очередь занятия в порядке FIFO: выборка партии для перевода,
+-- место в очереди (count по индексу) и проверка "есть ли ожидающие" при записи
+CREATE INDEX IF NOT EXISTS waitlist_schedule_fifo_idx
+    ON kurs_2.waitlist (schedule_id, id) WHERE status = 'waiting';
@@ -0,0 +1,7 @@
+-- Счётчики изменений таблиц для ETag/Last-Modified (cache.publish, httpcache.py).
+-- Строка появляется при первой записи в таблицу через db.py.
+CREATE TABLE IF NOT EXISTS kurs_2.table_versions (
+    table_name text PRIMARY KEY,
+    version    bigint NOT NULL DEFAULT 1,
+    changed_at timestamptz NOT NULL DEFAULT now()
+);
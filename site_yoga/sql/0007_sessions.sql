@@ -0,0 +1,17 @@
+-- Серверные сессии (sessions.py, backend 'postgres').
+-- UNLOGGED: запись не идёт в WAL, поэтому сохранение сессии дешевле; после
+-- аварийного перезапуска PostgreSQL таблица очищается и клиенты входят заново.
+CREATE UNLOGGED TABLE IF NOT EXISTS kurs_2.sessions (
+    sid        text PRIMARY KEY,
+    client_id  integer,
+    data       jsonb NOT NULL,
+    expires_at timestamptz NOT NULL
+);
+
+-- Завершение всех сессий клиента (sessions.revoke_client)
+CREATE INDEX IF NOT EXISTS sessions_client_idx
+    ON kurs_2.sessions (client_id) WHERE client_id IS NOT NULL;
+
+-- Чистка просроченных пачками
+CREATE INDEX IF NOT EXISTS sessions_expires_idx
+    ON kurs_2.sessions (expires_at);
@@ -0,0 +1,141 @@
+-- Агрегаты личного кабинета (db.get_client_dashboard, db.get_client_history_page).
+-- Счётчики по месяцам, неделям и тренерам обновляются триггерами на
+-- kurs_2.registrations: каждый оператор записи применяет к ним только свою
+-- разницу (переходные таблицы), поэтому кабинет читает несколько коротких
+-- строк, сколько бы лет истории ни было у клиента.
+-- "Посещено" — attended IS TRUE; classes считает все записи.
+CREATE TABLE IF NOT EXISTS kurs_2.client_stats (
+    client_id integer PRIMARY KEY,
+    classes   integer NOT NULL DEFAULT 0,
+    attended  integer NOT NULL DEFAULT 0
+);
+
+CREATE TABLE IF NOT EXISTS kurs_2.client_monthly_stats (
+    client_id integer NOT NULL,
+    month     date NOT NULL,
+    classes   integer NOT NULL DEFAULT 0,
+    attended  integer NOT NULL DEFAULT 0,
+    PRIMARY KEY (client_id, month)
+);
+
+-- Недели с посещениями: из них считается серия недель подряд
+CREATE TABLE IF NOT EXISTS kurs_2.client_weekly_stats (
+    client_id integer NOT NULL,
+    week      date NOT NULL,
+    attended  integer NOT NULL DEFAULT 0,
+    PRIMARY KEY (client_id, week)
+);
+
+CREATE TABLE IF NOT EXISTS kurs_2.client_instructor_stats (
+    client_id       integer NOT NULL,
+    instructor_name text NOT NULL,
+    attended        integer NOT NULL DEFAULT 0,
+    PRIMARY KEY (client_id, instructor_name)
+);
+
+-- История посещений постранично: (date_class, id) по убыванию внутри клиента
+CREATE INDEX IF NOT EXISTS registrations_client_history_idx
+    ON kurs_2.registrations (client_id, date_class DESC, id DESC);
+
+DO $$
+BEGIN
+    CREATE TYPE kurs_2.registration_delta AS (
+        client_id   integer,
+        schedule_id integer,
+        date_class  date,
+        attended    boolean,
+        sign        integer
+    );
+EXCEPTION WHEN duplicate_object THEN NULL;
+END $$;
+
+-- Прибавляет (sign = 1) или вычитает (sign = -1) строки регистраций из агрегатов.
+-- Тренер берётся из текущего расписания: если занятие уже удалено, счётчик
+-- тренера не уменьшается (kurs_2.rebuild_client_stats пересчитает его заново).
+CREATE OR REPLACE FUNCTION kurs_2.apply_registration_delta(delta kurs_2.registration_delta[])
+RETURNS void LANGUAGE sql AS $$
+    INSERT INTO kurs_2.client_stats AS t (client_id, classes, attended)
+    SELECT d.client_id, sum(d.sign), coalesce(sum(d.sign) FILTER (WHERE d.attended), 0)
+    FROM unnest(delta) d
+    GROUP BY d.client_id
+    ON CONFLICT (client_id) DO UPDATE
+        SET classes = t.classes + EXCLUDED.classes, attended = t.attended + EXCLUDED.attended;
+
+    INSERT INTO kurs_2.client_monthly_stats AS t (client_id, month, classes, attended)
+    SELECT d.client_id, date_trunc('month', d.date_class)::date,
+           sum(d.sign), coalesce(sum(d.sign) FILTER (WHERE d.attended), 0)
+    FROM unnest(delta) d
+    GROUP BY 1, 2
+    ON CONFLICT (client_id, month) DO UPDATE
+        SET classes = t.classes + EXCLUDED.classes, attended = t.attended + EXCLUDED.attended;
+
+    INSERT INTO kurs_2.client_weekly_stats AS t (client_id, week, attended)
+    SELECT d.client_id, date_trunc('week', d.date_class)::date, sum(d.sign)
+    FROM unnest(delta) d
+    WHERE d.attended
+    GROUP BY 1, 2
+    ON CONFLICT (client_id, week) DO UPDATE SET attended = t.attended + EXCLUDED.attended;
+
+    INSERT INTO kurs_2.client_instructor_stats AS t (client_id, instructor_name, attended)
+    SELECT d.client_id, s.instructor_name, sum(d.sign)
+    FROM unnest(delta) d
+    JOIN kurs_2.schedule s ON s.id = d.schedule_id
+    WHERE d.attended
+    GROUP BY 1, 2
+    ON CONFLICT (client_id, instructor_name) DO UPDATE SET attended = t.attended + EXCLUDED.attended;
+$$;
+
+CREATE OR REPLACE FUNCTION kurs_2.registrations_stats_trigger()
+RETURNS trigger LANGUAGE plpgsql AS $$
+BEGIN
+    IF TG_OP IN ('UPDATE', 'DELETE') THEN
+        PERFORM kurs_2.apply_registration_delta(ARRAY(
+            SELECT ROW(client_id, schedule_id, date_class, attended, -1)::kurs_2.registration_delta
+            FROM old_rows));
+    END IF;
+    IF TG_OP IN ('UPDATE', 'INSERT') THEN
+        PERFORM kurs_2.apply_registration_delta(ARRAY(
+            SELECT ROW(client_id, schedule_id, date_class, attended, 1)::kurs_2.registration_delta
+            FROM new_rows));
+    END IF;
+    RETURN NULL;
+END $$;
+
+-- Полный пересчёт: первичное заполнение и исправление расхождений
+CREATE OR REPLACE FUNCTION kurs_2.rebuild_client_stats()
+RETURNS void LANGUAGE sql AS $$
+    TRUNCATE kurs_2.client_stats, kurs_2.client_monthly_stats,
+             kurs_2.client_weekly_stats, kurs_2.client_instructor_stats;
+    SELECT kurs_2.apply_registration_delta(ARRAY(
+        SELECT ROW(client_id, schedule_id, date_class, attended, 1)::kurs_2.registration_delta
+        FROM kurs_2.registrations));
+$$;
+
+CREATE OR REPLACE FUNCTION kurs_2.registrations_truncate_trigger()
+RETURNS trigger LANGUAGE plpgsql AS $$
+BEGIN
+    TRUNCATE kurs_2.client_stats, kurs_2.client_monthly_stats,
+             kurs_2.client_weekly_stats, kurs_2.client_instructor_stats;
+    RETURN NULL;
+END $$;
+
+DROP TRIGGER IF EXISTS registrations_stats_insert ON kurs_2.registrations;
+CREATE TRIGGER registrations_stats_insert AFTER INSERT ON kurs_2.registrations
+    REFERENCING NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION kurs_2.registrations_stats_trigger();
+
+DROP TRIGGER IF EXISTS registrations_stats_update ON kurs_2.registrations;
+CREATE TRIGGER registrations_stats_update AFTER UPDATE ON kurs_2.registrations
+    REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION kurs_2.registrations_stats_trigger();
+
+DROP TRIGGER IF EXISTS registrations_stats_delete ON kurs_2.registrations;
+CREATE TRIGGER registrations_stats_delete AFTER DELETE ON kurs_2.registrations
+    REFERENCING OLD TABLE AS old_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION kurs_2.registrations_stats_trigger();
+
+DROP TRIGGER IF EXISTS registrations_stats_truncate ON kurs_2.registrations;
+CREATE TRIGGER registrations_stats_truncate AFTER TRUNCATE ON kurs_2.registrations
+    FOR EACH STATEMENT EXECUTE FUNCTION kurs_2.registrations_truncate_trigger();
+
+SELECT kurs_2.rebuild_client_stats();
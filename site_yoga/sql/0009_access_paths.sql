@@ -0,0 +1,31 @@
+-- Индексы и ограничения под запросы db.py, которые ещё не были покрыты.
+-- Что проверяется на плане запроса — см. bench/plans.py.
+
+-- Вход, восстановление пароля и проверка занятости номера (get_client_by_phone,
+-- check_phone_exists, update_password): один аккаунт на номер
+CREATE UNIQUE INDEX IF NOT EXISTS client_auth_phone_key
+    ON kurs_2.client_auth (phone);
+
+-- Смена цены по названию абонемента (update_ticket_price)
+CREATE UNIQUE INDEX IF NOT EXISTS price_list_membership_type_key
+    ON kurs_2.price_list (membership_type);
+
+-- Расписание по порядку дней недели (get_schedule, get_schedule_page):
+-- выражение совпадает с db.DAY_NUMBER_SQL, поэтому планировщик берёт
+-- строки из индекса уже отсортированными и не вычисляет CASE для каждой строки
+CREATE INDEX IF NOT EXISTS schedule_day_number_idx
+    ON kurs_2.schedule ((
+        CASE day_of_week
+            WHEN 'Пн' THEN 1
+            WHEN 'Вт' THEN 2
+            WHEN 'Ср' THEN 3
+            WHEN 'Чт' THEN 4
+            WHEN 'Пт' THEN 5
+            WHEN 'Сб' THEN 6
+            WHEN 'Вс' THEN 7
+        END), start_time, id);
+
+-- Удаление занятия каскадом удаляет его регистрации: без индекса по
+-- schedule_id каждое удаление просматривает всю таблицу registrations
+CREATE INDEX IF NOT EXISTS registrations_schedule_idx
+    ON kurs_2.registrations (schedule_id);
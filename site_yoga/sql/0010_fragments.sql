@@ -0,0 +1,8 @@
+-- Общий для воркеров кэш фрагментов шаблонов (fragments.py, shared = True).
+-- Одна строка на фрагмент: новая версия перезаписывает старую. UNLOGGED —
+-- содержимое восстанавливается рендером, WAL для него не нужен.
+CREATE UNLOGGED TABLE IF NOT EXISTS kurs_2.fragments (
+    name     text PRIMARY KEY,
+    versions text NOT NULL,
+    html     text NOT NULL
+);
@@ -0,0 +1,56 @@
+-- Изменённые строки расписания — в канал yoga_schedule (schedule_index.py).
+-- Уведомление несёт сами строки, поэтому воркеры обновляют индекс в памяти,
+-- не перечитывая таблицу. Пакет, который не помещается в уведомление
+-- (предел pg_notify — 8000 байт), и TRUNCATE превращаются в {"reload": true}.
+CREATE OR REPLACE FUNCTION kurs_2.schedule_changes_trigger()
+RETURNS trigger LANGUAGE plpgsql AS $$
+DECLARE
+    upserted json := '[]';
+    deleted  json := '[]';
+    payload  text;
+BEGIN
+    IF TG_OP IN ('UPDATE', 'INSERT') THEN
+        SELECT coalesce(json_agg(n), '[]') INTO upserted FROM new_rows n;
+    END IF;
+    IF TG_OP = 'DELETE' THEN
+        SELECT coalesce(json_agg(id), '[]') INTO deleted FROM old_rows;
+    ELSIF TG_OP = 'UPDATE' THEN
+        SELECT coalesce(json_agg(id), '[]') INTO deleted
+        FROM (SELECT id FROM old_rows EXCEPT SELECT id FROM new_rows) gone;
+    END IF;
+    IF upserted::text = '[]' AND deleted::text = '[]' THEN
+        RETURN NULL;  -- оператор не затронул ни одной строки
+    END IF;
+    payload := json_build_object('upsert', upserted, 'delete', deleted)::text;
+    IF octet_length(payload) > 7900 THEN
+        payload := '{"reload": true}';
+    END IF;
+    PERFORM pg_notify('yoga_schedule', payload);
+    RETURN NULL;
+END $$;
+
+CREATE OR REPLACE FUNCTION kurs_2.schedule_truncate_trigger()
+RETURNS trigger LANGUAGE plpgsql AS $$
+BEGIN
+    PERFORM pg_notify('yoga_schedule', '{"reload": true}');
+    RETURN NULL;
+END $$;
+
+DROP TRIGGER IF EXISTS schedule_changes_insert ON kurs_2.schedule;
+CREATE TRIGGER schedule_changes_insert AFTER INSERT ON kurs_2.schedule
+    REFERENCING NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION kurs_2.schedule_changes_trigger();
+
+DROP TRIGGER IF EXISTS schedule_changes_update ON kurs_2.schedule;
+CREATE TRIGGER schedule_changes_update AFTER UPDATE ON kurs_2.schedule
+    REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION kurs_2.schedule_changes_trigger();
+
+DROP TRIGGER IF EXISTS schedule_changes_delete ON kurs_2.schedule;
+CREATE TRIGGER schedule_changes_delete AFTER DELETE ON kurs_2.schedule
+    REFERENCING OLD TABLE AS old_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION kurs_2.schedule_changes_trigger();
+
+DROP TRIGGER IF EXISTS schedule_changes_truncate ON kurs_2.schedule;
+CREATE TRIGGER schedule_changes_truncate AFTER TRUNCATE ON kurs_2.schedule
+    FOR EACH STATEMENT EXECUTE FUNCTION kurs_2.schedule_truncate_trigger();
@@ -0,0 +1,14 @@
+-- Просроченные строки листа ожидания (db.expire_waitlist, waitlist.py).
+-- Очередь ведётся на конкретную дату занятия; когда дата прошла, строка
+-- 'waiting' не должна ни мешать записи на следующее занятие, ни переводиться
+-- в регистрацию на прошедшую дату. Такие строки получают статус 'expired'.
+ALTER TABLE kurs_2.waitlist DROP CONSTRAINT IF EXISTS waitlist_status_check;
+ALTER TABLE kurs_2.waitlist ADD CONSTRAINT waitlist_status_check
+    CHECK (status IN ('waiting', 'promoted', 'cancelled', 'expired'));
+
+-- Поиск просроченных ожидающих без чтения обработанных строк
+CREATE INDEX IF NOT EXISTS waitlist_waiting_date_idx
+    ON kurs_2.waitlist (date_class) WHERE status = 'waiting';
+
+UPDATE kurs_2.waitlist SET status = 'expired'
+WHERE status = 'waiting' AND date_class < current_date;
@@ -0,0 +1,86 @@
+"""Замер запуска воркера: что импортируется, сколько времени и памяти это стоит.
+
+    flask startup imports --top 25        # отчёт в духе python -X importtime
+    flask startup measure --repeat 5      # время импорта + create_app и RSS
+    flask startup measure --eager openai  # сколько стоила бы зависимость, загруженная сразу
+
+Замер идёт в отдельном чистом интерпретаторе, с DEFER_BACKGROUND, чтобы
+фоновые потоки не ходили в БД.
+"""
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+import click
+
+PROBE = """
+import json, resource, sys, time
+started = time.perf_counter()
+%s
+import app
+app.create_app({'DEFER_BACKGROUND': True})
+print(json.dumps({'seconds': time.perf_counter() - started,
+                  'max_rss_kb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+                  'modules': len(sys.modules)}))
+"""
+
+
+def _run_probe(root, eager=(), importtime=False):
+    code = PROBE % '\n'.join('import %s' % name for name in eager)
+    command = [sys.executable] + (['-X', 'importtime'] if importtime else []) + ['-c', code]
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, [root, os.environ.get('PYTHONPATH')])))
+    result = subprocess.run(command, cwd=root, env=env, capture_output=True, text=True, check=True)
+    return json.loads(result.stdout.strip().splitlines()[-1]), result.stderr
+
+
+def parse_importtime(stderr):
+    """Строки -X importtime -> [(модуль, собственное время мкс, суммарное мкс, глубина)]."""
+    rows = []
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|')
+        depth = (len(name) - len(name.lstrip(' '))) // 2
+        rows.append((name.strip(), int(self_us), int(cumulative_us), depth))
+    return rows
+
+
+def measure(root, repeat=5, eager=()):
+    """Медиана времени запуска и максимальный RSS по repeat запускам."""
+    runs = [_run_probe(root, eager)[0] for _ in range(repeat)]
+    return {
+        'startup_ms': round(statistics.median(run['seconds'] for run in runs) * 1000, 1),
+        'max_rss_mb': round(max(run['max_rss_kb'] for run in runs) / 1024, 1),
+        'modules': runs[-1]['modules'],
+        'eager': list(eager),
+    }
+
+
+def init_app(app):
+    """Регистрирует команды flask startup imports / measure."""
+
+    @app.cli.group('startup')
+    def startup_group():
+        """Профиль запуска воркера."""
+
+    @startup_group.command('imports')
+    @click.option('--top', default=25, help='Сколько самых дорогих модулей показать.')
+    @click.option('--eager', multiple=True, help='Дополнительно импортировать модуль (можно несколько раз).')
+    def imports_command(top, eager):
+        """Самые дорогие импорты по суммарному времени."""
+        summary, stderr = _run_probe(app.root_path, eager, importtime=True)
+        rows = parse_importtime(stderr)
+        click.echo("%10s %10s  %s" % ('total, ms', 'self, ms', 'module'))
+        for name, self_us, cumulative_us, depth in sorted(rows, key=lambda row: -row[2])[:top]:
+            click.echo("%10.1f %10.1f  %s%s" % (cumulative_us / 1000, self_us / 1000, '  ' * depth, name))
+        click.echo("Модулей: %d, запуск: %.0f мс, RSS: %.1f МБ" % (
+            summary['modules'], summary['seconds'] * 1000, summary['max_rss_kb'] / 1024))
+
+    @startup_group.command('measure')
+    @click.option('--repeat', default=5)
+    @click.option('--eager', multiple=True, help='Дополнительно импортировать модуль (можно несколько раз).')
+    def measure_command(repeat, eager):
+        """Время запуска и память одного воркера (JSON)."""
+        click.echo(json.dumps(measure(app.root_path, repeat, eager), ensure_ascii=False))
@@ -0,0 +1,61 @@
+// Подсказки для полей с атрибутом data-typeahead-url (см. forms.TypeaheadInput).
+// Запрос уходит через 150 мс после последнего нажатия, устаревшие запросы отменяются.
+document.addEventListener("DOMContentLoaded", function () {
+    document.querySelectorAll("input[data-typeahead-url]").forEach(function (input) {
+        let url = input.dataset.typeaheadUrl;
+        let fill = (input.dataset.typeaheadFill || "").split(",").filter(Boolean);
+        let suggestionsBox = document.createElement("div");
+        suggestionsBox.classList.add("list-group", "position-absolute", "w-100");
+        input.insertAdjacentElement("afterend", suggestionsBox);
+
+        let timer = null;
+        let controller = null;
+
+        input.addEventListener("input", function () {
+            clearTimeout(timer);
+            let query = input.value.trim();
+            if (query.length < 1) {
+                suggestionsBox.innerHTML = "";
+                return;
+            }
+            timer = setTimeout(function () {
+                if (controller) {
+                    controller.abort();
+                }
+                controller = new AbortController();
+                fetch(`${url}?q=${encodeURIComponent(query)}&limit=10`, {signal: controller.signal})
+                    .then(response => response.json())
+                    .then(data => {
+                        suggestionsBox.innerHTML = "";
+                        data.forEach(row => {
+                            let item = document.createElement("div");
+                            item.classList.add("list-group-item", "list-group-item-action");
+                            item.textContent = row.full_name;
+                            item.addEventListener("click", function () {
+                                input.value = row.full_name;
+                                fill.forEach(name => {
+                                    let target = input.form.elements[name];
+                                    if (target) {
+                                        target.value = row[name];
+                                    }
+                                });
+                                suggestionsBox.innerHTML = "";
+                            });
+                            suggestionsBox.appendChild(item);
+                        });
+                    })
+                    .catch(error => {
+                        if (error.name !== "AbortError") {
+                            console.error("Ошибка:", error);
+                        }
+                    });
+            }, 150);
+        });
+
+        document.addEventListener("click", function (e) {
+            if (!suggestionsBox.contains(e.target) && e.target !== input) {
+                suggestionsBox.innerHTML = "";
+            }
+        });
+    });
+});
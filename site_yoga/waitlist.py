@@ -0,0 +1,86 @@
+"""Фоновый перевод клиентов из листа ожидания в записи.
+
+Очередь хранится в kurs_2.waitlist (sql/0005_waitlist.sql), сама запись на
+занятие её не разбирает и остаётся одним коротким запросом. Когда места
+освобождаются (update_free_spots, отмена записи), в канал yoga_spots уходит
+уведомление; поток этого модуля просыпается и переводит ожидающих партиями
+в порядке очереди. На случай потерянных уведомлений очереди дополнительно
+проверяются раз в interval секунд. Ожидающие на прошедшие даты при каждой
+проверке получают статус 'expired'.
+
+Поток запускается в каждом воркере: строки расписания блокируются при
+переводе, так что воркеры не выдадут одно место дважды.
+"""
+import json
+import logging
+import threading
+
+import listener
+import live
+
+logger = logging.getLogger(__name__)
+
+# Настройки; переопределяются через app.config['WAITLIST'] в init_app
+WAITLIST_CONFIG = {
+    'enabled': True,
+    'batch': 100,       # ожидающих за один запрос
+    'interval': 30,     # секунд между проверками без уведомлений
+}
+
+_wakeup = threading.Event()
+_thread = None
+
+
+def wake():
+    """Просит поток проверить очереди, не дожидаясь интервала."""
+    _wakeup.set()
+
+
+def promote_all():
+    """Разбирает очереди всех занятий со свободными местами; возвращает число обработанных."""
+    import db
+
+    # Очереди на прошедшие даты закрываются до перевода
+    db.expire_waitlist()
+    total = 0
+    for schedule_id in db.waitlisted_schedules():
+        while True:
+            promoted = db.promote_waitlist(schedule_id, WAITLIST_CONFIG['batch'])
+            total += promoted
+            if promoted < WAITLIST_CONFIG['batch']:
+                break
+    return total
+
+
+def _run():
+    while True:
+        _wakeup.wait(WAITLIST_CONFIG['interval'])
+        _wakeup.clear()
+        try:
+            promote_all()
+        except Exception:
+            logger.exception("Не удалось перевести клиентов из листа ожидания")
+
+
+def _on_spots(payload):
+    # Будим поток, только если где-то появились свободные места
+    if any(free_spots > 0 for free_spots in json.loads(payload).values()):
+        wake()
+
+
+listener.on_notify(live.NOTIFY_CHANNEL, _on_spots)
+# Пока слушатель не работал, уведомления об освободившихся местах могли потеряться
+listener.on_reconnect(wake)
+
+
+def start():
+    """Запускает поток в этом процессе (в каждом воркере, после fork)."""
+    global _thread
+    if _thread is None or not _thread.is_alive():
+        _thread = threading.Thread(target=_run, name='waitlist-promoter', daemon=True)
+        _thread.start()
+
+
+def init_app(app):
+    """Берёт настройки из app.config; поток запускает app.start_background."""
+    WAITLIST_CONFIG.update(app.config.get('WAITLIST', {}))